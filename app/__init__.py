@@ -5,9 +5,15 @@ This module provides the Flask application factory pattern for the Shariaa Contr
 """
 
 import os
+import queue
+import atexit
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from flask import Flask, request, g
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+_log_listener = None
 
 
 def create_app(config_name='default'):
@@ -22,6 +28,13 @@ def create_app(config_name='default'):
     """
     app = Flask(__name__)
 
+    # Large uploads are parsed straight into the processing folder instead of an anonymous spool file
+    from app.utils.file_helpers import DiskUploadRequest
+    app.request_class = DiskUploadRequest
+
+    from app.utils.json_utils import OrjsonProvider
+    app.json = OrjsonProvider(app)
+
     if config_name == 'testing':
         app.config.from_object('config.testing.TestingConfig')
     elif config_name == 'production':
@@ -37,22 +50,30 @@ def create_app(config_name='default'):
         else:
             logging.warning("Running with insecure default SECRET_KEY for development")
 
-    CORS(app, resources={r"/*": {"origins": "*"}})
+    # Browsers cache the preflight answer for max_age seconds instead of sending OPTIONS before every call
+    CORS(app, resources={r"/*": {"origins": "*"}}, max_age=app.config.get('CORS_MAX_AGE_SECONDS', 3600))
 
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
+    # Behind a TLS terminator the scheme comes from X-Forwarded-Proto, so request.is_secure is correct
+    trusted_proxy_count = app.config.get('TRUSTED_PROXY_COUNT', 0)
+    if trusted_proxy_count > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=trusted_proxy_count)
+
     configure_logging(app)
 
     register_trace_id_handler(app)
 
-    from app.services.database import init_db
-    init_db(app)
+    # Lazily, each service initializes itself from current_app on first use
+    if not app.config.get('LAZY_SERVICE_INIT', True):
+        from app.services.database import init_db
+        init_db(app)
 
-    from app.services.cloudinary_service import init_cloudinary
-    init_cloudinary(app)
+        from app.services.cloudinary_service import init_cloudinary
+        init_cloudinary(app)
 
-    from app.services.ai_service import init_ai_service
-    init_ai_service(app)
+        from app.services.ai_service import init_ai_service
+        init_ai_service(app)
 
     from app.routes.root import register_root_routes
     register_root_routes(app)
@@ -65,17 +86,38 @@ def create_app(config_name='default'):
 
 
 def configure_logging(app):
-    """Configure application logging with clean output."""
+    """
+    Configure application logging with clean output.
+    Request threads only enqueue records; a background listener does the formatting and stream writes.
+    """
+    global _log_listener
+    # No format string here uses thread, process or caller fields; skip collecting them for every record
+    # (see "Optimization" in the logging HOWTO)
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging._srcfile = None
     root_logger = logging.getLogger()
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
     
+    if _log_listener is not None:
+        _log_listener.stop()
+    
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(
+        '[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+    
     logging.basicConfig(
         level=logging.DEBUG if app.debug else logging.INFO,
-        format='[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S',
+        format='%(message)s',
         handlers=[
-            logging.StreamHandler()
+            QueueHandler(log_queue)
         ],
         force=True
     )
@@ -96,6 +138,15 @@ def configure_logging(app):
     logging.info(f"Debug Mode: {app.debug}")
 
 
+def _stop_log_listener():
+    """Flush queued log records on interpreter shutdown."""
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+atexit.register(_stop_log_listener)
+
+
 def register_trace_id_handler(app):
     """Register before/after request handlers for trace ID management."""
     from app.utils.logging_utils import set_trace_id, clear_trace_id, get_trace_id
@@ -116,6 +167,16 @@ def register_trace_id_handler(app):
         return response
 
 
+# Fixed part of each error response, built once; handlers only add the trace id (and a message for 400)
+_ERROR_TEMPLATES = {
+    400: {"status": "error", "error_type": "BAD_REQUEST", "message": "Bad request", "details": {}},
+    404: {"status": "error", "error_type": "NOT_FOUND", "message": "Resource not found", "details": {}},
+    413: {"status": "error", "error_type": "FILE_TOO_LARGE", "message": "File size exceeds maximum allowed (16MB)", "details": {}},
+    500: {"status": "error", "error_type": "INTERNAL_ERROR", "message": "An internal error occurred", "details": {}},
+    503: {"status": "error", "error_type": "SERVICE_UNAVAILABLE", "message": "Service temporarily unavailable", "details": {}},
+}
+
+
 def register_error_handlers(app):
     """Register global error handlers for consistent JSON responses."""
     from flask import jsonify
@@ -123,64 +184,40 @@ def register_error_handlers(app):
     
     logger = get_logger('app.error_handler')
     
+    def error_response(status_code: int, **overrides):
+        return jsonify({**_ERROR_TEMPLATES[status_code], **overrides, "trace_id": get_trace_id()}), status_code
+    
     @app.errorhandler(400)
     def bad_request(error):
-        logger.warning(f"Bad request: {error}")
-        return jsonify({
-            "status": "error",
-            "error_type": "BAD_REQUEST",
-            "message": str(error.description) if hasattr(error, 'description') else "Bad request",
-            "details": {},
-            "trace_id": get_trace_id()
-        }), 400
+        logger.warning("Bad request: %s", error)
+        if hasattr(error, 'description'):
+            return error_response(400, message=str(error.description))
+        return error_response(400)
     
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({
-            "status": "error",
-            "error_type": "NOT_FOUND",
-            "message": "Resource not found",
-            "details": {},
-            "trace_id": get_trace_id()
-        }), 404
+        return error_response(404)
     
     @app.errorhandler(413)
     def request_entity_too_large(error):
         logger.warning("File too large")
-        return jsonify({
-            "status": "error",
-            "error_type": "FILE_TOO_LARGE",
-            "message": "File size exceeds maximum allowed (16MB)",
-            "details": {},
-            "trace_id": get_trace_id()
-        }), 413
+        return error_response(413)
     
     @app.errorhandler(500)
     def internal_server_error(error):
-        logger.error(f"Internal server error: {error}")
-        return jsonify({
-            "status": "error",
-            "error_type": "INTERNAL_ERROR",
-            "message": "An internal error occurred",
-            "details": {},
-            "trace_id": get_trace_id()
-        }), 500
+        logger.error("Internal server error: %s", error)
+        return error_response(500)
     
     @app.errorhandler(503)
     def service_unavailable(error):
-        logger.error(f"Service unavailable: {error}")
-        return jsonify({
-            "status": "error",
-            "error_type": "SERVICE_UNAVAILABLE",
-            "message": "Service temporarily unavailable",
-            "details": {},
-            "trace_id": get_trace_id()
-        }), 503
+        logger.error("Service unavailable: %s", error)
+        return error_response(503)
 
 
 def register_blueprints(app):
     """Register application blueprints."""
-    from app.routes import analysis_bp
+    from app.routes import analysis_bp, register_analysis_routes
+    register_analysis_routes()
     from app.routes.generation import generation_bp
     from app.routes.interaction import interaction_bp
     from app.routes.admin import admin_bp
@@ -1,7 +1,8 @@
 """
 Routes Package
 
-Registers analysis blueprint and imports all route modules.
+Creates the analysis blueprint. Its route modules pull in the AI and document
+processing services, so they are imported only when the blueprint is registered.
 """
 
 from flask import Blueprint
@@ -9,8 +10,10 @@ from flask import Blueprint
 # Create the analysis blueprint
 analysis_bp = Blueprint('analysis', __name__)
 
-# Import all route modules to register their handlers
-from . import analysis_upload
-from . import analysis_terms  
-from . import analysis_session
-from . import analysis_admin
\ No newline at end of file
+
+def register_analysis_routes():
+    """Import the analysis route modules so their handlers attach to analysis_bp."""
+    from . import analysis_upload
+    from . import analysis_terms
+    from . import analysis_session
+    from . import analysis_admin
@@ -4,16 +4,21 @@ Admin Routes
 Administrative endpoints for rules management and request tracing.
 """
 
-import datetime
+import hmac
 import logging
 import os
-import json
-from flask import Blueprint, request, jsonify, send_file
+import time
+from flask import Blueprint, request, jsonify, send_file, current_app
+from app.utils.analysis_helpers import now_iso
+from app.utils import json_utils
+from app.utils.logging_utils import RequestTracer
 
 logger = logging.getLogger(__name__)
 admin_bp = Blueprint('admin', __name__)
 
-TRACES_DIR = "traces"
+TRACES_DIR = RequestTracer.TRACES_DIR
+# Created once here so the trace endpoints need no per-request existence check
+os.makedirs(TRACES_DIR, exist_ok=True)
 
 
 @admin_bp.route('/health', methods=['GET'])
@@ -22,7 +27,7 @@ def admin_health():
     return jsonify({
         "service": "Shariaa Analyzer Admin",
         "status": "healthy",
-        "timestamp": datetime.datetime.now().isoformat()
+        "timestamp": now_iso()
     }), 200
 
 
@@ -52,16 +57,86 @@ def delete_rule(rule_id):
 
 def check_debug_mode():
     """Check if debug/development mode is enabled for trace access."""
-    from flask import current_app
-    debug_enabled = current_app.config.get('DEBUG', False)
+    if current_app.config.get('DEBUG', False):
+        return True
+    
     trace_access_key = request.headers.get('X-Trace-Access-Key') or request.args.get('access_key')
     expected_key = current_app.config.get('TRACE_ACCESS_KEY')
-    
-    if debug_enabled:
-        return True
-    if expected_key and trace_access_key == expected_key:
-        return True
-    return False
+    if not expected_key or not trace_access_key:
+        return False
+    # Constant-time comparison, so response timing does not reveal how much of the key matched
+    return hmac.compare_digest(trace_access_key.encode('utf-8'), expected_key.encode('utf-8'))
+
+
+def _read_trace_index(index_path: str) -> tuple[list[dict], int]:
+    """
+    Summaries from the trace index; a trace saved more than once keeps its latest line.
+    Also returns the number of lines read, so callers can tell how much of the index is superseded.
+    """
+    entries = {}
+    line_count = 0
+    with open(index_path, 'rb') as f:
+        for line in f:
+            line_count += 1
+            try:
+                entry = json_utils.loads(line)
+            except json_utils.JSONDecodeError:
+                continue
+            if entry.get("filename"):
+                entries[entry["filename"]] = entry
+    return list(entries.values()), line_count
+
+
+def _index_entry(entry: os.DirEntry) -> dict:
+    try:
+        with open(entry.path, 'rb') as f:
+            trace_data = json_utils.loads(f.read())
+    except Exception:
+        trace_data = {}
+    return RequestTracer.build_index_entry(entry.name, trace_data, entry.stat())
+
+
+def _scan_traces(skip: set[str] = frozenset(), modified_since: float | None = None) -> list[dict]:
+    """
+    Summaries built by opening every trace not named in skip, plus those modified since
+    modified_since; used for traces the index does not (yet) cover.
+    """
+    trace_files = []
+    with os.scandir(TRACES_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.json'):
+                continue
+            if entry.name in skip and (modified_since is None or entry.stat().st_mtime < modified_since):
+                continue
+            trace_files.append(_index_entry(entry))
+    return trace_files
+
+
+def _replace_trace_index(index_path: str, trace_files: list[dict], started_at: float) -> list[dict]:
+    """
+    Atomically write the index with trace_files, then append the traces saved since started_at.
+    Writers skip the index while it is missing and may append to the file being replaced,
+    so those traces are recovered from disk rather than lost.
+    """
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(json_utils.dumps(entry) + "\n" for entry in trace_files)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        logger.warning("Could not write trace index: %s", e)
+        return trace_files
+
+    late_files = _scan_traces(skip={entry["filename"] for entry in trace_files}, modified_since=started_at)
+    if late_files:
+        try:
+            with open(index_path, 'a', encoding='utf-8') as f:
+                f.writelines(json_utils.dumps(entry) + "\n" for entry in late_files)
+        except OSError as e:
+            logger.warning("Could not update trace index: %s", e)
+    merged = {entry["filename"]: entry for entry in trace_files}
+    merged.update((entry["filename"], entry) for entry in late_files)
+    return list(merged.values())
 
 
 @admin_bp.route('/traces', methods=['GET'])
@@ -71,37 +146,16 @@ def list_traces():
         return jsonify({"error": "Trace access not permitted in production without access key"}), 403
     
     try:
-        if not os.path.exists(TRACES_DIR):
-            return jsonify({"traces": [], "count": 0, "message": "No traces directory found"}), 200
-        
-        trace_files = []
-        for filename in os.listdir(TRACES_DIR):
-            if filename.endswith('.json'):
-                filepath = os.path.join(TRACES_DIR, filename)
-                stat = os.stat(filepath)
-                
-                trace_info = {
-                    "filename": filename,
-                    "size_bytes": stat.st_size,
-                    "created_at": datetime.datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                    "modified_at": datetime.datetime.fromtimestamp(stat.st_mtime).isoformat()
-                }
-                
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        trace_data = json.load(f)
-                        trace_info["trace_id"] = trace_data.get("trace_id")
-                        trace_info["endpoint"] = trace_data.get("metadata", {}).get("endpoint")
-                        trace_info["session_id"] = trace_data.get("metadata", {}).get("session_id")
-                        summary = trace_data.get("summary", {})
-                        trace_info["duration_seconds"] = summary.get("total_duration_seconds")
-                        trace_info["status"] = summary.get("status")
-                        trace_info["steps_count"] = summary.get("total_steps")
-                        trace_info["api_calls_count"] = summary.get("total_api_calls")
-                except Exception:
-                    pass
-                
-                trace_files.append(trace_info)
+        index_path = os.path.join(TRACES_DIR, RequestTracer.INDEX_FILENAME)
+        started_at = time.time()
+        try:
+            trace_files, line_count = _read_trace_index(index_path)
+            if line_count > 2 * len(trace_files):
+                # Compact once superseded lines outnumber live ones, dropping traces deleted from disk
+                trace_files = [entry for entry in trace_files if os.path.exists(os.path.join(TRACES_DIR, entry["filename"]))]
+                trace_files = _replace_trace_index(index_path, trace_files, started_at)
+        except FileNotFoundError:
+            trace_files = _replace_trace_index(index_path, _scan_traces(), started_at)
         
         trace_files.sort(key=lambda x: x.get("created_at", ""), reverse=True)
         
@@ -112,7 +166,7 @@ def list_traces():
         }), 200
         
     except Exception as e:
-        logger.error(f"Error listing traces: {e}")
+        logger.error("Error listing traces: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -131,13 +185,13 @@ def get_trace(filename):
         if not os.path.exists(filepath):
             return jsonify({"error": f"Trace file not found: {filename}"}), 404
         
-        with open(filepath, 'r', encoding='utf-8') as f:
-            trace_data = json.load(f)
+        with open(filepath, 'rb') as f:
+            trace_data = json_utils.loads(f.read())
         
-        return jsonify(trace_data), 200
+        return json_utils.json_response(trace_data)
         
     except Exception as e:
-        logger.error(f"Error reading trace {filename}: {e}")
+        logger.error("Error reading trace %s: %s", filename, e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -151,18 +205,26 @@ def download_trace(filename):
         if not filename.endswith('.json'):
             filename = f"{filename}.json"
         
-        filepath = os.path.join(TRACES_DIR, filename)
+        # send_file resolves relative paths against the app package, not the working directory
+        filepath = os.path.abspath(os.path.join(TRACES_DIR, filename))
         
-        if not os.path.exists(filepath):
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
             return jsonify({"error": f"Trace file not found: {filename}"}), 404
         
+        # Conditional requests get a 304; the body goes out through wsgi.file_wrapper (sendfile under gunicorn)
         return send_file(
             filepath,
             mimetype='application/json',
             as_attachment=True,
-            download_name=filename
+            download_name=filename,
+            conditional=True,
+            etag=True,
+            last_modified=stat.st_mtime,
+            max_age=60
         )
         
     except Exception as e:
-        logger.error(f"Error downloading trace {filename}: {e}")
+        logger.error("Error downloading trace %s: %s", filename, e)
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
@@ -6,13 +6,25 @@ Administrative endpoints including statistics and feedback.
 
 import logging
 import datetime
-from flask import Blueprint, request, jsonify
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, current_app
 
 # Import services
-from app.services.database import get_contracts_collection, get_terms_collection, get_expert_feedback_collection
+from app.services.database import (
+    get_contracts_collection, get_terms_collection, get_terms_metadata_collection, get_expert_feedback_collection
+)
+from app.utils.analysis_helpers import now_iso
+from app.utils.json_utils import json_response
+from app.utils.lru_cache import LRUTTLCache
 
 logger = logging.getLogger(__name__)
 
+# The feedback term lookup runs here alongside the session check on the request thread
+_feedback_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="feedback-db")
+
+# System-wide counts change slowly; every caller within the TTL shares one computation
+_statistics_cache = LRUTTLCache(maxsize=1, ttl=30)
+
 # Get blueprint from __init__.py
 from . import analysis_bp
 
@@ -28,22 +40,35 @@ def get_statistics():
     if contracts_collection is None or terms_collection is None:
         return jsonify({"error": "Database service unavailable."}), 503
     
+    cached_statistics = _statistics_cache.get("statistics")
+    if cached_statistics is not None:
+        return jsonify(cached_statistics)
+    
     try:
-        # Get basic counts
-        total_sessions = contracts_collection.count_documents({})
-        completed_sessions = contracts_collection.count_documents({"status": "completed"})
-        failed_sessions = contracts_collection.count_documents({"status": "failed"})
-        processing_sessions = contracts_collection.count_documents({"status": "processing"})
-        
-        # Get analysis type breakdown
-        sharia_analyses = contracts_collection.count_documents({"analysis_type": "sharia"})
-        legal_analyses = contracts_collection.count_documents({"analysis_type": "legal"})
-        
-        # Get recent activity (last 7 days)
         seven_days_ago = datetime.datetime.now() - datetime.timedelta(days=7)
-        recent_sessions = contracts_collection.count_documents({
-            "created_at": {"$gte": seven_days_ago}
-        })
+        
+        # All session counters in one pass and one round trip instead of a count query each
+        facet_stages = {
+            "total": [],
+            "completed": [{"$match": {"status": "completed"}}],
+            "failed": [{"$match": {"status": "failed"}}],
+            "processing": [{"$match": {"status": "processing"}}],
+            "sharia": [{"$match": {"analysis_type": "sharia"}}],
+            "legal": [{"$match": {"analysis_type": "legal"}}],
+            "recent": [{"$match": {"created_at": {"$gte": seven_days_ago}}}],
+        }
+        facets = next(contracts_collection.aggregate([
+            {"$facet": {name: stages + [{"$count": "n"}] for name, stages in facet_stages.items()}}
+        ]), {})
+        # $count emits no document for an empty facet
+        counts = {name: facets[name][0]["n"] if facets.get(name) else 0 for name in facet_stages}
+        total_sessions = counts["total"]
+        completed_sessions = counts["completed"]
+        failed_sessions = counts["failed"]
+        processing_sessions = counts["processing"]
+        sharia_analyses = counts["sharia"]
+        legal_analyses = counts["legal"]
+        recent_sessions = counts["recent"]
         
         # Get total terms analyzed
         total_terms = terms_collection.count_documents({})
@@ -64,6 +89,8 @@ def get_statistics():
             "total_terms_analyzed": total_terms,
             "generated_at": datetime.datetime.now().isoformat()
         }
+        _statistics_cache.ttl = current_app.config.get('STATISTICS_CACHE_TTL_SECONDS', 30)
+        _statistics_cache.set("statistics", statistics)
         
         return jsonify(statistics)
         
@@ -101,20 +128,6 @@ def get_user_stats():
             }
         ).sort("created_at", -1).limit(recent_limit))
         
-        # Convert ObjectId and datetime objects
-        from bson import ObjectId
-        
-        def convert_for_json(obj):
-            if isinstance(obj, ObjectId):
-                return str(obj)
-            elif isinstance(obj, datetime.datetime):
-                return obj.isoformat()
-            return obj
-        
-        for session in recent_sessions:
-            for key, value in session.items():
-                session[key] = convert_for_json(value)
-        
         # Get activity summary for last 30 days
         thirty_days_ago = datetime.datetime.now() - datetime.timedelta(days=30)
         monthly_count = contracts_collection.count_documents({
@@ -128,7 +141,8 @@ def get_user_stats():
             "generated_at": datetime.datetime.now().isoformat()
         }
         
-        return jsonify(user_stats)
+        # ObjectId and datetime values in the sessions are converted by the serializer at any depth
+        return json_response(user_stats)
         
     except Exception as e:
         logger.error(f"Error retrieving user stats: {str(e)}")
@@ -162,16 +176,20 @@ def submit_expert_feedback():
         if not term_id:
             return jsonify({"error": "Missing required field: term_id"}), 400
         
+        # Get the term data to capture original AI analysis, while the session is checked
+        term_future = None
+        if terms_collection is not None:
+            term_future = _feedback_executor.submit(
+                terms_collection.find_one, {"session_id": session_id, "term_id": term_id}
+            )
+        
         # Verify session exists
         if contracts_collection is not None:
-            session_doc = contracts_collection.find_one({"_id": session_id})
+            session_doc = contracts_collection.find_one({"_id": session_id}, {"_id": 1})
             if not session_doc:
                 return jsonify({"error": "Session not found."}), 404
         
-        # Get the term data to capture original AI analysis
-        term_doc = None
-        if terms_collection is not None:
-            term_doc = terms_collection.find_one({"session_id": session_id, "term_id": term_id})
+        term_doc = term_future.result() if term_future is not None else None
         
         # Get feedback data from request
         feedback_data_nested = request_data.get("feedback_data", {})
@@ -219,9 +237,9 @@ def submit_expert_feedback():
         result = expert_feedback_collection.insert_one(feedback_doc)
         feedback_id = str(result.inserted_id)
         
-        # Update term with expert feedback flag if term exists
+        # Flag the term only once its feedback document exists, so a failed insert leaves it untouched
         if term_doc and terms_collection is not None:
-            terms_collection.update_one(
+            get_terms_metadata_collection().update_one(
                 {"session_id": session_id, "term_id": term_id},
                 {"$set": {
                     "has_expert_feedback": True,
@@ -251,5 +269,5 @@ def health_check():
     return jsonify({
         "service": "Shariaa Contract Analyzer",
         "status": "healthy",
-        "timestamp": datetime.datetime.now().isoformat()
+        "timestamp": now_iso()
     }), 200
\ No newline at end of file
@@ -5,11 +5,11 @@ Session management and history endpoints.
 """
 
 import logging
-import datetime
 from flask import Blueprint, request, jsonify
 
 # Import services
 from app.services.database import get_contracts_collection
+from app.utils.json_utils import json_response
 
 logger = logging.getLogger(__name__)
 
@@ -37,24 +37,11 @@ def get_sessions():
         sessions_cursor = contracts_collection.find().sort([("created_at", -1)]).skip(skip).limit(limit)
         sessions_list = list(sessions_cursor)
         
-        # Convert ObjectId and datetime objects
-        from bson import ObjectId
-        
-        def convert_for_json(obj):
-            if isinstance(obj, ObjectId):
-                return str(obj)
-            elif isinstance(obj, datetime.datetime):
-                return obj.isoformat()
-            return obj
-        
-        for session in sessions_list:
-            for key, value in session.items():
-                session[key] = convert_for_json(value)
-        
         # Get total count
         total_sessions = contracts_collection.count_documents({})
         
-        return jsonify({
+        # ObjectId and datetime values are converted by the serializer at any depth
+        return json_response({
             "sessions": sessions_list,
             "total_sessions": total_sessions,
             "current_page": page,
@@ -82,21 +69,7 @@ def get_analysis_history():
         history_cursor = contracts_collection.find({"status": "completed"}).sort([("completed_at", -1)]).limit(20)
         history_list = list(history_cursor)
         
-        # Convert ObjectId and datetime objects
-        from bson import ObjectId
-        
-        def convert_for_json(obj):
-            if isinstance(obj, ObjectId):
-                return str(obj)
-            elif isinstance(obj, datetime.datetime):
-                return obj.isoformat()
-            return obj
-        
-        for item in history_list:
-            for key, value in item.items():
-                item[key] = convert_for_json(value)
-        
-        return jsonify({
+        return json_response({
             "history": history_list,
             "total_items": len(history_list)
         })
@@ -5,11 +5,12 @@ Term-related endpoints and session data retrieval.
 """
 
 import logging
-import datetime
 from flask import Blueprint, request, jsonify
 
 # Import services
 from app.services.database import get_contracts_collection, get_terms_collection
+from app.utils.text_processing import get_contract_plain_text
+from app.utils.json_utils import json_response
 
 logger = logging.getLogger(__name__)
 
@@ -34,30 +35,14 @@ def get_analysis_results(analysis_id):
         if not session_doc:
             logger.warning(f"Analysis session not found: {analysis_id}")
             return jsonify({"error": "Analysis session not found."}), 404
-        
+
+        session_doc["original_contract_plain"] = get_contract_plain_text(session_doc)
+
         # Get terms for this session
         terms_list = list(terms_collection.find({"session_id": analysis_id}))
         
-        # Convert ObjectId and datetime objects to JSON-serializable format
-        from bson import ObjectId
-        
-        def convert_for_json(obj):
-            if isinstance(obj, ObjectId):
-                return str(obj)
-            elif isinstance(obj, datetime.datetime):
-                return obj.isoformat()
-            return obj
-        
-        # Process session document
-        for key, value in session_doc.items():
-            session_doc[key] = convert_for_json(value)
-        
-        # Process terms
-        for term in terms_list:
-            for key, value in term.items():
-                term[key] = convert_for_json(value)
-        
-        return jsonify({
+        # ObjectId and datetime values are converted by the serializer at any depth
+        return json_response({
             "session_id": analysis_id,
             "session_info": session_doc,
             "terms": terms_list,
@@ -85,20 +70,9 @@ def get_session_details(session_id):
             logger.warning(f"Session not found: {session_id}")
             return jsonify({"error": "Session not found."}), 404
         
-        # Convert ObjectId and datetime objects
-        from bson import ObjectId
-        
-        def convert_for_json(obj):
-            if isinstance(obj, ObjectId):
-                return str(obj)
-            elif isinstance(obj, datetime.datetime):
-                return obj.isoformat()
-            return obj
-        
-        for key, value in session_doc.items():
-            session_doc[key] = convert_for_json(value)
+        session_doc["original_contract_plain"] = get_contract_plain_text(session_doc)
         
-        return jsonify(session_doc)
+        return json_response(session_doc)
         
     except Exception as e:
         logger.error(f"Error retrieving session details: {str(e)}")
@@ -118,21 +92,7 @@ def get_session_terms(session_id):
     try:
         terms_list = list(terms_collection.find({"session_id": session_id}))
         
-        # Convert ObjectId and datetime objects
-        from bson import ObjectId
-        
-        def convert_for_json(obj):
-            if isinstance(obj, ObjectId):
-                return str(obj)
-            elif isinstance(obj, datetime.datetime):
-                return obj.isoformat()
-            return obj
-        
-        for term in terms_list:
-            for key, value in term.items():
-                term[key] = convert_for_json(value)
-        
-        return jsonify(terms_list)
+        return json_response(terms_list)
         
     except Exception as e:
         logger.error(f"Error retrieving session terms: {str(e)}")
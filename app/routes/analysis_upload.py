@@ -5,33 +5,48 @@ File upload and analysis endpoints - matches old api_server.py format.
 """
 
 import os
-import re
 import uuid
-import json
 import datetime
-import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from flask import request, jsonify, current_app, g
 from docx import Document as DocxDocument
-from langdetect import detect
-from langdetect.lang_detect_exception import LangDetectException
 
 from app.routes import analysis_bp
 from app.services.database import get_contracts_collection, get_terms_collection
 from app.services.document_processor import build_structured_text_for_analysis
-from app.services.ai_service import send_text_to_remote_api, extract_text_from_file as ai_extract_text
-from app.services.cloudinary_service import upload_to_cloudinary_helper, CLOUDINARY_AVAILABLE
-from app.utils.file_helpers import ensure_dir, clean_filename, download_file_from_url
-from app.utils.text_processing import clean_model_response, generate_safe_public_id
+from app.services.ai_service import (
+    send_text_to_remote_api, split_system_prompt, file_digest, invalidate_text_response,
+    extract_text_from_file as ai_extract_text
+)
+from app.services.response_cache import get_response_cache, ResponseCache
+from app.services.cloudinary_service import upload_to_cloudinary_helper, ensure_cloudinary, CLOUDINARY_AVAILABLE
+from app.services.file_search import FileSearchService
+from app.utils.file_helpers import ensure_dir, clean_filename, save_upload
+from app.utils.text_processing import (
+    clean_model_response, generate_safe_public_id, strip_markdown, term_sort_rank, detect_contract_language
+)
 from app.utils.analysis_helpers import TEMP_PROCESSING_FOLDER
+from app.utils import json_utils
+from app.utils.lru_cache import LRUTTLCache
 from app.utils.logging_utils import (
-    get_logger, get_trace_id, create_error_response, 
+    get_logger, get_trace_id, set_trace_id, clear_trace_id, create_error_response, 
     RequestTimer, log_request_summary,
     RequestTracer, set_request_tracer, get_request_tracer, clear_request_tracer
 )
+from config.default import DefaultConfig
 
 logger = get_logger(__name__)
 
+# Uploads are at most 16 MB; when one has to be copied, a 1 MB buffer does it in a handful of reads instead of Werkzeug's 16 KB chunks
+UPLOAD_COPY_BUFFER_SIZE = 1 << 20
+
+# Original uploads go to Cloudinary on these threads while the request parses the local copy
+_upload_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cloudinary-upload")
+# Analyses queued with ASYNC_ANALYSIS, and their results until polled, keyed by session id
+_analysis_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="analysis")
+_analysis_jobs = LRUTTLCache(maxsize=256, ttl=3600)
+
 try:
     import cloudinary
     import cloudinary.uploader
@@ -40,6 +55,23 @@ except ImportError:
     logger.warning("Cloudinary not available")
 
 
+def _remove_temp_file(path):
+    try:
+        if os.path.exists(path):
+            os.remove(path)
+    except OSError as e_clean:
+        logger.debug(f"Temp file cleanup error: {e_clean}")
+
+
+def _run_with_tracer(tracer, func, *args, **kwargs):
+    """Run func on a worker thread with the request's tracer so its API calls are still recorded."""
+    set_request_tracer(tracer)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        clear_request_tracer()
+
+
 def normalize_term_ids(terms_list):
     """
     Normalize term_id values to the expected format: clause_0, clause_1, clause_2, etc.
@@ -88,12 +120,37 @@ def normalize_term_ids(terms_list):
     return normalized
 
 
+def _analysis_error(error_type: str, message: str, details: dict = None, status_code: int = 500) -> tuple[dict, int]:
+    """Standardized error payload and status code; the analysis pipeline may run outside a request."""
+    return create_error_response(error_type, message, details or {}), status_code
+
+
 def create_analysis_error_response(error_type: str, message: str, details: dict = None, status_code: int = 500):
     """Create a standardized error response for analysis endpoints."""
-    response_data = create_error_response(error_type, message, details or {})
+    response_data, status_code = _analysis_error(error_type, message, details, status_code)
     return jsonify(response_data), status_code
 
 
+def _trace_failure(tracer: RequestTracer, error_type: str, message: str, step_error: str | None = None):
+    """Record an error on the trace, close the open step when step_error is given, and save the trace."""
+    tracer.record_error(error_type, message)
+    if step_error is not None:
+        tracer.end_step(status="error", error=step_error)
+    trace_path = tracer.save_trace()
+    logger.info(f"Trace saved: {trace_path}")
+
+
+def _set_session_cookie(response, session_id: str):
+    response.set_cookie(
+        "session_id", 
+        session_id, 
+        max_age=86400*30, 
+        httponly=True, 
+        samesite='Lax', 
+        secure=request.is_secure
+    )
+
+
 @analysis_bp.route('/analyze', methods=['POST'])
 def analyze_file():
     """Upload and analyze a contract file - matches old api_server.py format exactly."""
@@ -101,10 +158,6 @@ def analyze_file():
     timer.start_step("initialization")
     
     session_id_local = str(uuid.uuid4())
-    file_size = 0
-    extracted_chars = 0
-    file_search_status = "not_started"
-    analysis_status = "not_started"
     
     tracer = RequestTracer(endpoint="/analyze")
     set_request_tracer(tracer)
@@ -114,27 +167,9 @@ def analyze_file():
 
     tracer.start_step("1_initialization", {"request_method": "POST", "endpoint": "/analyze"})
     
-    contracts_collection = get_contracts_collection()
-    terms_collection = get_terms_collection()
-    
-    if contracts_collection is None or terms_collection is None:
-        logger.error("Database unavailable")
-        tracer.record_error("database_error", "Database service unavailable")
-        tracer.end_step(status="error", error="Database unavailable")
-        trace_path = tracer.save_trace()
-        logger.info(f"Trace saved: {trace_path}")
-        return create_analysis_error_response(
-            "DATABASE_ERROR", 
-            "Database service unavailable",
-            status_code=503
-        )
-
     if "file" not in request.files:
         logger.warning("No file in request")
-        tracer.record_error("validation_error", "No file sent")
-        tracer.end_step(status="error", error="No file in request")
-        trace_path = tracer.save_trace()
-        logger.info(f"Trace saved: {trace_path}")
+        _trace_failure(tracer, "validation_error", "No file sent", "No file in request")
         return create_analysis_error_response(
             "VALIDATION_ERROR",
             "No file sent",
@@ -144,16 +179,26 @@ def analyze_file():
     uploaded_file_storage = request.files["file"]
     if not uploaded_file_storage or not uploaded_file_storage.filename:
         logger.warning("Invalid file")
-        tracer.record_error("validation_error", "Invalid file")
-        tracer.end_step(status="error", error="Invalid file")
-        trace_path = tracer.save_trace()
-        logger.info(f"Trace saved: {trace_path}")
+        _trace_failure(tracer, "validation_error", "Invalid file", "Invalid file")
         return create_analysis_error_response(
             "VALIDATION_ERROR",
             "Invalid file",
             status_code=400
         )
 
+    # Fetched only once the request is valid, so malformed uploads never trigger the lazy database connect
+    contracts_collection = get_contracts_collection()
+    terms_collection = get_terms_collection()
+    
+    if contracts_collection is None or terms_collection is None:
+        logger.error("Database unavailable")
+        _trace_failure(tracer, "database_error", "Database service unavailable", "Database unavailable")
+        return create_analysis_error_response(
+            "DATABASE_ERROR", 
+            "Database service unavailable",
+            status_code=503
+        )
+
     original_filename = clean_filename(uploaded_file_storage.filename)
     tracer.set_metadata("original_filename", original_filename)
     logger.info(f"Processing: {original_filename}")
@@ -167,71 +212,151 @@ def analyze_file():
     original_upload_cloudinary_folder = f"{CLOUDINARY_BASE_FOLDER}/{session_id_local}/{CLOUDINARY_ORIGINAL_UPLOADS_SUBFOLDER}"
     analysis_results_cloudinary_folder = f"{CLOUDINARY_BASE_FOLDER}/{session_id_local}/{CLOUDINARY_ANALYSIS_RESULTS_SUBFOLDER}"
 
+    timer.start_step("upload")
+    tracer.start_step("2_file_upload", {"filename": original_filename, "cloudinary_available": CLOUDINARY_AVAILABLE})
+    temp_processing_file_path = os.path.join(TEMP_PROCESSING_FOLDER, f"{session_id_local}_{original_filename}")
+    try:
+        ensure_dir(TEMP_PROCESSING_FOLDER)
+        save_upload(uploaded_file_storage, temp_processing_file_path, buffer_size=UPLOAD_COPY_BUFFER_SIZE)
+    except Exception as e:
+        logger.exception(f"Saving upload failed: {e}")
+        _trace_failure(tracer, "exception", str(e), str(e))
+        _remove_temp_file(temp_processing_file_path)
+        return create_analysis_error_response(
+            "ANALYSIS_ERROR",
+            f"Analysis failed: {str(e)}",
+            status_code=500
+        )
+
+    job_kwargs = {
+        "session_id_local": session_id_local,
+        "original_filename": original_filename,
+        "temp_processing_file_path": temp_processing_file_path,
+        "original_upload_cloudinary_folder": original_upload_cloudinary_folder,
+        "analysis_results_cloudinary_folder": analysis_results_cloudinary_folder,
+        "contracts_collection": contracts_collection,
+        "terms_collection": terms_collection,
+        "tracer": tracer,
+        "timer": timer,
+    }
+
+    if current_app.config.get('ASYNC_ANALYSIS', False):
+        # Placeholder so polls from any worker see the job; the pipeline replaces it with the full document
+        contracts_collection.insert_one({
+            "_id": session_id_local,
+            "session_id": session_id_local,
+            "original_filename": original_filename,
+            "analysis_status": "processing",
+            "analysis_timestamp": datetime.datetime.now(datetime.timezone.utc)
+        })
+        _analysis_jobs[session_id_local] = _analysis_executor.submit(
+            _run_analysis_job, current_app._get_current_object(), get_trace_id(), job_kwargs
+        )
+        logger.info(f"Analysis queued: {session_id_local}")
+        response = jsonify({
+            "job_id": session_id_local,
+            "session_id": session_id_local,
+            "status": "processing",
+            "poll_url": f"/analysis_status/{session_id_local}",
+            "trace_id": get_trace_id()
+        })
+        _set_session_cookie(response, session_id_local)
+        return response, 202
+
+    response_payload, status_code = run_analysis(**job_kwargs)
+    if status_code != 200:
+        return jsonify(response_payload), status_code
+
+    response = jsonify(response_payload)
+    _set_session_cookie(response, session_id_local)
+    return response
+
+
+def _run_analysis_job(app, trace_id: str, job_kwargs: dict) -> tuple[dict, int]:
+    """Run a queued analysis with the request's trace id and tracer; failures are recorded on the session."""
+    session_id = job_kwargs["session_id_local"]
+    with app.app_context():
+        set_trace_id(trace_id)
+        set_request_tracer(job_kwargs["tracer"])
+        try:
+            response_payload, status_code = run_analysis(**job_kwargs)
+        except Exception as e:
+            logger.exception(f"Queued analysis failed for session {session_id}: {e}")
+            response_payload, status_code = _analysis_error("ANALYSIS_ERROR", f"Analysis failed: {str(e)}")
+        finally:
+            clear_request_tracer()
+            clear_trace_id()
+
+        if status_code != 200:
+            try:
+                job_kwargs["contracts_collection"].update_one(
+                    {"_id": session_id},
+                    {"$set": {
+                        "analysis_status": "failed",
+                        "analysis_error": response_payload,
+                        "analysis_error_status_code": status_code
+                    }}
+                )
+            except Exception as e:
+                logger.error(f"Could not record failed analysis for session {session_id}: {e}")
+        return response_payload, status_code
+
+
+def _extract_docx_text(file_path: str, content_hash: str) -> tuple[str, str]:
+    """Return (structured text, plain text) of a DOCX, cached by file content in the response cache."""
+    response_cache = get_response_cache()
+    cache_key = ResponseCache.build_key("docx_structured_text", content_hash) if response_cache else None
+    if response_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"DOCX extraction cache HIT, key {cache_key[:12]}")
+            cached = json_utils.loads(cached)
+            return cached["structured"], cached["plain"]
+
+    structured_text, plain_text = build_structured_text_for_analysis(DocxDocument(file_path))
+    if response_cache:
+        response_cache.set(cache_key, json_utils.dumps({"structured": structured_text, "plain": plain_text}))
+    return structured_text, plain_text
+
+
+def run_analysis(session_id_local: str, original_filename: str, temp_processing_file_path: str,
+                 original_upload_cloudinary_folder: str, analysis_results_cloudinary_folder: str,
+                 contracts_collection, terms_collection, tracer: RequestTracer, timer: RequestTimer) -> tuple[dict, int]:
+    """
+    Analyze a saved upload: extraction, AAOIFI search, the Gemini call and the database writes.
+    Continues the tracer's open upload step, always removes the temp file, and returns
+    (response payload, status code) so it can run in the request or on a background worker.
+    """
+    file_size = 0
+    extracted_chars = 0
+    file_search_status = "not_started"
+    analysis_status = "not_started"
     original_cloudinary_info = None
+    original_upload_future = None
+    results_upload_future = None
     analysis_results_cloudinary_info = None
-    temp_processing_file_path = None
-    temp_analysis_results_path = None
+    analysis_payload = None
+    formatted_sys_prompt = None
 
     try:
-        timer.start_step("upload")
-        tracer.start_step("2_file_upload", {"filename": original_filename, "cloudinary_available": CLOUDINARY_AVAILABLE})
         file_base, _ = os.path.splitext(original_filename)
+        file_size = os.path.getsize(temp_processing_file_path)
+        effective_ext = os.path.splitext(original_filename)[1].lower()
 
         if CLOUDINARY_AVAILABLE and cloudinary:
+            # Upload the saved copy in the background while the same local file is parsed
             safe_public_id = generate_safe_public_id(file_base, "original")
-            original_upload_result = cloudinary.uploader.upload(
-                uploaded_file_storage,
+            ensure_cloudinary()
+            original_upload_future = _upload_executor.submit(
+                cloudinary.uploader.upload,
+                temp_processing_file_path,
                 folder=original_upload_cloudinary_folder,
                 public_id=safe_public_id,
                 resource_type="auto",
                 overwrite=True
             )
-
-            if not original_upload_result or not original_upload_result.get("secure_url"):
-                logger.error("Cloudinary upload failed")
-                tracer.record_error("upload_error", "Cloudinary upload failed")
-                tracer.end_step(status="error", error="Cloudinary upload failed")
-                trace_path = tracer.save_trace()
-                logger.info(f"Trace saved: {trace_path}")
-                return create_analysis_error_response(
-                    "UPLOAD_ERROR",
-                    "Failed to upload file to storage",
-                    status_code=500
-                )
-
-            file_size = original_upload_result.get("bytes", 0)
-            original_cloudinary_info = {
-                "url": original_upload_result.get("secure_url"),
-                "public_id": original_upload_result.get("public_id"),
-                "format": original_upload_result.get("format"),
-                "user_facing_filename": original_filename
-            }
-            logger.info(f"Uploaded to Cloudinary ({file_size} bytes)")
-
-            temp_processing_file_path = download_file_from_url(
-                original_cloudinary_info["url"], 
-                original_filename, 
-                TEMP_PROCESSING_FOLDER
-            )
-            if not temp_processing_file_path:
-                logger.error("Download from Cloudinary failed")
-                tracer.record_error("download_error", "Failed to download file for processing")
-                tracer.end_step(status="error", error="Download from Cloudinary failed")
-                trace_path = tracer.save_trace()
-                logger.info(f"Trace saved: {trace_path}")
-                return create_analysis_error_response(
-                    "DOWNLOAD_ERROR",
-                    "Failed to download file for processing",
-                    status_code=500
-                )
-                
-            effective_ext = f".{original_cloudinary_info['format']}" if original_cloudinary_info['format'] else os.path.splitext(original_filename)[1].lower()
+            logger.info(f"Saved locally ({file_size} bytes), Cloudinary upload started")
         else:
-            ensure_dir(TEMP_PROCESSING_FOLDER)
-            temp_processing_file_path = os.path.join(TEMP_PROCESSING_FOLDER, f"{session_id_local}_{original_filename}")
-            uploaded_file_storage.save(temp_processing_file_path)
-            file_size = os.path.getsize(temp_processing_file_path)
-            effective_ext = os.path.splitext(original_filename)[1].lower()
             original_cloudinary_info = {
                 "url": f"local://{temp_processing_file_path}",
                 "public_id": None,
@@ -242,8 +367,8 @@ def analyze_file():
         
         tracer.end_step({
             "file_size_bytes": file_size,
-            "storage_type": "cloudinary" if CLOUDINARY_AVAILABLE else "local",
-            "cloudinary_url": original_cloudinary_info.get("url") if original_cloudinary_info else None
+            "storage_type": "cloudinary" if original_upload_future else "local",
+            "cloudinary_upload": "in_progress" if original_upload_future else None
         })
         timer.end_step()
 
@@ -258,10 +383,13 @@ def analyze_file():
 
         logger.debug(f"Extension: {effective_ext}")
 
+        # Re-uploads of the same contract reuse the extraction of the first one
+        content_hash = file_digest(temp_processing_file_path)
+        tracer.set_metadata("content_hash", content_hash)
+
         if effective_ext == ".docx":
             logger.info("Processing DOCX")
-            doc = DocxDocument(temp_processing_file_path)
-            analysis_input_text, original_contract_plain = build_structured_text_for_analysis(doc)
+            analysis_input_text, original_contract_plain = _extract_docx_text(temp_processing_file_path, content_hash)
             generated_markdown_from_docx = analysis_input_text
             original_format_to_store = "docx"
             extracted_chars = len(original_contract_plain)
@@ -269,37 +397,25 @@ def analyze_file():
             
         elif effective_ext in [".pdf", ".txt"]:
             logger.info(f"Processing {effective_ext.upper()}")
-            extracted_markdown_from_llm = ai_extract_text(temp_processing_file_path)
+            extracted_markdown_from_llm = ai_extract_text(temp_processing_file_path, digest=content_hash)
             if extracted_markdown_from_llm is None:
                 logger.error(f"Extraction failed for {effective_ext}")
-                tracer.record_error("extraction_error", f"Failed to extract text from {effective_ext}")
-                tracer.end_step(status="error", error=f"Extraction failed for {effective_ext}")
-                trace_path = tracer.save_trace()
-                logger.info(f"Trace saved: {trace_path}")
-                return create_analysis_error_response(
+                _trace_failure(tracer, "extraction_error", f"Failed to extract text from {effective_ext}", f"Extraction failed for {effective_ext}")
+                return _analysis_error(
                     "EXTRACTION_ERROR",
                     f"Failed to extract text from {effective_ext} file",
                     status_code=500
                 )
             original_contract_markdown = extracted_markdown_from_llm
             analysis_input_text = original_contract_markdown
-            if extracted_markdown_from_llm:
-                original_contract_plain = re.sub(
-                    r'^#+\s*|\*\*|\*|__|`|\[\[.*?\]\]', 
-                    '', 
-                    extracted_markdown_from_llm, 
-                    flags=re.MULTILINE
-                ).strip()
+            original_contract_plain = strip_markdown(extracted_markdown_from_llm)
             original_format_to_store = effective_ext.replace(".", "")
             extracted_chars = len(original_contract_plain)
             logger.info(f"Extracted {extracted_chars} chars from {effective_ext.upper()}")
         else:
             logger.error(f"Unsupported type: {effective_ext}")
-            tracer.record_error("validation_error", f"Unsupported file type: {effective_ext}")
-            tracer.end_step(status="error", error=f"Unsupported: {effective_ext}")
-            trace_path = tracer.save_trace()
-            logger.info(f"Trace saved: {trace_path}")
-            return create_analysis_error_response(
+            _trace_failure(tracer, "validation_error", f"Unsupported file type: {effective_ext}", f"Unsupported: {effective_ext}")
+            return _analysis_error(
                 "VALIDATION_ERROR",
                 f"Unsupported file type: {effective_ext}",
                 status_code=400
@@ -313,23 +429,36 @@ def analyze_file():
         })
         timer.end_step()
 
+        if original_upload_future is not None:
+            original_upload_result = original_upload_future.result()
+            original_upload_future = None
+            if not original_upload_result or not original_upload_result.get("secure_url"):
+                logger.error("Cloudinary upload failed")
+                _trace_failure(tracer, "upload_error", "Cloudinary upload failed")
+                return _analysis_error(
+                    "UPLOAD_ERROR",
+                    "Failed to upload file to storage",
+                    status_code=500
+                )
+            original_cloudinary_info = {
+                "url": original_upload_result.get("secure_url"),
+                "public_id": original_upload_result.get("public_id"),
+                "format": original_upload_result.get("format"),
+                "user_facing_filename": original_filename
+            }
+            tracer.set_metadata("cloudinary_url", original_cloudinary_info["url"])
+            logger.info(f"Uploaded to Cloudinary ({original_upload_result.get('bytes', file_size)} bytes)")
+
         if original_contract_plain and len(original_contract_plain) > 20:
-            try:
-                detected_lang = 'ar' if detect(original_contract_plain[:1000]) == 'ar' else 'en'
-                logger.debug(f"Language: {detected_lang}")
-            except LangDetectException:
-                logger.debug("Language detection failed, defaulting to Arabic")
+            detected_lang = detect_contract_language(original_contract_plain)
+            logger.debug(f"Language: {detected_lang}")
 
-        from config.default import DefaultConfig
         sys_prompt = DefaultConfig.SYS_PROMPT
         if not sys_prompt:
             logger.error("System prompt not loaded")
             tracer.start_step("3b_config_validation", {"check": "system_prompt"})
-            tracer.record_error("config_error", "System prompt not loaded")
-            tracer.end_step(status="error", error="System prompt not loaded")
-            trace_path = tracer.save_trace()
-            logger.info(f"Trace saved: {trace_path}")
-            return create_analysis_error_response(
+            _trace_failure(tracer, "config_error", "System prompt not loaded", "System prompt not loaded")
+            return _analysis_error(
                 "CONFIG_ERROR",
                 "System prompt configuration error",
                 status_code=500
@@ -348,7 +477,6 @@ def analyze_file():
             logger.info("=" * 50)
             logger.info(f"Contract text length for search: {len(analysis_input_text)} chars")
             
-            from app.services.file_search import FileSearchService
             file_search_service = FileSearchService()
             aaoifi_chunks, extracted_terms = file_search_service.search_chunks(analysis_input_text, top_k=10)
             
@@ -456,7 +584,10 @@ def analyze_file():
         })
         timer.end_step()
         
-        formatted_sys_prompt = sys_prompt.format(
+        # Per-request values go ahead of the contract text so the system instruction stays identical
+        # across requests and its context cache is reused
+        formatted_sys_prompt, prompt_context = split_system_prompt(
+            sys_prompt,
             output_language=detected_lang,
             aaoifi_context=aaoifi_context
         )
@@ -464,11 +595,8 @@ def analyze_file():
         if not analysis_input_text or not analysis_input_text.strip():
             logger.error("Empty analysis input")
             tracer.start_step("4b_input_validation", {"check": "analysis_input_text"})
-            tracer.record_error("extraction_error", "No text could be extracted from the file")
-            tracer.end_step(status="error", error="Empty analysis input")
-            trace_path = tracer.save_trace()
-            logger.info(f"Trace saved: {trace_path}")
-            return create_analysis_error_response(
+            _trace_failure(tracer, "extraction_error", "No text could be extracted from the file", "Empty analysis input")
+            return _analysis_error(
                 "EXTRACTION_ERROR",
                 "No text could be extracted from the file",
                 status_code=400
@@ -495,8 +623,9 @@ def analyze_file():
         logger.info(f"  Thinking mode: ENABLED (deep analysis)")
         logger.info("=" * 50)
         
+        analysis_payload = f"{prompt_context}\n\n{analysis_input_text}"
         external_response_text = send_text_to_remote_api(
-            analysis_input_text, 
+            analysis_payload, 
             f"{session_id_local}_analysis_final", 
             formatted_sys_prompt
         )
@@ -509,11 +638,8 @@ def analyze_file():
         if not external_response_text or external_response_text.startswith(("ERROR_PROMPT_BLOCKED", "ERROR_CONTENT_BLOCKED")):
             logger.error(f"LLM response blocked: {external_response_text}")
             analysis_status = "blocked"
-            tracer.record_error("ai_blocked", f"Response blocked: {external_response_text}")
-            tracer.end_step(status="error", error="Content blocked")
-            trace_path = tracer.save_trace()
-            logger.info(f"Trace saved: {trace_path}")
-            return create_analysis_error_response(
+            _trace_failure(tracer, "ai_blocked", f"Response blocked: {external_response_text}", "Content blocked")
+            return _analysis_error(
                 "AI_ERROR",
                 "Analysis was blocked by content filter",
                 {"response_code": external_response_text},
@@ -521,7 +647,7 @@ def analyze_file():
             )
 
         logger.info("Parsing analysis results")
-        analysis_results_list = json.loads(clean_model_response(external_response_text))
+        analysis_results_list = json_utils.loads(clean_model_response(external_response_text))
         if not isinstance(analysis_results_list, list):
             analysis_results_list = []
 
@@ -542,33 +668,20 @@ def analyze_file():
 
         timer.start_step("save_results")
         tracer.start_step("6_save_results", {"terms_count": len(analysis_results_list)})
-        with tempfile.NamedTemporaryFile(
-            mode='w', 
-            encoding='utf-8', 
-            suffix='.json', 
-            dir=TEMP_PROCESSING_FOLDER, 
-            delete=False
-        ) as tmp_json_file:
-            json.dump(analysis_results_list, tmp_json_file, ensure_ascii=False, indent=2)
-            temp_analysis_results_path = tmp_json_file.name
-
-        if temp_analysis_results_path and CLOUDINARY_AVAILABLE:
+        if CLOUDINARY_AVAILABLE:
+            # The results upload does not depend on the database writes, so both run at once
             results_safe_public_id = generate_safe_public_id(file_base, "analysis_results")
-            results_upload_result = upload_to_cloudinary_helper(
-                temp_analysis_results_path,
+            results_upload_future = _upload_executor.submit(
+                _run_with_tracer,
+                tracer,
+                upload_to_cloudinary_helper,
+                json_utils.dumpb(analysis_results_list, indent=True),
                 analysis_results_cloudinary_folder,
                 resource_type="raw",
                 public_id_prefix="analysis_results",
-                custom_public_id=results_safe_public_id
+                custom_public_id=results_safe_public_id,
+                filename="analysis_results.json"
             )
-            if results_upload_result:
-                analysis_results_cloudinary_info = {
-                    "url": results_upload_result.get("secure_url"),
-                    "public_id": results_upload_result.get("public_id"),
-                    "format": results_upload_result.get("format", "json"),
-                    "user_facing_filename": "analysis_results.json"
-                }
-                logger.debug("Results uploaded to Cloudinary")
 
         contract_doc = {
             "_id": session_id_local,
@@ -577,11 +690,14 @@ def analyze_file():
             "original_cloudinary_info": original_cloudinary_info,
             "analysis_results_cloudinary_info": analysis_results_cloudinary_info,
             "original_format": original_format_to_store,
-            "original_contract_plain": original_contract_plain,
+            "content_hash": content_hash,
+            # For PDF/TXT the plain text is derived from the markdown on read instead of being stored twice
+            "original_contract_plain": original_contract_plain if original_contract_markdown is None else None,
             "original_contract_markdown": original_contract_markdown,
             "generated_markdown_from_docx": generated_markdown_from_docx,
             "detected_contract_language": detected_lang,
             "analysis_timestamp": datetime.datetime.now(datetime.timezone.utc),
+            "analysis_status": "completed",
             "confirmed_terms": {},
             "interactions": [],
             "modified_contract_info": None,
@@ -591,17 +707,35 @@ def analyze_file():
             "aaoifi_chunks": aaoifi_chunks,
             "file_search_extracted_terms": extracted_terms
         }
-        contracts_collection.insert_one(contract_doc)
+        # Replaces the placeholder of a queued analysis; a plain insert for one run in the request
+        contracts_collection.replace_one({"_id": session_id_local}, contract_doc, upsert=True)
         logger.info(f"Saved to database: {session_id_local}")
 
         terms_to_insert = [
-            {"session_id": session_id_local, **term} 
+            {"session_id": session_id_local, **term, "sort_rank": term_sort_rank(term["term_id"])} 
             for term in analysis_results_list 
             if isinstance(term, dict) and "term_id" in term
         ]
         if terms_to_insert:
-            terms_collection.insert_many(terms_to_insert)
+            # Unordered: the server can apply the inserts in parallel and one bad term does not drop the rest
+            terms_collection.insert_many(terms_to_insert, ordered=False)
             logger.debug(f"Inserted {len(terms_to_insert)} terms")
+
+        if results_upload_future is not None:
+            results_upload_result = results_upload_future.result()
+            results_upload_future = None
+            if results_upload_result:
+                analysis_results_cloudinary_info = {
+                    "url": results_upload_result.get("secure_url"),
+                    "public_id": results_upload_result.get("public_id"),
+                    "format": results_upload_result.get("format", "json"),
+                    "user_facing_filename": "analysis_results.json"
+                }
+                contracts_collection.update_one(
+                    {"_id": session_id_local},
+                    {"$set": {"analysis_results_cloudinary_info": analysis_results_cloudinary_info}}
+                )
+                logger.debug("Results uploaded to Cloudinary")
         
         tracer.add_sub_step("mongodb_saved", {
             "contract_id": session_id_local,
@@ -639,25 +773,19 @@ def analyze_file():
             "original_cloudinary_url": original_cloudinary_info.get("url") if original_cloudinary_info else None,
             "trace_id": get_trace_id()
         }
-        response = jsonify(response_payload)
-        response.set_cookie(
-            "session_id", 
-            session_id_local, 
-            max_age=86400*30, 
-            httponly=True, 
-            samesite='Lax', 
-            secure=request.is_secure
-        )
 
         trace_path = tracer.save_trace()
         logger.info(f"Trace saved: {trace_path}")
         logger.info(f"Analysis successful: {session_id_local}")
-        return response
+        return response_payload, 200
 
-    except json.JSONDecodeError as je:
+    except json_utils.JSONDecodeError as je:
         analysis_status = "json_error"
         logger.exception(f"JSON parse error: {je}")
         tracer.record_error("json_decode_error", str(je))
+        if analysis_payload is not None:
+            # The unparseable reply was cached; drop it so a retry asks the model again
+            invalidate_text_response(analysis_payload, formatted_sys_prompt)
         timing_summary = timer.get_summary()
         log_request_summary(logger, {
             "trace_id": get_trace_id(),
@@ -670,7 +798,7 @@ def analyze_file():
         })
         trace_path = tracer.save_trace()
         logger.info(f"Trace saved: {trace_path}")
-        return create_analysis_error_response(
+        return _analysis_error(
             "PARSE_ERROR",
             "Failed to parse analysis response",
             {"error_detail": str(je)},
@@ -693,22 +821,55 @@ def analyze_file():
         })
         trace_path = tracer.save_trace()
         logger.info(f"Trace saved: {trace_path}")
-        return create_analysis_error_response(
+        return _analysis_error(
             "ANALYSIS_ERROR",
             f"Analysis failed: {str(e)}",
             status_code=500
         )
         
     finally:
-        if temp_processing_file_path and os.path.exists(temp_processing_file_path):
+        if original_upload_future is not None and temp_processing_file_path:
+            # Request ended early; remove the temp file once the background upload lets go of it
+            original_upload_future.add_done_callback(lambda _, path=temp_processing_file_path: _remove_temp_file(path))
+        elif temp_processing_file_path and os.path.exists(temp_processing_file_path):
             try:
                 os.remove(temp_processing_file_path)
                 logger.debug("Cleaned temp processing file")
             except Exception as e_clean:
                 logger.debug(f"Temp file cleanup error: {e_clean}")
-        if temp_analysis_results_path and os.path.exists(temp_analysis_results_path):
-            try:
-                os.remove(temp_analysis_results_path)
-                logger.debug("Cleaned temp analysis file")
-            except Exception as e_clean:
-                logger.debug(f"Temp analysis cleanup error: {e_clean}")
+
+
+@analysis_bp.route('/analysis_status/<session_id>', methods=['GET'])
+def get_analysis_status(session_id):
+    """Poll an analysis queued by /analyze."""
+    job = _analysis_jobs.get(session_id)
+    if job is not None:
+        if not job.done():
+            return jsonify({"job_id": session_id, "status": "processing"}), 202
+        _analysis_jobs.pop(session_id)
+        response_payload, status_code = job.result()
+        return jsonify(response_payload), status_code
+
+    contracts_collection = get_contracts_collection()
+    if contracts_collection is None:
+        return create_analysis_error_response("DATABASE_ERROR", "Database service unavailable", status_code=503)
+
+    # Queued by another worker, or its result was already collected
+    session_doc = contracts_collection.find_one(
+        {"_id": session_id},
+        {"analysis_status": 1, "analysis_error": 1, "analysis_error_status_code": 1}
+    )
+    if not session_doc:
+        return create_analysis_error_response("NOT_FOUND", "Session not found", status_code=404)
+    status = session_doc.get("analysis_status")
+    if status == "processing":
+        return jsonify({"job_id": session_id, "status": "processing"}), 202
+    if status == "failed":
+        return jsonify(session_doc.get("analysis_error")), session_doc.get("analysis_error_status_code", 500)
+    return jsonify({
+        "job_id": session_id,
+        "session_id": session_id,
+        "status": "completed",
+        "session_url": f"/session/{session_id}",
+        "terms_url": f"/terms/{session_id}"
+    })
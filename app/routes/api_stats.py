@@ -4,17 +4,20 @@ API Statistics and History Routes
 Matches old api_server.py format for /api/stats/user and /api/history endpoints.
 """
 
-import datetime
 import logging
 import traceback
-from flask import Blueprint, jsonify
-from bson import ObjectId
+from flask import Blueprint, jsonify, current_app
 
 from app.services.database import get_contracts_collection, get_terms_collection
+from app.utils.lru_cache import LRUTTLCache
+from app.utils.json_utils import json_response
 
 logger = logging.getLogger(__name__)
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+# Aggregate counts change slowly; every caller within the TTL shares one computation
+_user_stats_cache = LRUTTLCache(maxsize=1, ttl=30)
+
 
 @api_bp.route('/stats/user', methods=['GET'])
 def get_user_stats():
@@ -31,10 +34,16 @@ def get_user_stats():
         logger.error("Database service unavailable for user stats")
         return jsonify({"error": "Database service is currently unavailable."}), 503
 
+    cached_stats = _user_stats_cache.get("user")
+    if cached_stats is not None:
+        return jsonify(cached_stats), 200
+
     try:
-        total_sessions = contracts_collection.count_documents({})
-        total_terms_analyzed = terms_collection.count_documents({})
+        # Collection metadata counts; exact counts would scan both collections
+        total_sessions = contracts_collection.estimated_document_count()
+        total_terms_analyzed = terms_collection.estimated_document_count()
 
+        # Served from the partial index on compliant terms
         compliant_terms = terms_collection.count_documents({"is_valid_sharia": True})
         compliance_rate = (compliant_terms / total_terms_analyzed * 100) if total_terms_analyzed > 0 else 0
 
@@ -46,6 +55,8 @@ def get_user_stats():
             "complianceRate": round(compliance_rate, 2),
             "averageProcessingTime": average_processing_time
         }
+        _user_stats_cache.ttl = current_app.config.get('USER_STATS_CACHE_TTL_SECONDS', 30)
+        _user_stats_cache.set("user", stats)
 
         logger.info(f"User stats calculated: {total_sessions} sessions, {total_terms_analyzed} terms")
         return jsonify(stats), 200
@@ -71,7 +82,22 @@ def get_history():
         return jsonify({"error": "Database service is currently unavailable."}), 503
 
     try:
-        contracts_cursor = contracts_collection.find().sort("analysis_timestamp", -1)
+        # Count interactions and modifications on the server and leave the contract texts behind
+        contracts_cursor = contracts_collection.aggregate([
+            {"$sort": {"analysis_timestamp": -1}},
+            {"$addFields": {
+                # interactions only holds the latest turns; interactions_total counts all of them
+                "interactions_count": {"$ifNull": ["$interactions_total", {"$size": {"$ifNull": ["$interactions", []]}}]},
+                "modifications_made": {"$size": {"$objectToArray": {"$ifNull": ["$confirmed_terms", {}]}}}
+            }},
+            {"$project": {
+                "original_contract_plain": 0,
+                "original_contract_markdown": 0,
+                "generated_markdown_from_docx": 0,
+                "aaoifi_context": 0,
+                "interactions": 0
+            }}
+        ])
         contracts = list(contracts_cursor)
 
         if not contracts:
@@ -82,16 +108,16 @@ def get_history():
 
         terms_cursor = terms_collection.find({"session_id": {"$in": session_ids}})
 
+        # Compliance counts are tallied while grouping, since the terms are loaded for the response anyway
         terms_by_session = {}
+        valid_terms_by_session = {}
         for term in terms_cursor:
             session_id = term["session_id"]
             if session_id not in terms_by_session:
                 terms_by_session[session_id] = []
-
-            if '_id' in term and isinstance(term['_id'], ObjectId):
-                term['_id'] = str(term['_id'])
-            if 'last_expert_feedback_id' in term and isinstance(term.get('last_expert_feedback_id'), ObjectId):
-                term['last_expert_feedback_id'] = str(term['last_expert_feedback_id'])
+                valid_terms_by_session[session_id] = 0
+            if term.get("is_valid_sharia") is True:
+                valid_terms_by_session[session_id] += 1
 
             terms_by_session[session_id].append(term)
 
@@ -101,28 +127,13 @@ def get_history():
             session_terms = terms_by_session.get(session_id, [])
 
             total_terms = len(session_terms)
-            valid_terms = sum(1 for term in session_terms if term.get("is_valid_sharia") is True)
+            valid_terms = valid_terms_by_session.get(session_id, 0)
             compliance_percentage = (valid_terms / total_terms * 100) if total_terms > 0 else 100
 
-            interactions_count = len(contract_doc.get("interactions", []))
-            modifications_made = len(contract_doc.get("confirmed_terms", {}))
+            interactions_count = contract_doc.pop("interactions_count", 0)
+            modifications_made = contract_doc.pop("modifications_made", 0)
             generated_contracts = bool(contract_doc.get("modified_contract_info") or contract_doc.get("marked_contract_info"))
 
-            if '_id' in contract_doc and isinstance(contract_doc['_id'], ObjectId):
-                contract_doc['_id'] = str(contract_doc['_id'])
-            if 'analysis_timestamp' in contract_doc and isinstance(contract_doc['analysis_timestamp'], datetime.datetime):
-                contract_doc['analysis_timestamp'] = contract_doc['analysis_timestamp'].isoformat()
-
-            for key, value in contract_doc.items():
-                if isinstance(value, datetime.datetime):
-                    contract_doc[key] = value.isoformat()
-                if isinstance(value, dict):
-                    for sub_key, sub_value in value.items():
-                        if isinstance(sub_value, datetime.datetime):
-                            value[sub_key] = sub_value.isoformat()
-                        if isinstance(sub_value, ObjectId):
-                            value[sub_key] = str(sub_value)
-
             enriched_session = {
                 **contract_doc,
                 "analysis_results": session_terms,
@@ -134,7 +145,8 @@ def get_history():
             history_results.append(enriched_session)
 
         logger.info(f"Retrieved history for {len(history_results)} sessions")
-        return jsonify(history_results)
+        # ObjectId and datetime values at any depth are converted while serializing
+        return json_response(history_results)
 
     except Exception as e:
         logger.error(f"Error retrieving session history: {e}")
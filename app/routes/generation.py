@@ -5,42 +5,79 @@ Contract generation and PDF preview endpoints.
 Matches OldStrcturePerfectProject/api_server.py exactly.
 """
 
+import io
 import os
 import re
-import json
+import hashlib
 import datetime
 import logging
-import tempfile
 import traceback
-import urllib.parse
 import requests
-from flask import Blueprint, request, jsonify, Response, current_app
-
-from app.services.database import get_contracts_collection, get_terms_collection
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import UpdateOne
+from flask import Blueprint, request, jsonify, redirect, current_app
+
+from app.services.database import (
+    get_contracts_collection, get_terms_collection, get_terms_metadata_collection, get_session_doc, invalidate_session_doc
+)
+from app.services.ai_service import send_text_to_remote_api
+from app.services.cloudinary_service import upload_to_cloudinary_helper, build_download_url
+from app.services.document_processor import convert_docx_to_pdf, create_docx_from_llm_markdown
+from app.utils.lru_cache import LRUTTLCache
+from app.utils.file_helpers import http_session, download_file_from_url, ensure_dir, clean_filename
+from app.utils import json_utils
+from app.utils.text_processing import term_sort_rank, generate_safe_public_id, apply_confirmed_terms_to_text
 
 logger = logging.getLogger(__name__)
 generation_bp = Blueprint('generation', __name__)
 
+# DOCX -> PDF conversion is slow and CPU heavy, so previews render on a small pool off the request thread
+_preview_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-preview")
+# In-flight and failed preview jobs keyed by (session_id, contract_type); failures are reported on the next poll
+_preview_jobs = LRUTTLCache(maxsize=256, ttl=3600)
+# Marked contract uploads and their session writes, keyed by session_id the same way
+_marked_upload_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="marked-upload")
+_marked_jobs = LRUTTLCache(maxsize=256, ttl=3600)
+
+
+_CLAUSE_RE = re.compile(r"clause_(\d+)")
+
 
 def sort_key_for_pdf_txt_terms(term):
     """Sort key for terms from PDF/TXT contracts."""
     term_id_str = term.get("term_id", "")
-    match = re.match(r"clause_(\d+)", term_id_str)
+    match = _CLAUSE_RE.match(term_id_str)
     if match:
         return int(match.group(1))
     return float('inf')
 
 
-def smart_sort_key(term):
-    """Smart sorting for terms - handles both para_ and clause_ formats."""
-    term_id = term.get("term_id", "")
-    if term_id.startswith("para_"):
-        parts = re.findall(r'[A-Za-z]+|\d+', term_id)
-        return tuple(int(p) if p.isdigit() else p for p in parts)
-    elif term_id.startswith("clause_"):
-        match = re.match(r"clause_(\d+)", term_id)
-        return ('clause', int(match.group(1))) if match else ('clause', float('inf'))
-    return ('z', float('inf'))
+def build_regeneration_cache_key(markdown_source: str, confirmed_terms: dict, contract_lang: str) -> str:
+    """Deterministic key for a modified contract: identical source, confirmed terms and language give identical output."""
+    digest = hashlib.sha256()
+    for part in (
+        markdown_source,
+        json_utils.dumps(confirmed_terms, sort_keys=True),
+        contract_lang
+    ):
+        encoded = part.encode('utf-8')
+        digest.update(len(encoded).to_bytes(8, 'big'))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+def cloudinary_assets_available(*cloudinary_infos) -> bool:
+    """Whether every stored Cloudinary asset still resolves, checked with a HEAD request."""
+    for info in cloudinary_infos:
+        if not info or not info.get("url"):
+            return False
+        try:
+            if http_session.head(info["url"], timeout=5, allow_redirects=True).status_code >= 400:
+                return False
+        except requests.exceptions.RequestException:
+            return False
+    return True
 
 
 @generation_bp.route('/generate_from_brief', methods=['POST'])
@@ -60,8 +97,6 @@ def generate_from_brief():
         return jsonify({"error": "Brief is required."}), 400
     
     try:
-        from app.services.ai_service import send_text_to_remote_api
-        
         generation_prompt = f"""
         Generate a Sharia-compliant contract based on the following brief:
         
@@ -106,63 +141,28 @@ def generate_from_brief():
         return jsonify({"error": "Internal server error during generation."}), 500
 
 
-@generation_bp.route('/preview_contract/<session_id>/<contract_type>', methods=['GET'])
-def preview_contract(session_id, contract_type):
-    """Generate PDF preview of contract."""
-    logger.info(f"Generating PDF preview for {contract_type} contract, session: {session_id}")
-
-    contracts_collection = get_contracts_collection()
-    if contracts_collection is None:
-        logger.error("Database service unavailable for PDF preview")
-        return jsonify({"error": "Database service unavailable."}), 503
-    
-    if contract_type not in ["modified", "marked"]:
-        logger.warning(f"Invalid contract type requested: {contract_type}")
-        return jsonify({"error": "Invalid contract type."}), 400
-
-    session_doc = contracts_collection.find_one({"_id": session_id})
-    if not session_doc:
-        logger.warning(f"Session not found for PDF preview: {session_id}")
-        return jsonify({"error": "Session not found."}), 404
-
+def render_pdf_preview(session_id: str, contract_type: str, source_docx_cloudinary_info: dict) -> dict:
+    """
+    Download the source DOCX, convert it to PDF, upload the PDF and record it on the session.
+    Returns the stored Cloudinary info; raises on any failure.
+    """
     cloudinary_base_folder = current_app.config.get('CLOUDINARY_BASE_FOLDER', 'shariaa_analyzer')
     pdf_previews_subfolder = current_app.config.get('CLOUDINARY_PDF_PREVIEWS_SUBFOLDER', 'pdf_previews')
     pdf_previews_cloudinary_folder = f"{cloudinary_base_folder}/{session_id}/{pdf_previews_subfolder}"
     temp_processing_folder = current_app.config.get('TEMP_PROCESSING_FOLDER', '/tmp/shariaa_temp')
     pdf_preview_folder = current_app.config.get('PDF_PREVIEW_FOLDER', '/tmp/pdf_previews')
 
-    existing_pdf_info = session_doc.get("pdf_preview_info", {}).get(contract_type)
-    if existing_pdf_info and existing_pdf_info.get("url"):
-        logger.info(f"Returning existing PDF preview URL for {contract_type}: {existing_pdf_info['url']}")
-        return jsonify({"pdf_url": existing_pdf_info["url"]})
-
-    source_docx_cloudinary_info = None
-    if contract_type == "modified":
-        source_docx_cloudinary_info = session_doc.get("modified_contract_info", {}).get("docx_cloudinary_info")
-    elif contract_type == "marked":
-        source_docx_cloudinary_info = session_doc.get("marked_contract_info", {}).get("docx_cloudinary_info")
-
-    if not source_docx_cloudinary_info or not source_docx_cloudinary_info.get("url"):
-        logger.warning(f"Source DOCX for {contract_type} contract not found on Cloudinary")
-        return jsonify({"error": f"Source DOCX for {contract_type} contract not found on Cloudinary."}), 404
-
     temp_source_docx_path = None
     temp_pdf_preview_path_local = None
-    
+
     try:
-        from app.utils.file_helpers import download_file_from_url, ensure_dir
-        from app.services.document_processor import convert_docx_to_pdf
-        from app.services.cloudinary_service import upload_to_cloudinary_helper
-        from app.utils.text_processing import generate_safe_public_id
-        
         ensure_dir(temp_processing_folder)
         ensure_dir(pdf_preview_folder)
         
         original_filename_for_suffix = source_docx_cloudinary_info.get("user_facing_filename", f"{contract_type}_contract.docx")
         temp_source_docx_path = download_file_from_url(source_docx_cloudinary_info["url"], original_filename_for_suffix, temp_processing_folder)
         if not temp_source_docx_path:
-            logger.error("Failed to download source DOCX for preview")
-            return jsonify({"error": "Failed to download source DOCX for preview."}), 500
+            raise Exception("Failed to download source DOCX for preview.")
 
         logger.info(f"Converting DOCX to PDF using LibreOffice, output folder: {pdf_preview_folder}")
         temp_pdf_preview_path_local = convert_docx_to_pdf(temp_source_docx_path, pdf_preview_folder)
@@ -186,8 +186,7 @@ def preview_contract(session_id, contract_type):
         logger.info(f"Cloudinary upload result for PDF preview: {pdf_upload_result}")
 
         if not pdf_upload_result or not pdf_upload_result.get("secure_url"):
-            logger.error(f"Failed to upload PDF preview to Cloudinary. Result: {pdf_upload_result}")
-            return jsonify({"error": "Failed to upload PDF preview to Cloudinary."}), 500
+            raise Exception("Failed to upload PDF preview to Cloudinary.")
 
         pdf_cloudinary_info = {
             "url": pdf_upload_result.get("secure_url"),
@@ -196,18 +195,13 @@ def preview_contract(session_id, contract_type):
             "user_facing_filename": f"{pdf_safe_public_id}.pdf"
         }
 
-        contracts_collection.update_one(
+        get_contracts_collection().update_one(
             {"_id": session_id},
             {"$set": {f"pdf_preview_info.{contract_type}": pdf_cloudinary_info}}
         )
+        invalidate_session_doc(session_id)
         logger.info(f"PDF preview for {contract_type} uploaded to Cloudinary: {pdf_cloudinary_info['url']}")
-
-        return jsonify({"pdf_url": pdf_cloudinary_info["url"]})
-
-    except Exception as e:
-        logger.error(f"Error during PDF preview for {contract_type} ({session_id}): {e}")
-        traceback.print_exc()
-        return jsonify({"error": f"Could not generate PDF preview: {str(e)}"}), 500
+        return pdf_cloudinary_info
     finally:
         if temp_source_docx_path and os.path.exists(temp_source_docx_path):
             os.remove(temp_source_docx_path)
@@ -217,6 +211,86 @@ def preview_contract(session_id, contract_type):
             logger.debug("Cleaned up temporary PDF file")
 
 
+def _render_pdf_preview_job(app, session_id: str, contract_type: str, source_docx_cloudinary_info: dict) -> dict:
+    with app.app_context():
+        try:
+            return render_pdf_preview(session_id, contract_type, source_docx_cloudinary_info)
+        except Exception as e:
+            logger.exception(f"Error during PDF preview for {contract_type} ({session_id}): {e}")
+            raise
+
+
+@generation_bp.route('/preview_contract/<session_id>/<contract_type>', methods=['GET'])
+def preview_contract(session_id, contract_type):
+    """
+    Generate PDF preview of contract.
+    Rendering runs in the background: the first call returns 202 and the client polls
+    the same URL until the stored preview URL is returned.
+    """
+    logger.info(f"Generating PDF preview for {contract_type} contract, session: {session_id}")
+
+    contracts_collection = get_contracts_collection()
+    if contracts_collection is None:
+        logger.error("Database service unavailable for PDF preview")
+        return jsonify({"error": "Database service unavailable."}), 503
+    
+    if contract_type not in ["modified", "marked"]:
+        logger.warning(f"Invalid contract type requested: {contract_type}")
+        return jsonify({"error": "Invalid contract type."}), 400
+
+    session_doc = get_session_doc(session_id)
+    if not session_doc:
+        logger.warning(f"Session not found for PDF preview: {session_id}")
+        return jsonify({"error": "Session not found."}), 404
+
+    existing_pdf_info = session_doc.get("pdf_preview_info", {}).get(contract_type)
+    if existing_pdf_info and existing_pdf_info.get("url"):
+        logger.info(f"Returning existing PDF preview URL for {contract_type}: {existing_pdf_info['url']}")
+        return jsonify({"pdf_url": existing_pdf_info["url"]})
+
+    source_docx_cloudinary_info = None
+    if contract_type == "modified":
+        source_docx_cloudinary_info = session_doc.get("modified_contract_info", {}).get("docx_cloudinary_info")
+    elif contract_type == "marked":
+        source_docx_cloudinary_info = session_doc.get("marked_contract_info", {}).get("docx_cloudinary_info")
+
+    if not source_docx_cloudinary_info or not source_docx_cloudinary_info.get("url"):
+        logger.warning(f"Source DOCX for {contract_type} contract not found on Cloudinary")
+        return jsonify({"error": f"Source DOCX for {contract_type} contract not found on Cloudinary."}), 404
+
+    if not current_app.config.get('ASYNC_PDF_PREVIEW', False):
+        try:
+            pdf_cloudinary_info = render_pdf_preview(session_id, contract_type, source_docx_cloudinary_info)
+            return jsonify({"pdf_url": pdf_cloudinary_info["url"]})
+        except Exception as e:
+            logger.error(f"Error during PDF preview for {contract_type} ({session_id}): {e}")
+            traceback.print_exc()
+            return jsonify({"error": f"Could not generate PDF preview: {str(e)}"}), 500
+
+    job_key = (session_id, contract_type)
+    with _preview_jobs.lock:
+        job = _preview_jobs.get(job_key)
+        if job is not None and job.done():
+            _preview_jobs.pop(job_key)
+            if job.exception() is not None:
+                return jsonify({"error": f"Could not generate PDF preview: {job.exception()}"}), 500
+            job = None
+        if job is None:
+            _preview_jobs[job_key] = _preview_executor.submit(
+                _render_pdf_preview_job,
+                current_app._get_current_object(),
+                session_id,
+                contract_type,
+                source_docx_cloudinary_info
+            )
+            logger.info(f"PDF preview rendering queued for {contract_type} contract, session: {session_id}")
+
+    return jsonify({
+        "status": "processing",
+        "poll_url": f"/preview_contract/{session_id}/{contract_type}"
+    }), 202
+
+
 @generation_bp.route('/download_pdf_preview/<session_id>/<contract_type>', methods=['GET'])
 def download_pdf_preview(session_id, contract_type):
     """Download PDF preview of contract."""
@@ -231,7 +305,7 @@ def download_pdf_preview(session_id, contract_type):
         logger.warning(f"Invalid contract type for download: {contract_type}")
         return jsonify({"error": "Invalid contract type."}), 400
 
-    session_doc = contracts_collection.find_one({"_id": session_id})
+    session_doc = get_session_doc(session_id)
     if not session_doc:
         logger.warning(f"Session not found for PDF download: {session_id}")
         return jsonify({"error": "Session not found."}), 404
@@ -244,35 +318,14 @@ def download_pdf_preview(session_id, contract_type):
     cloudinary_pdf_url = pdf_info["url"]
     user_facing_filename = pdf_info.get("user_facing_filename", f"{contract_type}_preview_{session_id[:8]}.pdf")
 
-    try:
-        from app.utils.file_helpers import clean_filename
-        
-        logger.info(f"Proxying PDF download from Cloudinary: {cloudinary_pdf_url}")
-        r = requests.get(cloudinary_pdf_url, stream=True, timeout=120)
-        r.raise_for_status()
-
-        safe_filename = clean_filename(user_facing_filename)
-        encoded_filename = urllib.parse.quote(safe_filename)
-
-        logger.info(f"PDF download successful for {contract_type} contract")
-        return Response(
-            r.iter_content(chunk_size=8192),
-            content_type='application/pdf',
-            headers={
-                'Content-Disposition': f'attachment; filename="{safe_filename}"; filename*=UTF-8\'\'{encoded_filename}',
-                'Content-Security-Policy': "default-src 'self'",
-                'X-Content-Type-Options': 'nosniff'
-            }
-        )
-    except requests.exceptions.HTTPError as http_err:
-        logger.error(f"HTTP error fetching PDF from Cloudinary: {http_err.response.status_code} - {http_err.response.text}")
-        return jsonify({"error": f"Cloudinary denied access to PDF (Status {http_err.response.status_code}). Check asset permissions."}), http_err.response.status_code if http_err.response.status_code >= 400 else 500
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching PDF from Cloudinary for download: {e}")
-        return jsonify({"error": "Could not fetch PDF from cloud storage."}), 500
-    except Exception as e:
-        logger.error(f"Unexpected error during PDF download proxy: {e}")
-        return jsonify({"error": "An unexpected error occurred during download."}), 500
+    # Redirect to the CDN instead of streaming the PDF through this worker
+    download_url = build_download_url(pdf_info.get("public_id"), clean_filename(user_facing_filename))
+    if not download_url:
+        logger.warning(f"Signed download URL unavailable for {contract_type} contract, redirecting to stored URL")
+        download_url = cloudinary_pdf_url
+
+    logger.info(f"Redirecting PDF download for {contract_type} contract to Cloudinary")
+    return redirect(download_url, code=302)
 
 
 @generation_bp.route('/generate_modified_contract', methods=['POST'])
@@ -290,7 +343,17 @@ def generate_modified_contract():
         logger.warning("No session ID provided for contract generation")
         return jsonify({"error": "No session"}), 400
 
-    session_doc = contracts_collection.find_one({"_id": session_id})
+    session_doc = contracts_collection.find_one(
+        {"_id": session_id},
+        {
+            "original_filename": 1,
+            "detected_contract_language": 1,
+            "confirmed_terms": 1,
+            "generated_markdown_from_docx": 1,
+            "original_contract_markdown": 1,
+            "aaoifi_context": 1
+        }
+    )
     if not session_doc:
         logger.warning(f"Session not found for contract generation: {session_id}")
         return jsonify({"error": "Session not found"}), 404
@@ -313,17 +376,35 @@ def generate_modified_contract():
     else:
         logger.info("No AAOIFI context found in session, proceeding without context")
 
+    # Identical inputs were already rendered, for this or another session: reuse the uploaded files
+    regeneration_cache_key = build_regeneration_cache_key(markdown_source, confirmed_terms, contract_lang)
+    cached_doc = contracts_collection.find_one(
+        {"regeneration_cache_key": regeneration_cache_key, "modified_contract_info": {"$ne": None}},
+        {"modified_contract_info": 1}
+    )
+    if cached_doc:
+        cached_info = cached_doc["modified_contract_info"]
+        docx_info = cached_info.get("docx_cloudinary_info")
+        txt_info = cached_info.get("txt_cloudinary_info")
+        if cloudinary_assets_available(docx_info, txt_info):
+            if cached_doc["_id"] != session_id:
+                contracts_collection.update_one(
+                    {"_id": session_id},
+                    {"$set": {"modified_contract_info": cached_info, "regeneration_cache_key": regeneration_cache_key}}
+                )
+                invalidate_session_doc(session_id)
+            logger.info(f"Reusing modified contract generated for session {cached_doc['_id']}")
+            return jsonify({
+                "success": True,
+                "message": "Modified contract generated.",
+                "modified_docx_cloudinary_url": docx_info.get("url"),
+                "modified_txt_cloudinary_url": txt_info.get("url")
+            })
+        logger.info("Cached modified contract files no longer resolve, regenerating")
+
     cloudinary_base_folder = current_app.config.get('CLOUDINARY_BASE_FOLDER', 'shariaa_analyzer')
     modified_contracts_subfolder = current_app.config.get('CLOUDINARY_MODIFIED_CONTRACTS_SUBFOLDER', 'modified_contracts')
     modified_contracts_cloudinary_folder = f"{cloudinary_base_folder}/{session_id}/{modified_contracts_subfolder}"
-    temp_processing_folder = current_app.config.get('TEMP_PROCESSING_FOLDER', '/tmp/shariaa_temp')
-    
-    from app.utils.file_helpers import clean_filename, ensure_dir
-    from app.utils.text_processing import generate_safe_public_id, apply_confirmed_terms_to_text
-    from app.services.document_processor import create_docx_from_llm_markdown
-    from app.services.cloudinary_service import upload_to_cloudinary_helper
-    
-    ensure_dir(temp_processing_folder)
     
     user_facing_base, _ = os.path.splitext(original_filename_from_db)
     user_facing_clean_base = clean_filename(user_facing_base) or "contract"
@@ -331,18 +412,10 @@ def generate_modified_contract():
     docx_safe_public_id = generate_safe_public_id(user_facing_clean_base, "modified")
     txt_safe_public_id = generate_safe_public_id(user_facing_clean_base, "modified_txt")
 
-    temp_modified_docx_path = None
-    temp_modified_txt_path = None
-
     final_docx_cloudinary_info = None
     final_txt_cloudinary_info = None
 
     try:
-        temp_modified_docx_fd, temp_modified_docx_path = tempfile.mkstemp(suffix=".docx", prefix="mod_docx_", dir=temp_processing_folder)
-        os.close(temp_modified_docx_fd)
-        temp_modified_txt_fd, temp_modified_txt_path = tempfile.mkstemp(suffix=".txt", prefix="mod_txt_", dir=temp_processing_folder)
-        os.close(temp_modified_txt_fd)
-
         try:
             logger.info("Reconstructing contract with confirmed modifications")
 
@@ -382,17 +455,17 @@ def generate_modified_contract():
             raise ValueError("Contract reconstruction failed")
 
         logger.info("Creating DOCX and TXT versions of modified contract")
-        create_docx_from_llm_markdown(final_text_content_for_output, temp_modified_docx_path, contract_lang)
-
-        with open(temp_modified_txt_path, "w", encoding="utf-8") as f:
-            f.write(final_text_content_for_output)
+        # Both files are small, so they are built and uploaded from memory
+        modified_docx_buffer = io.BytesIO()
+        create_docx_from_llm_markdown(final_text_content_for_output, modified_docx_buffer, contract_lang)
 
         logger.info("Uploading modified contract files to Cloudinary")
         docx_upload_res = upload_to_cloudinary_helper(
-            temp_modified_docx_path,
+            modified_docx_buffer.getvalue(),
             modified_contracts_cloudinary_folder,
             public_id_prefix="modified",
-            custom_public_id=docx_safe_public_id
+            custom_public_id=docx_safe_public_id,
+            filename=f"{docx_safe_public_id}.docx"
         )
         if docx_upload_res:
             final_docx_cloudinary_info = {
@@ -404,11 +477,12 @@ def generate_modified_contract():
             logger.info(f"Modified DOCX uploaded: {final_docx_cloudinary_info['url']}")
 
         txt_upload_res = upload_to_cloudinary_helper(
-            temp_modified_txt_path,
+            final_text_content_for_output.encode("utf-8"),
             modified_contracts_cloudinary_folder,
             resource_type="raw",
             public_id_prefix="modified_txt",
-            custom_public_id=txt_safe_public_id
+            custom_public_id=txt_safe_public_id,
+            filename=f"{txt_safe_public_id}.txt"
         )
         if txt_upload_res:
             final_txt_cloudinary_info = {
@@ -426,9 +500,12 @@ def generate_modified_contract():
                     "docx_cloudinary_info": final_docx_cloudinary_info,
                     "txt_cloudinary_info": final_txt_cloudinary_info,
                     "generation_timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
-                }
+                },
+                # Only complete uploads are worth reusing
+                "regeneration_cache_key": regeneration_cache_key if final_docx_cloudinary_info and final_txt_cloudinary_info else None
             }}
         )
+        invalidate_session_doc(session_id)
 
         logger.info(f"Modified contract generated successfully for session: {session_id}")
         return jsonify({
@@ -441,18 +518,67 @@ def generate_modified_contract():
         logger.error(f"Failed to generate modified contract for session {session_id}: {e}")
         traceback.print_exc()
         return jsonify({"error": f"Failed: {str(e)}"}), 500
-    finally:
-        if temp_modified_docx_path and os.path.exists(temp_modified_docx_path):
-            os.remove(temp_modified_docx_path)
-            logger.debug("Cleaned up temporary modified DOCX file")
-        if temp_modified_txt_path and os.path.exists(temp_modified_txt_path):
-            os.remove(temp_modified_txt_path)
-            logger.debug("Cleaned up temporary modified TXT file")
+
+
+def store_marked_contract(session_id: str, docx_bytes: bytes, marked_docx_safe_public_id: str) -> dict | None:
+    """
+    Upload a rendered marked DOCX and record it on the session.
+    Returns the stored Cloudinary info, or None when the upload failed.
+    """
+    cloudinary_base_folder = current_app.config.get('CLOUDINARY_BASE_FOLDER', 'shariaa_analyzer')
+    marked_contracts_subfolder = current_app.config.get('CLOUDINARY_MARKED_CONTRACTS_SUBFOLDER', 'marked_contracts')
+    marked_contracts_cloudinary_folder = f"{cloudinary_base_folder}/{session_id}/{marked_contracts_subfolder}"
+
+    logger.info("Uploading marked contract to Cloudinary")
+    final_marked_docx_cloudinary_info = None
+    marked_upload_res = upload_to_cloudinary_helper(
+        docx_bytes,
+        marked_contracts_cloudinary_folder,
+        public_id_prefix="marked",
+        custom_public_id=marked_docx_safe_public_id,
+        filename=f"{marked_docx_safe_public_id}.docx"
+    )
+    if marked_upload_res:
+        final_marked_docx_cloudinary_info = {
+            "url": marked_upload_res.get("secure_url"),
+            "public_id": marked_upload_res.get("public_id"),
+            "format": "docx",
+            "user_facing_filename": f"{marked_docx_safe_public_id}.docx"
+        }
+        logger.info(f"Marked contract uploaded: {final_marked_docx_cloudinary_info['url']}")
+
+    get_contracts_collection().update_one(
+        {"_id": session_id},
+        {"$set": {
+            "marked_contract_info": {
+                "docx_cloudinary_info": final_marked_docx_cloudinary_info,
+                "generation_timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
+             },
+            # A failed upload is reported as such by /marked_status rather than as never generated
+            "marked_contract_status": "completed" if final_marked_docx_cloudinary_info else "failed"
+        }}
+    )
+    invalidate_session_doc(session_id)
+    return final_marked_docx_cloudinary_info
+
+
+def _store_marked_contract_job(app, session_id: str, docx_bytes: bytes, marked_docx_safe_public_id: str) -> dict | None:
+    with app.app_context():
+        try:
+            return store_marked_contract(session_id, docx_bytes, marked_docx_safe_public_id)
+        except Exception as e:
+            logger.exception(f"Failed to store marked contract for session {session_id}: {e}")
+            get_contracts_collection().update_one({"_id": session_id}, {"$set": {"marked_contract_status": "failed"}})
+            raise
 
 
 @generation_bp.route('/generate_marked_contract', methods=['POST'])
 def generate_marked_contract():
-    """Generate marked contract with highlighted terms."""
+    """
+    Generate marked contract with highlighted terms.
+    The DOCX is rendered in the request; its upload and the session update run in the
+    background, so the call returns 202 and the client polls /marked_status/<session_id>.
+    """
     session_id = request.cookies.get("session_id") or (request.is_json and request.get_json().get("session_id"))
     logger.info(f"Generating marked contract for session: {session_id}")
 
@@ -467,7 +593,16 @@ def generate_marked_contract():
         logger.warning("No session ID provided for marked contract generation")
         return jsonify({"error": "No session"}), 400
 
-    session_doc = contracts_collection.find_one({"_id": session_id})
+    session_doc = contracts_collection.find_one(
+        {"_id": session_id},
+        {
+            "original_filename": 1,
+            "detected_contract_language": 1,
+            "confirmed_terms": 1,
+            "generated_markdown_from_docx": 1,
+            "original_contract_markdown": 1
+        }
+    )
     if not session_doc:
         logger.warning(f"Session not found for marked contract generation: {session_id}")
         return jsonify({"error": "Session not found"}), 404
@@ -480,7 +615,8 @@ def generate_marked_contract():
         logger.error("Contract source text (markdown) not found for marked contract generation")
         return jsonify({"error": "Contract source text (markdown) not found for generation."}), 500
 
-    db_terms_list = list(terms_collection.find({"session_id": session_id}))
+    # Terms carry a precomputed sort_rank, so MongoDB returns them in contract order
+    db_terms_list = list(terms_collection.find({"session_id": session_id}).sort("sort_rank", 1))
     logger.info(f"Found {len(db_terms_list)} terms for marking")
     
     # Merge confirmed_terms from session with db_terms for proper highlighting
@@ -496,64 +632,57 @@ def generate_marked_contract():
                 term["confirmed_modified_text"] = confirmed_data.get("confirmed_text", "")
                 logger.debug(f"Merged confirmed modification for term {term_id}")
 
-    cloudinary_base_folder = current_app.config.get('CLOUDINARY_BASE_FOLDER', 'shariaa_analyzer')
-    marked_contracts_subfolder = current_app.config.get('CLOUDINARY_MARKED_CONTRACTS_SUBFOLDER', 'marked_contracts')
-    marked_contracts_cloudinary_folder = f"{cloudinary_base_folder}/{session_id}/{marked_contracts_subfolder}"
-    temp_processing_folder = current_app.config.get('TEMP_PROCESSING_FOLDER', '/tmp/shariaa_temp')
-    
-    from app.utils.file_helpers import clean_filename, ensure_dir
-    from app.utils.text_processing import generate_safe_public_id
-    from app.services.document_processor import create_docx_from_llm_markdown
-    from app.services.cloudinary_service import upload_to_cloudinary_helper
-    
-    ensure_dir(temp_processing_folder)
-    
     user_facing_base, _ = os.path.splitext(original_filename_from_db)
     user_facing_clean_base = clean_filename(user_facing_base) or "contract"
     marked_docx_safe_public_id = generate_safe_public_id(user_facing_clean_base, "marked")
 
-    temp_marked_docx_path = None
-    final_marked_docx_cloudinary_info = None
-
     try:
-        temp_marked_docx_fd, temp_marked_docx_path = tempfile.mkstemp(suffix=".docx", prefix="marked_", dir=temp_processing_folder)
-        os.close(temp_marked_docx_fd)
-
-        sorted_db_terms = sorted(db_terms_list, key=smart_sort_key)
+        unranked_terms = [term for term in db_terms_list if "sort_rank" not in term]
+        if not unranked_terms:
+            sorted_db_terms = db_terms_list
+        else:
+            # Sessions analysed before sort_rank was stored: rank them once, sort on the integer keys
+            # and store the ranks so later requests get the terms ordered by MongoDB
+            for term in unranked_terms:
+                term["sort_rank"] = term_sort_rank(term.get("term_id"))
+            sorted_db_terms = sorted(db_terms_list, key=itemgetter("sort_rank"))
+            try:
+                get_terms_metadata_collection().bulk_write(
+                    [UpdateOne({"_id": term["_id"]}, {"$set": {"sort_rank": term["sort_rank"]}}) for term in unranked_terms],
+                    ordered=False
+                )
+            except Exception as e:
+                logger.warning(f"Could not store sort_rank for {len(unranked_terms)} terms: {e}")
         logger.info(f"Sorted {len(sorted_db_terms)} terms for marking")
 
         logger.info("Creating marked DOCX from markdown with term highlighting")
+        marked_docx_buffer = io.BytesIO()
         create_docx_from_llm_markdown(
             markdown_source,
-            temp_marked_docx_path,
+            marked_docx_buffer,
             contract_lang,
             terms_for_marking=sorted_db_terms
         )
 
-        logger.info("Uploading marked contract to Cloudinary")
-        marked_upload_res = upload_to_cloudinary_helper(
-            temp_marked_docx_path,
-            marked_contracts_cloudinary_folder,
-            public_id_prefix="marked",
-            custom_public_id=marked_docx_safe_public_id
-        )
-        if marked_upload_res:
-            final_marked_docx_cloudinary_info = {
-                "url": marked_upload_res.get("secure_url"),
-                "public_id": marked_upload_res.get("public_id"),
-                "format": "docx",
-                "user_facing_filename": f"{marked_docx_safe_public_id}.docx"
-            }
-            logger.info(f"Marked contract uploaded: {final_marked_docx_cloudinary_info['url']}")
-
-        contracts_collection.update_one(
-            {"_id": session_id},
-            {"$set": {
-                "marked_contract_info": {
-                    "docx_cloudinary_info": final_marked_docx_cloudinary_info,
-                    "generation_timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
-                 }
-            }}
+        if current_app.config.get('ASYNC_MARKED_CONTRACT', False):
+            # Other workers answer status polls from this field until the job records its result
+            contracts_collection.update_one({"_id": session_id}, {"$set": {"marked_contract_status": "processing"}})
+            _marked_jobs[session_id] = _marked_upload_executor.submit(
+                _store_marked_contract_job,
+                current_app._get_current_object(),
+                session_id,
+                marked_docx_buffer.getvalue(),
+                marked_docx_safe_public_id
+            )
+            logger.info(f"Marked contract upload queued for session: {session_id}")
+            return jsonify({
+                "job_id": session_id,
+                "status": "processing",
+                "poll_url": f"/marked_status/{session_id}"
+            }), 202
+
+        final_marked_docx_cloudinary_info = store_marked_contract(
+            session_id, marked_docx_buffer.getvalue(), marked_docx_safe_public_id
         )
 
         logger.info(f"Marked contract generated successfully for session: {session_id}")
@@ -566,7 +695,47 @@ def generate_marked_contract():
         logger.error(f"Failed to generate marked contract for session {session_id}: {e}")
         traceback.print_exc()
         return jsonify({"error": f"Failed: {str(e)}"}), 500
-    finally:
-        if temp_marked_docx_path and os.path.exists(temp_marked_docx_path):
-            os.remove(temp_marked_docx_path)
-            logger.debug("Cleaned up temporary marked DOCX file")
+
+
+@generation_bp.route('/marked_status/<session_id>', methods=['GET'])
+def marked_status(session_id):
+    """Poll a marked contract queued by /generate_marked_contract."""
+    job = _marked_jobs.get(session_id)
+    if job is not None:
+        if not job.done():
+            return jsonify({"job_id": session_id, "status": "processing"}), 202
+        _marked_jobs.pop(session_id)
+        if job.exception() is not None:
+            return jsonify({"error": f"Failed: {job.exception()}"}), 500
+        marked_info = job.result()
+        return jsonify({
+            "success": True,
+            "message": "Marked contract generated.",
+            "marked_docx_cloudinary_url": marked_info.get("url") if marked_info else None
+        })
+
+    contracts_collection = get_contracts_collection()
+    if contracts_collection is None:
+        logger.error("Database service unavailable for marked contract status")
+        return jsonify({"error": "Database service unavailable."}), 503
+
+    # Queued by another worker, or finished before this poll
+    session_doc = contracts_collection.find_one(
+        {"_id": session_id},
+        {"marked_contract_status": 1, "marked_contract_info": 1}
+    )
+    if not session_doc:
+        return jsonify({"error": "Session not found"}), 404
+    status = session_doc.get("marked_contract_status")
+    if status == "processing":
+        return jsonify({"job_id": session_id, "status": "processing"}), 202
+    if status == "failed":
+        return jsonify({"error": "Failed: marked contract upload did not complete."}), 500
+    marked_info = (session_doc.get("marked_contract_info") or {}).get("docx_cloudinary_info")
+    if not marked_info:
+        return jsonify({"error": "Marked contract has not been generated."}), 404
+    return jsonify({
+        "success": True,
+        "message": "Marked contract generated.",
+        "marked_docx_cloudinary_url": marked_info.get("url")
+    })
@@ -4,18 +4,54 @@ Interaction Routes
 User interaction and consultation endpoints.
 """
 
-import json
 import datetime
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 
 # Import services
-from app.services.database import get_contracts_collection, get_terms_collection
+from app.services.database import (
+    get_contracts_collection, get_terms_collection, get_terms_metadata_collection, get_interactions_collection,
+    invalidate_session_doc
+)
+from app.services.ai_service import get_chat_session, split_system_prompt
+from app.utils.text_processing import get_contract_plain_text, clean_model_response
+from app.utils import json_utils
+from config.default import DefaultConfig
 
 logger = logging.getLogger(__name__)
 interaction_bp = Blueprint('interaction', __name__)
 
 
+def _record_interaction(contracts_collection, session_id, question, answer, term_id=None):
+    """
+    Append a completed question/answer turn to the session.
+    The session keeps the latest INTERACTIONS_INLINE_LIMIT turns and a running total, so its
+    document stays small; every turn is also logged to the interactions collection.
+    """
+    interaction = {
+        "question": question,
+        "answer": answer,
+        "term_id": term_id,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
+    }
+    try:
+        interactions_collection = get_interactions_collection()
+        if interactions_collection is not None:
+            interactions_collection.insert_one({"session_id": session_id, **interaction})
+        contracts_collection.update_one(
+            {"_id": session_id},
+            {
+                "$push": {"interactions": {
+                    "$each": [interaction],
+                    "$slice": -current_app.config.get('INTERACTIONS_INLINE_LIMIT', 50)
+                }},
+                "$inc": {"interactions_total": 1}
+            }
+        )
+    except Exception as e:
+        logger.warning(f"Could not record interaction for session {session_id}: {e}")
+
+
 @interaction_bp.route('/interact', methods=['POST'])
 def interact():
     """Interactive consultation."""
@@ -38,6 +74,7 @@ def interact():
         return jsonify({"error": "الرجاء إرسال سؤال في صيغة JSON"}), 400
     
     user_question = interaction_data.get("question")
+    stream_requested = interaction_data.get("stream") is True
     term_id_context = interaction_data.get("term_id")
     term_text_context = interaction_data.get("term_text")
     
@@ -50,17 +87,16 @@ def interact():
         return jsonify({"error": "لم يتم العثور على جلسة. يرجى تحميل العقد أولاً."}), 400
     
     try:
-        session_doc = contracts_collection.find_one({"_id": session_id})
+        session_doc = contracts_collection.find_one(
+            {"_id": session_id},
+            {"detected_contract_language": 1, "analysis_type": 1, "aaoifi_context": 1}
+        )
         if not session_doc:
             logger.warning(f"Session not found for interaction: {session_id}")
             return jsonify({"error": "الجلسة غير موجودة أو منتهية الصلاحية"}), 404
         
         contract_lang = session_doc.get("detected_contract_language", "ar")
         
-        # Import AI service
-        from app.services.ai_service import get_chat_session
-        from config.default import DefaultConfig
-        
         # Get analysis type from session (already fetched above)
         analysis_type = session_doc.get("analysis_type", "sharia")
             
@@ -74,14 +110,10 @@ def interact():
         else:
             logger.info("No AAOIFI context found in session, proceeding without context")
         
-        try:
-            formatted_interaction_prompt = interaction_prompt.format(output_language=contract_lang, aaoifi_context=aaoifi_context)
-        except KeyError as ke:
-            logger.warning(f"KeyError formatting INTERACTION_PROMPT: {ke}. Using default language 'ar'")
-            formatted_interaction_prompt = interaction_prompt.format(output_language='ar', aaoifi_context=aaoifi_context or "")
-        
-        # Get contract context
-        full_contract_context = session_doc.get("original_contract_plain", session_doc.get("original_contract_markdown", ""))
+        # The instruction stays identical across sessions so its context cache is shared
+        formatted_interaction_prompt, interaction_prompt_context = split_system_prompt(
+            interaction_prompt, output_language=contract_lang, aaoifi_context=aaoifi_context
+        )
         
         initial_analysis_summary_str = ""
         if term_id_context:
@@ -97,9 +129,6 @@ def interact():
         
         # Build full context for LLM
         full_prompt_context = f"""
-        === سياق العقد ===
-        {full_contract_context[:2000]}  # Limit context size
-        
         === تحليل البند المحدد ===
         {initial_analysis_summary_str}
         
@@ -109,6 +138,42 @@ def interact():
         
         # Get chat session and send question
         chat = get_chat_session(f"{session_id}_interaction", system_instruction=formatted_interaction_prompt)
+        if not chat.get_history():
+            # The contract and session values go with the first question only. Later turns carry them
+            # in the chat history, an unchanged prefix that Gemini's implicit caching can reuse.
+            contract_doc = contracts_collection.find_one(
+                {"_id": session_id},
+                {"original_contract_plain": 1, "original_contract_markdown": 1}
+            ) or {}
+            contract_context = get_contract_plain_text(contract_doc)[:2000]  # Limit context size
+            full_prompt_context = f"""{interaction_prompt_context}
+        
+        === سياق العقد ===
+        {contract_context}
+        {full_prompt_context}"""
+        
+        if stream_requested:
+            # Server-sent events: forward answer chunks as they arrive instead of waiting for the full text
+            def generate_answer_events():
+                answer_parts = []
+                try:
+                    for chunk in chat.send_message_stream(full_prompt_context):
+                        if chunk.text:
+                            answer_parts.append(chunk.text)
+                            yield f"data: {json_utils.dumps({'delta': chunk.text})}\n\n"
+                    _record_interaction(contracts_collection, session_id, user_question,
+                                        clean_model_response("".join(answer_parts)), term_id_context)
+                    yield f"data: {json_utils.dumps({'done': True, 'session_id': session_id, 'term_id': term_id_context, 'contract_language': contract_lang})}\n\n"
+                except Exception as stream_error:
+                    logger.error(f"Error streaming interaction for session {session_id}: {stream_error}")
+                    yield f"event: error\ndata: {json_utils.dumps({'error': 'حدث خطأ أثناء معالجة السؤال. حاول مرة أخرى.'})}\n\n"
+            
+            return Response(
+                stream_with_context(generate_answer_events()),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
         response = chat.send_message(full_prompt_context)
         
         if not response or not response.text:
@@ -120,8 +185,8 @@ def interact():
             return jsonify({"error": f"محتوى محظور: {response.text}"}), 400
         
         # Clean response
-        from app.utils.text_processing import clean_model_response
         cleaned_response = clean_model_response(response.text)
+        _record_interaction(contracts_collection, session_id, user_question, cleaned_response, term_id_context)
         
         logger.info(f"Interaction processed successfully for session: {session_id}")
         
@@ -159,6 +224,7 @@ def review_modification():
     
     data = request.get_json()
     session_id = request.cookies.get("session_id") or data.get("session_id")
+    stream_requested = data.get("stream") is True
     term_id = data.get("term_id")
     user_modified_text = data.get("user_modified_text")
     original_term_text = data.get("original_term_text")
@@ -170,17 +236,16 @@ def review_modification():
         return jsonify({"error": "بيانات ناقصة"}), 400
     
     try:
-        session_doc = contracts_collection.find_one({"_id": session_id})
+        session_doc = contracts_collection.find_one(
+            {"_id": session_id},
+            {"detected_contract_language": 1, "analysis_type": 1, "aaoifi_context": 1}
+        )
         if not session_doc:
             logger.warning(f"Session not found for review modification: {session_id}")
             return jsonify({"error": "الجلسة غير موجودة"}), 404
         
         contract_lang = session_doc.get("detected_contract_language", "ar")
         
-        # Import AI service
-        from app.services.ai_service import get_chat_session
-        from config.default import DefaultConfig
-        
         # Get analysis type from session (already fetched above)
         analysis_type = session_doc.get("analysis_type", "sharia")
             
@@ -194,21 +259,51 @@ def review_modification():
         else:
             logger.info("No AAOIFI context found in session, proceeding without context")
         
-        try:
-            formatted_review_prompt = review_prompt.format(output_language=contract_lang, aaoifi_context=aaoifi_context)
-        except KeyError as ke:
-            logger.error(f"KeyError in REVIEW_MODIFICATION_PROMPT: {ke}")
-            return jsonify({"error": f"Prompt format error: {ke}"}), 500
+        formatted_review_prompt, review_prompt_context = split_system_prompt(
+            review_prompt, output_language=contract_lang, aaoifi_context=aaoifi_context
+        )
         
         # Create review payload
-        review_payload = json.dumps({
+        review_payload = json_utils.dumps({
             "original_term_text": original_term_text,
             "user_modified_text": user_modified_text
-        }, ensure_ascii=False, indent=2)
+        }, indent=True)
+        review_payload = f"{review_prompt_context}\n\n{review_payload}"
         
         # Send to AI service
         logger.info("Sending modification review to AI service")
-        chat = get_chat_session(f"{session_id}_review_{term_id}", system_instruction=formatted_review_prompt, force_new=True)
+        # Each review is a single turn: no history to keep, and the shared instruction keeps its context cache.
+        # JSON mode returns the review object bare, without the markdown fence the prompt examples show
+        chat = get_chat_session(
+            f"{session_id}_review_{term_id}",
+            system_instruction=formatted_review_prompt,
+            reuse=False,
+            response_mime_type="application/json"
+        )
+        
+        if stream_requested:
+            # Forward the review as it is generated; the cleaned result is sent once complete
+            def generate_review_events():
+                review_parts = []
+                try:
+                    for chunk in chat.send_message_stream(review_payload):
+                        if chunk.text:
+                            review_parts.append(chunk.text)
+                            yield f"data: {json_utils.dumps({'delta': chunk.text})}\n\n"
+                    review_text = "".join(review_parts)
+                    if not review_text:
+                        raise ValueError("Empty response from AI service for review")
+                    yield f"data: {json_utils.dumps({'done': True, 'review_result': clean_model_response(review_text), 'session_id': session_id, 'term_id': term_id, 'contract_language': contract_lang})}\n\n"
+                except Exception as stream_error:
+                    logger.error(f"Error streaming modification review for session {session_id}: {stream_error}")
+                    yield f"event: error\ndata: {json_utils.dumps({'error': 'حدث خطأ أثناء مراجعة التعديل. حاول مرة أخرى.'})}\n\n"
+            
+            return Response(
+                stream_with_context(generate_review_events()),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
         response = chat.send_message(review_payload)
         
         if not response or not response.text:
@@ -220,7 +315,6 @@ def review_modification():
             return jsonify({"error": f"محتوى محظور: {response.text}"}), 400
         
         # Clean response
-        from app.utils.text_processing import clean_model_response
         cleaned_response = clean_model_response(response.text)
         
         logger.info(f"Modification review completed for session: {session_id}, term: {term_id}")
@@ -264,42 +358,36 @@ def confirm_modification():
         logger.warning("Incomplete data for confirm modification")
         return jsonify({"error": "البيانات المطلوبة غير مكتملة"}), 400
     
+    # The term id becomes a field path below, so it cannot contain path syntax
+    if "." in str(term_id) or str(term_id).startswith("$"):
+        logger.warning(f"Invalid term id for confirm modification: {term_id}")
+        return jsonify({"error": "معرف البند غير صالح"}), 400
+    
     try:
-        session_doc = contracts_collection.find_one({"_id": session_id})
-        if not session_doc:
-            logger.warning(f"Session not found for confirm modification: {session_id}")
-            return jsonify({"error": "الجلسة غير موجودة"}), 404
-        
-        # Update confirmed terms in session
-        updated_confirmed_terms = session_doc.get("confirmed_terms", {})
-        
-        # Get original term text
-        term_doc = terms_collection.find_one({"session_id": session_id, "term_id": term_id})
-        if term_doc:
-            updated_confirmed_terms[str(term_id)] = {
-                "original_text": term_doc.get("term_text", ""),
-                "confirmed_text": modified_text
-            }
-        else:
-            logger.warning(f"Original term not found in DB for confirmation: {term_id}")
-            updated_confirmed_terms[str(term_id)] = {
-                "original_text": "",
-                "confirmed_text": modified_text
-            }
-        
-        # Update database
-        contracts_collection.update_one(
-            {"_id": session_id},
-            {"$set": {"confirmed_terms": updated_confirmed_terms}}
-        )
-        
-        terms_collection.update_one(
+        # Mark the term and read its original text in the same round trip
+        term_doc = get_terms_metadata_collection().find_one_and_update(
             {"session_id": session_id, "term_id": term_id},
             {"$set": {
                 "is_confirmed_by_user": True,
                 "confirmed_modified_text": modified_text,
-            }}
+            }},
+            projection={"term_text": 1}
+        )
+        if not term_doc:
+            logger.warning(f"Original term not found in DB for confirmation: {term_id}")
+        
+        # Set only this term's entry, so concurrent confirmations in the session do not overwrite each other
+        result = contracts_collection.update_one(
+            {"_id": session_id},
+            {"$set": {f"confirmed_terms.{term_id}": {
+                "original_text": term_doc.get("term_text", "") if term_doc else "",
+                "confirmed_text": modified_text
+            }}}
         )
+        if result.matched_count == 0:
+            logger.warning(f"Session not found for confirm modification: {session_id}")
+            return jsonify({"error": "الجلسة غير موجودة"}), 404
+        invalidate_session_doc(session_id)
         
         logger.info(f"Modification confirmed for session {session_id}, term {term_id}")
         return jsonify({
@@ -3,41 +3,111 @@ AI Service for Google Generative AI integration.
 Refactored to use the new google-genai SDK while maintaining compatibility with old patterns.
 """
 
+import io
+import os
+import mmap
+import random
+import hashlib
+import string
 import pathlib
+import functools
 import time
-import traceback
-import json
+import threading
 import logging
+import httpx
 from flask import current_app
 from google import genai
 from google.genai import types
+from google.genai import errors as genai_errors
+from app.services.response_cache import get_response_cache, get_semantic_cache, ResponseCache
 from app.utils.logging_utils import get_request_tracer
+from app.utils.lru_cache import LRUTTLCache
+from app.utils import json_utils
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import h2  # noqa: F401 - enables HTTP/2 in httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    from pypdf import PdfReader, PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    fitz = None
+    PYMUPDF_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
-chat_sessions = {}
+_ai_service_initialized = False
+_ai_service_init_lock = threading.Lock()
+# Bounded so long-running workers do not accumulate chat histories; sized from config in init_ai_service
+chat_sessions = LRUTTLCache(maxsize=512, ttl=3600)
+# One GenAI client per API key, shared across requests so its HTTP connection pool is reused
 _clients = {}
+_clients_lock = threading.Lock()
+# Explicit context caches keyed by model and prompt; an empty name records a prompt that could not be cached
+_context_caches = LRUTTLCache(maxsize=64, ttl=3600 - 300)
+# Files API uploads keyed by content digest; Gemini keeps uploads for 48 hours
+_uploaded_files = LRUTTLCache(maxsize=256, ttl=46 * 3600)
+
+# Contract text routinely mentions penalties, disputes and the like; the analysis must not be filtered
+SAFETY_SETTINGS = [
+    types.SafetySetting(category=category, threshold="BLOCK_NONE")
+    for category in (
+        "HARM_CATEGORY_HARASSMENT",
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_DANGEROUS_CONTENT",
+    )
+]
 
-def init_ai_service(app):
-    """Initialize AI service with configuration."""
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+MAX_RETRY_DELAY = 30
+
+def init_ai_service(app, warm_up: bool = True):
+    """
+    Initialize AI service with configuration.
+    warm_up opens the GenAI connection in the background; pointless when a request is about to use it.
+    """
+    global _ai_service_initialized
     try:
+        chat_sessions.maxsize = app.config.get('CHAT_SESSION_CACHE_SIZE', 512)
+        chat_sessions.ttl = app.config.get('CHAT_SESSION_TTL_SECONDS', 3600)
+        # Forget cache handles a few minutes before Gemini expires them
+        _context_caches.ttl = max(60, app.config.get('CONTEXT_CACHE_TTL_SECONDS', 3600) - 300)
+
         gemini_api_key = app.config.get('GEMINI_API_KEY')
         gemini_file_search_key = app.config.get('GEMINI_FILE_SEARCH_API_KEY')
         
         if not gemini_api_key:
             logger.warning("GEMINI_API_KEY not configured - AI analysis services will be unavailable")
         else:
-            logger.info(f"GEMINI_API_KEY configured: {mask_key(gemini_api_key)}")
+            logger.info("GEMINI_API_KEY configured: %s", mask_key(gemini_api_key))
+            if warm_up and app.config.get('GEMINI_WARMUP', True):
+                threading.Thread(
+                    target=_warm_up_client, args=(gemini_api_key, dict(app.config)),
+                    name="genai-warmup", daemon=True
+                ).start()
             
         if not gemini_file_search_key:
             logger.warning("GEMINI_FILE_SEARCH_API_KEY not configured - File Search will be unavailable")
         else:
-            logger.info(f"GEMINI_FILE_SEARCH_API_KEY configured: {mask_key(gemini_file_search_key)}")
+            logger.info("GEMINI_FILE_SEARCH_API_KEY configured: %s", mask_key(gemini_file_search_key))
             
-        logger.info("Google GenAI service initialized (client will be created per request)")
+        logger.info("Google GenAI service initialized")
     except Exception as e:
-        logger.error(f"Error initializing Google GenAI service: {e}")
-        traceback.print_exc()
+        logger.exception("Error initializing Google GenAI service: %s", e)
+    finally:
+        # Only once the config is applied: _ensure_ai_service reads this flag without the lock
+        _ai_service_initialized = True
 
 def mask_key(key):
     """Mask API key for logging."""
@@ -45,24 +115,69 @@ def mask_key(key):
         return "None"
     return f"{key[:8]}...{key[-4:]}" if len(key) > 12 else "***"
 
-def get_client():
-    """Get a configured GenAI client for analysis, extraction and interaction."""
-    import os
-    api_key = current_app.config.get('GEMINI_API_KEY')
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not configured - required for AI analysis services")
-    
-    logger.info(f"Creating GenAI client with API Key: {mask_key(api_key)}")
+def _build_http_options(config) -> types.HttpOptions:
+    """Connection pool limits (and HTTP/2 multiplexing when h2 is installed) for the shared sync client."""
+    return types.HttpOptions(client_args={
+        "http2": HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=config.get('GEMINI_HTTP_MAX_CONNECTIONS', 64),
+            max_keepalive_connections=config.get('GEMINI_HTTP_MAX_KEEPALIVE', 32)
+        )
+    })
+
+def _create_client(api_key: str, config=None):
+    """Create a GenAI client without picking up GOOGLE_API_KEY from the environment."""
+    logger.info("Creating GenAI client with API Key: %s", mask_key(api_key))
+    config = config if config is not None else current_app.config
     
     # Temporarily unset GOOGLE_API_KEY to prevent library auto-detection conflict
     original_google_key = os.environ.pop('GOOGLE_API_KEY', None)
     try:
-        client = genai.Client(api_key=api_key)
+        return genai.Client(api_key=api_key, http_options=_build_http_options(config))
     finally:
         # Restore GOOGLE_API_KEY if it was set
         if original_google_key is not None:
             os.environ['GOOGLE_API_KEY'] = original_google_key
-    
+
+def _warm_up_client(api_key: str, config):
+    """Open the TLS connection up front so the first analysis request does not pay for the handshake."""
+    try:
+        with _clients_lock:
+            client = _clients.get(api_key)
+            if client is None:
+                client = _create_client(api_key, config)
+                _clients[api_key] = client
+        start_time = time.time()
+        client.models.get(model=config.get('MODEL_NAME', 'gemini-2.5-flash'))
+        logger.info("GenAI client warmed up in %.2fs", time.time() - start_time)
+    except Exception as e:
+        logger.warning("GenAI client warm-up failed: %s", e)
+
+def _ensure_ai_service():
+    """Apply the AI service config on first use (see LAZY_SERVICE_INIT)."""
+    if _ai_service_initialized:
+        return
+    with _ai_service_init_lock:
+        if not _ai_service_initialized:
+            init_ai_service(current_app, warm_up=False)
+
+def _get_api_key() -> str:
+    _ensure_ai_service()
+    api_key = current_app.config.get('GEMINI_API_KEY')
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not configured - required for AI analysis services")
+    return api_key
+
+def get_client():
+    """Get the shared GenAI client for analysis, extraction and interaction."""
+    api_key = _get_api_key()
+    client = _clients.get(api_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(api_key)
+            if client is None:
+                client = _create_client(api_key)
+                _clients[api_key] = client
     return client
 
 def get_thinking_config():
@@ -76,59 +191,256 @@ def get_thinking_config():
     thinking_budget = current_app.config.get('THINKING_BUDGET', 4096)
     include_summary = current_app.config.get('INCLUDE_THINKING_SUMMARY', False)
     
-    logger.info(f"Thinking mode ENABLED: budget={thinking_budget} tokens, include_summary={include_summary}")
+    logger.info("Thinking mode ENABLED: budget=%s tokens, include_summary=%s", thinking_budget, include_summary)
     
     return types.ThinkingConfig(
         thinking_budget=thinking_budget,
         include_thoughts=include_summary
     )
 
-def get_chat_session(session_id_key: str, system_instruction: str | None = None, force_new: bool = False):
-    """Get or create a chat session for AI interactions with thinking mode enabled."""
-    global chat_sessions, _clients
-    session_id_key = session_id_key or "default_chat_session_key"
+def build_chat_config(system_instruction: str | None = None, cached_content: str | None = None,
+                      response_mime_type: str | None = None) -> types.GenerateContentConfig:
+    """
+    Build the generation config shared by chat sessions and one-off calls.
+    With cached_content the system instruction already lives in the cache and is not re-sent.
+    response_mime_type="application/json" makes the model answer with a bare JSON document.
+    """
+    temperature = current_app.config.get('TEMPERATURE', 0)
+    return types.GenerateContentConfig(
+        temperature=temperature,
+        thinking_config=get_thinking_config(),
+        safety_settings=SAFETY_SETTINGS,
+        system_instruction=None if cached_content else system_instruction,
+        cached_content=cached_content,
+        response_mime_type=response_mime_type
+    )
 
-    if force_new or session_id_key not in chat_sessions:
-        if force_new and session_id_key in chat_sessions:
-            logger.info(f"Forcing new chat session for key (was existing): {session_id_key}")
-        else:
-            logger.info(f"Creating new chat session for key: {session_id_key}")
+@functools.lru_cache(maxsize=32)
+def _split_template(template: str) -> tuple[str, tuple[str, ...]]:
+    """Static instruction and placeholder names of a template; templates are few and long-lived."""
+    field_names = []
+    for _, field_name, _, _ in string.Formatter().parse(template):
+        if field_name and field_name not in field_names:
+            field_names.append(field_name)
+    static_prompt = template.format(**{name: f"<{name}>" for name in field_names})
+    return static_prompt, tuple(field_names)
+
+
+def split_system_prompt(template: str, **values) -> tuple[str, str]:
+    """
+    Split a prompt template into a static system instruction and a per-request context block.
+    Placeholders are replaced by their own names, so the instruction is byte-identical across
+    requests and languages and its context cache (explicit or implicit) is shared; the actual
+    values are returned as a short block to send ahead of the payload.
+    Values for placeholders the template does not use are ignored.
+    """
+    static_prompt, field_names = _split_template(template)
+    prompt_context = "\n".join(f"<{name}>: {values.get(name, '')}" for name in field_names)
+    return static_prompt, prompt_context
+
+def get_cached_content_name(client, model_name: str, system_instruction: str | None = None, prompt_text: str | None = None) -> str | None:
+    """
+    Name of an explicit Gemini context cache holding a long, reused prompt prefix.
+    The cache is created on first use and shared until shortly before it expires.
+    Returns None when caching is disabled, the prompt is too short to qualify, or creation failed.
+    """
+    if not current_app.config.get('ENABLE_CONTEXT_CACHE', True):
+        return None
+    prompt_size = len(system_instruction or "") + len(prompt_text or "")
+    if prompt_size < current_app.config.get('CONTEXT_CACHE_MIN_CHARS', 4000):
+        return None
+
+    key = ResponseCache.build_key(model_name, system_instruction or "", prompt_text or "")
+    cached_name = _context_caches.get(key)
+    if cached_name is not None:
+        return cached_name or None
+
+    with _context_caches.lock:
+        cached_name = _context_caches.get(key)
+        if cached_name is not None:
+            return cached_name or None
+        ttl_seconds = current_app.config.get('CONTEXT_CACHE_TTL_SECONDS', 3600)
         try:
-            model_name = current_app.config.get('MODEL_NAME', 'gemini-2.5-flash')
-            temperature = current_app.config.get('TEMPERATURE', 0)
-            
-            client = get_client()
-            _clients[session_id_key] = client
-            
-            thinking_config = get_thinking_config()
-            
-            config = types.GenerateContentConfig(
-                temperature=temperature,
-                thinking_config=thinking_config,
-                safety_settings=[
-                    types.SafetySetting(category="HARM_CATEGORY_HARASSMENT", threshold="BLOCK_NONE"),
-                    types.SafetySetting(category="HARM_CATEGORY_HATE_SPEECH", threshold="BLOCK_NONE"),
-                    types.SafetySetting(category="HARM_CATEGORY_SEXUALLY_EXPLICIT", threshold="BLOCK_NONE"),
-                    types.SafetySetting(category="HARM_CATEGORY_DANGEROUS_CONTENT", threshold="BLOCK_NONE"),
-                ],
-                system_instruction=system_instruction
-            )
-            
-            logger.info(f"Chat session config: model={model_name}, temperature={temperature}, thinking={'enabled' if thinking_config else 'disabled'}")
-            
-            chat = client.chats.create(
+            cache = client.caches.create(
                 model=model_name,
-                config=config,
-                history=[]
+                config=types.CreateCachedContentConfig(
+                    display_name=f"shariaa-prompt-{key[:12]}",
+                    system_instruction=system_instruction,
+                    contents=[types.Content(role="user", parts=[types.Part(text=prompt_text)])] if prompt_text else None,
+                    ttl=f"{ttl_seconds}s"
+                )
             )
-            chat_sessions[session_id_key] = chat
-            
+            cached_name = cache.name
+            logger.info("Created context cache %s for %s prompt characters", cached_name, prompt_size)
         except Exception as e:
-            logger.error(f"Failed to create chat session {session_id_key}: {e}")
-            traceback.print_exc()
-            raise Exception(f"فشل في بدء جلسة الدردشة مع النموذج: {e}")
+            logger.warning("Context cache creation failed, sending prompt inline: %s", e)
+            cached_name = ""
+        _context_caches[key] = cached_name
+    return cached_name or None
+
+def _create_chat(session_id_key: str, system_instruction: str | None, response_mime_type: str | None = None):
+    try:
+        model_name = current_app.config.get('MODEL_NAME', 'gemini-2.5-flash')
+        temperature = current_app.config.get('TEMPERATURE', 0)
+        
+        client = get_client()
+        
+        config = build_chat_config(
+            system_instruction,
+            get_cached_content_name(client, model_name, system_instruction),
+            response_mime_type=response_mime_type
+        )
+        
+        logger.info("Chat session config: model=%s, temperature=%s, thinking=%s", model_name, temperature, 'enabled' if config.thinking_config else 'disabled')
+        
+        return client.chats.create(
+            model=model_name,
+            config=config,
+            history=[]
+        )
+    except Exception as e:
+        logger.exception("Failed to create chat session %s: %s", session_id_key, e)
+        raise Exception(f"فشل في بدء جلسة الدردشة مع النموذج: {e}")
+
+
+def get_chat_session(session_id_key: str, system_instruction: str | None = None, force_new: bool = False,
+                     reuse: bool = True, response_mime_type: str | None = None):
+    """
+    Get or create a chat session for AI interactions with thinking mode enabled.
+    A cached session is reused only while its system instruction matches; otherwise it is rebuilt.
+    With reuse=False a one-off chat is returned and nothing is cached, so single-turn callers do
+    not evict multi-turn chats; it still shares the instruction's context cache.
+    response_mime_type is only honoured for one-off chats.
+    """
+    _ensure_ai_service()
+    session_id_key = session_id_key or "default_chat_session_key"
+    if not reuse:
+        return _create_chat(session_id_key, system_instruction, response_mime_type)
+    prompt_hash = hashlib.blake2b((system_instruction or "").encode('utf-8'), digest_size=16).hexdigest()
+
+    with chat_sessions.lock:
+        cached = None if force_new else chat_sessions.get(session_id_key)
+        if cached is not None:
+            cached_prompt_hash, chat = cached
+            if cached_prompt_hash == prompt_hash:
+                return chat
+            logger.info("System instruction changed for chat session %s, rebuilding", session_id_key)
+        elif force_new and session_id_key in chat_sessions:
+            logger.info("Forcing new chat session for key (was existing): %s", session_id_key)
+        else:
+            logger.info("Creating new chat session for key: %s", session_id_key)
+        chat = _create_chat(session_id_key, system_instruction)
+        chat_sessions[session_id_key] = (prompt_hash, chat)
             
-    return chat_sessions[session_id_key]
+    return chat
+
+def get_token_usage(response) -> dict:
+    """Extract token usage counters from a GenAI response, if present."""
+    if hasattr(response, 'usage_metadata') and response.usage_metadata:
+        return {
+            "input_tokens": getattr(response.usage_metadata, 'prompt_token_count', 0),
+            "output_tokens": getattr(response.usage_metadata, 'candidates_token_count', 0),
+            "total_tokens": getattr(response.usage_metadata, 'total_token_count', 0)
+        }
+    return {}
+
+def get_blocked_response_code(response, session_id_key: str) -> str | None:
+    """Return an ERROR_* marker when an empty response was blocked or filtered."""
+    if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
+        block_reason = getattr(response.prompt_feedback, 'block_reason', None)
+        if block_reason:
+            block_reason_msg = f"Prompt blocked for session {session_id_key}. Reason: {block_reason}"
+            logger.warning(block_reason_msg)
+            return f"ERROR_PROMPT_BLOCKED: {block_reason}"
+    
+    if hasattr(response, 'candidates') and response.candidates:
+        candidate = response.candidates[0]
+        finish_reason = getattr(candidate, 'finish_reason', None)
+        if finish_reason and str(finish_reason) != "STOP":
+            block_reason_msg = f"Content possibly blocked/filtered for session {session_id_key}. Finish Reason: {finish_reason}"
+            logger.warning(block_reason_msg)
+            if str(finish_reason) == "SAFETY":
+                return f"ERROR_CONTENT_BLOCKED_SAFETY: {finish_reason}"
+            return f"ERROR_CONTENT_BLOCKED: {finish_reason}"
+    return None
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Whether a failed Gemini call is worth retrying.
+    Rate limits, server errors and network timeouts are; auth, bad requests and blocked content are not.
+    """
+    if isinstance(error, genai_errors.APIError):
+        return error.code in TRANSIENT_STATUS_CODES
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    error_name = type(error).__name__.lower()
+    return any(marker in error_name for marker in ("timeout", "connect", "network", "remoteprotocol"))
+
+def get_retry_delay(attempt: int, base_delay: float) -> float:
+    """Exponential backoff with full jitter so retries from different workers do not line up."""
+    return random.uniform(0, min(MAX_RETRY_DELAY, base_delay * (2 ** attempt)))
+
+def build_text_cache_key(text_payload: str, formatted_system_prompt: str | None) -> str:
+    """Cache key for a text analysis call: model, temperature, system prompt and payload."""
+    return ResponseCache.build_key(
+        current_app.config.get('MODEL_NAME', 'gemini-2.5-flash'),
+        current_app.config.get('TEMPERATURE', 0),
+        formatted_system_prompt or "",
+        text_payload
+    )
+
+def invalidate_text_response(text_payload: str, formatted_system_prompt: str | None):
+    """
+    Drop the cached response of a text analysis call, for callers that found it unusable
+    (e.g. not valid JSON), so a retry reaches the model instead of replaying the same reply.
+    """
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return
+    cache_key = build_text_cache_key(text_payload, formatted_system_prompt)
+    response_cache.delete(cache_key)
+    semantic_cache = get_semantic_cache()
+    if semantic_cache is not None:
+        semantic_cache.remove(cache_key)
+    logger.info("Invalidated cached response, key %s", cache_key[:12])
+
+def build_semantic_scope(formatted_system_prompt: str | None) -> str:
+    """Semantic matches are only valid between calls sharing model, temperature and system prompt."""
+    return build_text_cache_key("", formatted_system_prompt)
+
+def embed_text_for_cache(text_payload: str) -> list[float] | None:
+    """Embed a payload for the semantic cache. Failures only disable the semantic lookup."""
+    try:
+        client = get_client()
+        result = client.models.embed_content(
+            model=current_app.config.get('EMBEDDING_MODEL_NAME', 'text-embedding-004'),
+            contents=text_payload
+        )
+        if result.embeddings and result.embeddings[0].values:
+            return list(result.embeddings[0].values)
+    except Exception as e:
+        logger.warning("Embedding for semantic cache failed: %s", e)
+    return None
+
+def lookup_semantic_cache(text_payload: str, formatted_system_prompt: str | None, session_id_key: str):
+    """
+    Look up a near-duplicate payload after an exact cache miss.
+    Returns (cached_text, scope, embedding); cached_text is None on a miss so the
+    caller can index the embedding once a fresh response arrives.
+    """
+    semantic_cache = get_semantic_cache()
+    if not semantic_cache:
+        return None, None, None
+    embedding = embed_text_for_cache(text_payload)
+    if embedding is None:
+        return None, None, None
+    scope = build_semantic_scope(formatted_system_prompt)
+    match = semantic_cache.lookup(scope, embedding)
+    if match:
+        cached_text, similarity = match
+        logger.info("SEMANTIC_HIT for session %s, similarity %.4f", session_id_key, similarity)
+        return cached_text, scope, embedding
+    return None, scope, embedding
 
 def send_text_to_remote_api(text_payload: str, session_id_key: str, formatted_system_prompt: str):
     """
@@ -136,103 +448,332 @@ def send_text_to_remote_api(text_payload: str, session_id_key: str, formatted_sy
     Matches the interface of old remote_api.py send_text_to_remote_api function.
     """
     if not text_payload or not text_payload.strip():
-        logger.warning(f"Empty text_payload for session_id_key {session_id_key}")
+        logger.warning("Empty text_payload for session_id_key %s", session_id_key)
         return ""
 
-    logger.info(f"Sending text to LLM for session: {session_id_key}, payload length: {len(text_payload)}, system prompt length: {len(formatted_system_prompt) if formatted_system_prompt else 0}")
+    logger.info("Sending text to LLM for session: %s, payload length: %s, system prompt length: %s", session_id_key, len(text_payload), len(formatted_system_prompt) if formatted_system_prompt else 0)
+    
+    response_cache = get_response_cache()
+    cache_key = build_text_cache_key(text_payload, formatted_system_prompt) if response_cache else None
+    if response_cache:
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            logger.info("LLM cache HIT for session %s, key %s", session_id_key, cache_key[:12])
+            return cached_text
+    
+    semantic_text, semantic_scope, semantic_embedding = None, None, None
+    if response_cache:
+        semantic_text, semantic_scope, semantic_embedding = lookup_semantic_cache(text_payload, formatted_system_prompt, session_id_key)
+        if semantic_text is not None:
+            return semantic_text
     
     try:
-        chat = get_chat_session(session_id_key, system_instruction=formatted_system_prompt, force_new=True)
+        # One-shot analysis is stateless: a plain generate_content call sends the same system-instruction
+        # prefix every time (so Gemini's implicit prefix caching applies) without building a throwaway chat
+        client = get_client()
+        model_name = current_app.config.get('MODEL_NAME', 'gemini-2.5-flash')
+        config = build_chat_config(formatted_system_prompt, get_cached_content_name(client, model_name, formatted_system_prompt))
         
         max_retries = 3
-        retry_delay = 5
+        retry_base_delay = 5
         
         tracer = get_request_tracer()
         
         for attempt in range(max_retries):
             try:
-                logger.info(f"Sending request to AI API (attempt {attempt + 1}/{max_retries})")
+                logger.info("Sending request to AI API (attempt %s/%s)", attempt + 1, max_retries)
                 api_start_time = time.time()
-                response = chat.send_message(text_payload)
+                response = client.models.generate_content(model=model_name, contents=text_payload, config=config)
                 api_duration = time.time() - api_start_time
                 
-                token_usage = {}
-                if hasattr(response, 'usage_metadata') and response.usage_metadata:
-                    token_usage = {
-                        "input_tokens": getattr(response.usage_metadata, 'prompt_token_count', 0),
-                        "output_tokens": getattr(response.usage_metadata, 'candidates_token_count', 0),
-                        "total_tokens": getattr(response.usage_metadata, 'total_token_count', 0)
-                    }
-                    logger.info(f"Token usage for session {session_id_key}: input={token_usage['input_tokens']}, output={token_usage['output_tokens']}, total={token_usage['total_tokens']}")
+                token_usage = get_token_usage(response)
+                if token_usage:
+                    logger.info("Token usage for session %s: input=%s, output=%s, total=%s", session_id_key, token_usage['input_tokens'], token_usage['output_tokens'], token_usage['total_tokens'])
                 
                 if tracer:
                     tracer.record_api_call(
-                        service="gemini_chat",
-                        method="send_message",
-                        endpoint="chat.send_message",
+                        service="gemini",
+                        method="send_text_to_remote_api",
+                        endpoint=f"models/{model_name}/generateContent",
                         request_data={"session_id": session_id_key, "payload_length": len(text_payload), "attempt": attempt + 1},
                         response_data={"response_length": len(response.text) if response.text else 0, "has_text": bool(response.text), "token_usage": token_usage},
                         duration=api_duration
                     )
                 
                 if not response.text:
-                    if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
-                        block_reason = getattr(response.prompt_feedback, 'block_reason', None)
-                        if block_reason:
-                            block_reason_msg = f"Prompt blocked for session {session_id_key}. Reason: {block_reason}"
-                            logger.warning(block_reason_msg)
-                            return f"ERROR_PROMPT_BLOCKED: {block_reason}"
-                    
-                    if hasattr(response, 'candidates') and response.candidates:
-                        candidate = response.candidates[0]
-                        finish_reason = getattr(candidate, 'finish_reason', None)
-                        if finish_reason and str(finish_reason) != "STOP":
-                            block_reason_msg = f"Content possibly blocked/filtered for session {session_id_key}. Finish Reason: {finish_reason}"
-                            logger.warning(block_reason_msg)
-                            if str(finish_reason) == "SAFETY":
-                                return f"ERROR_CONTENT_BLOCKED_SAFETY: {finish_reason}"
-                            return f"ERROR_CONTENT_BLOCKED: {finish_reason}"
+                    blocked_code = get_blocked_response_code(response, session_id_key)
+                    if blocked_code:
+                        return blocked_code
                     
-                    logger.warning(f"Received empty text response from API for session {session_id_key} on attempt {attempt + 1}")
+                    logger.warning("Received empty text response from API for session %s on attempt %s", session_id_key, attempt + 1)
                     if attempt == max_retries - 1:
-                        logger.error(f"All retries resulted in empty response for {session_id_key}.")
+                        logger.error("All retries resulted in empty response for %s.", session_id_key)
                         return ""
                 else:
-                    logger.info(f"Received successful response for session {session_id_key}. Response text length: {len(response.text)}")
+                    logger.info("Received successful response for session %s. Response text length: %s", session_id_key, len(response.text))
+                    if response_cache:
+                        response_cache.set(cache_key, response.text)
+                        if semantic_embedding is not None:
+                            get_semantic_cache().add(semantic_scope, cache_key, semantic_embedding)
                     return response.text
                     
             except Exception as e_inner:
-                logger.error(f"Attempt {attempt + 1} failed for send_message to API for session {session_id_key}: {e_inner}")
-                traceback.print_exc()
-                if attempt < max_retries - 1:
-                    logger.info(f"Retrying in {retry_delay} seconds for session {session_id_key}...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
+                logger.exception("Attempt %s failed for send_message to API for session %s: %s", attempt + 1, session_id_key, e_inner)
+                if attempt < max_retries - 1 and is_transient_error(e_inner):
+                    delay = get_retry_delay(attempt, retry_base_delay)
+                    logger.info("Retrying in %.1f seconds for session %s...", delay, session_id_key)
+                    time.sleep(delay)
                 else:
-                    logger.error(f"All retries failed for session {session_id_key}.")
+                    logger.error("Giving up on session %s after attempt %s.", session_id_key, attempt + 1)
                     raise
         
         return ""
 
     except Exception as e:
-        logger.error(f"General error during text sending to API for session {session_id_key}: {e}")
-        traceback.print_exc()
+        logger.exception("General error during text sending to API for session %s: %s", session_id_key, e)
         raise Exception(f"فشل في استدعاء API للنموذج: {e}")
 
-def extract_text_from_file(file_path: str) -> str | None:
+def send_text_to_remote_api_stream(text_payload: str, session_id_key: str, formatted_system_prompt: str):
+    """
+    Streaming variant of send_text_to_remote_api.
+    Yields response text chunks as they arrive; the joined text is cached once the stream completes.
+    Transient failures are retried only until the first chunk has been yielded.
+    """
+    if not text_payload or not text_payload.strip():
+        logger.warning("Empty text_payload for session_id_key %s", session_id_key)
+        return
+
+    logger.info("Streaming text to LLM for session: %s, payload length: %s", session_id_key, len(text_payload))
+    
+    response_cache = get_response_cache()
+    cache_key = build_text_cache_key(text_payload, formatted_system_prompt) if response_cache else None
+    if response_cache:
+        cached_text = response_cache.get(cache_key)
+        if cached_text is not None:
+            logger.info("LLM cache HIT for session %s, key %s", session_id_key, cache_key[:12])
+            yield cached_text
+            return
+    
+    max_retries = 3
+    retry_base_delay = 5
+    tracer = get_request_tracer()
+    
+    for attempt in range(max_retries):
+        chunks = []
+        last_chunk = None
+        try:
+            client = get_client()
+            model_name = current_app.config.get('MODEL_NAME', 'gemini-2.5-flash')
+            api_start_time = time.time()
+            first_chunk_time = None
+            for chunk in client.models.generate_content_stream(
+                model=model_name,
+                contents=text_payload,
+                config=build_chat_config(formatted_system_prompt, get_cached_content_name(client, model_name, formatted_system_prompt))
+            ):
+                last_chunk = chunk
+                if chunk.text:
+                    if first_chunk_time is None:
+                        first_chunk_time = time.time() - api_start_time
+                        logger.info("First streamed chunk for session %s after %.2fs", session_id_key, first_chunk_time)
+                    chunks.append(chunk.text)
+                    yield chunk.text
+            api_duration = time.time() - api_start_time
+        except Exception as e_inner:
+            logger.error("Attempt %s failed for streaming send_message for session %s: %s", attempt + 1, session_id_key, e_inner)
+            if not chunks and attempt < max_retries - 1 and is_transient_error(e_inner):
+                delay = get_retry_delay(attempt, retry_base_delay)
+                logger.info("Retrying stream in %.1f seconds for session %s...", delay, session_id_key)
+                time.sleep(delay)
+                continue
+            logger.exception("Giving up streaming for session %s after attempt %s.", session_id_key, attempt + 1)
+            raise Exception(f"فشل في استدعاء API للنموذج: {e_inner}")
+        
+        full_text = "".join(chunks)
+        token_usage = get_token_usage(last_chunk) if last_chunk is not None else {}
+        if tracer:
+            tracer.record_api_call(
+                service="gemini",
+                method="send_text_to_remote_api_stream",
+                endpoint=f"models/{model_name}/streamGenerateContent",
+                request_data={"session_id": session_id_key, "payload_length": len(text_payload), "attempt": attempt + 1},
+                response_data={"response_length": len(full_text), "first_chunk_seconds": first_chunk_time, "token_usage": token_usage},
+                duration=api_duration
+            )
+        
+        if full_text:
+            logger.info("Stream completed for session %s. Response text length: %s", session_id_key, len(full_text))
+            if response_cache:
+                response_cache.set(cache_key, full_text)
+            return
+        
+        blocked_code = get_blocked_response_code(last_chunk, session_id_key) if last_chunk is not None else None
+        if blocked_code:
+            yield blocked_code
+            return
+        logger.warning("Received empty streamed response for session %s on attempt %s", session_id_key, attempt + 1)
+
+def file_digest(file_path: str) -> str:
+    """Content digest of a file, hashed through mmap so large PDFs are not copied into Python memory."""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.blake2b(b"", digest_size=32).hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.blake2b(mapped, digest_size=32).hexdigest()
+
+def build_file_part(client, file_path: str, mime_type: str, file_size: int, inline_max_bytes: int, digest: str | None = None):
+    """
+    Content part for a file sent to the model.
+    Small files are sent inline; larger ones are streamed to the Files API rather than read into memory,
+    and the upload is reused for later requests on the same content.
+    """
+    if file_size <= inline_max_bytes:
+        return types.Part.from_bytes(data=pathlib.Path(file_path).read_bytes(), mime_type=mime_type)
+
+    digest = digest or file_digest(file_path)
+    uploaded = _uploaded_files.get(digest)
+    if uploaded is not None:
+        logger.info("Reusing Files API upload %s for %s", uploaded.name, file_path)
+        return uploaded
+
+    logger.info("Uploading %s (%s bytes) via Files API instead of inline bytes", file_path, file_size)
+    uploaded = client.files.upload(file=file_path, config=types.UploadFileConfig(mime_type=mime_type))
+    for _ in range(30):
+        if str(getattr(uploaded.state, 'name', uploaded.state)) != "PROCESSING":
+            break
+        time.sleep(1)
+        uploaded = client.files.get(name=uploaded.name)
+    if str(getattr(uploaded.state, 'name', uploaded.state)) == "FAILED":
+        raise Exception(f"File upload processing failed for {file_path}")
+    _uploaded_files[digest] = uploaded
+    return uploaded
+
+def split_pdf_into_chunks(file_path: str, pages_per_chunk: int) -> list[bytes] | None:
+    """
+    Split a PDF into in-memory PDFs of pages_per_chunk pages each.
+    Returns None when pypdf is unavailable or the document is too short to be worth splitting.
+    """
+    if not PYPDF_AVAILABLE or pages_per_chunk <= 0:
+        return None
+    try:
+        reader = PdfReader(file_path)
+        page_count = len(reader.pages)
+        if page_count <= pages_per_chunk:
+            return None
+        chunks = []
+        for start in range(0, page_count, pages_per_chunk):
+            writer = PdfWriter()
+            for page in reader.pages[start:start + pages_per_chunk]:
+                writer.add_page(page)
+            buffer = io.BytesIO()
+            writer.write(buffer)
+            chunks.append(buffer.getvalue())
+        logger.info("Split %s (%s pages) into %s chunks of up to %s pages", file_path, page_count, len(chunks), pages_per_chunk)
+        return chunks
+    except Exception as e:
+        logger.warning("Could not split PDF %s, extracting it whole: %s", file_path, e)
+        return None
+
+def _extract_pdf_chunk(client, model_name: str, extraction_prompt: str, chunk_data: bytes, chunk_label: str) -> str | None:
+    """Extract one page-range chunk, retrying transient failures once."""
+    for attempt in range(2):
+        try:
+            response = client.models.generate_content(
+                model=model_name,
+                contents=[types.Part.from_bytes(data=chunk_data, mime_type="application/pdf"), extraction_prompt]
+            )
+            return response.text if response and response.text else None
+        except Exception as e:
+            logger.error("Extraction of %s failed on attempt %s: %s", chunk_label, attempt + 1, e)
+            if attempt == 0 and is_transient_error(e):
+                time.sleep(get_retry_delay(attempt, 3))
+                continue
+            return None
+    return None
+
+def extract_pdf_chunks_parallel(client, model_name: str, extraction_prompt: str, chunks: list[bytes], file_path: str) -> str | None:
+    """Extract page-range chunks concurrently and join them in page order. None if any chunk fails."""
+    max_workers = min(len(chunks), current_app.config.get('GEMINI_MAX_CONCURRENCY', 8))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        texts = list(executor.map(
+            lambda item: _extract_pdf_chunk(client, model_name, extraction_prompt, item[1], f"{file_path} chunk {item[0] + 1}/{len(chunks)}"),
+            enumerate(chunks)
+        ))
+    if not all(texts):
+        logger.warning("Chunked extraction incomplete for %s, falling back to whole-file extraction", file_path)
+        return None
+    return "\n\n".join(texts)
+
+def check_extraction_file(path_obj: pathlib.Path, ext: str) -> int | None:
+    """
+    Validate a file before any of it is read for extraction.
+    Returns the file size, or None when the file is too large or is not really a PDF.
+    """
+    file_size = path_obj.stat().st_size
+    max_bytes = current_app.config.get('MAX_EXTRACTION_FILE_BYTES', 50 * 1024 * 1024)
+    if file_size > max_bytes:
+        logger.error("File %s is too large to extract (%s bytes, limit %s)", path_obj, file_size, max_bytes)
+        return None
+    if ext == ".pdf" and file_size:
+        with open(path_obj, 'rb') as f:
+            if f.read(5) != b"%PDF-":
+                logger.error("File %s has a .pdf extension but no PDF header", path_obj)
+                return None
+    return file_size
+
+def extract_pdf_text_locally(file_path: str, max_pages: int = 0, min_chars_per_page: int = 50) -> str | None:
+    """
+    Extract the text layer of a PDF with PyMuPDF, reading at most max_pages pages (0 for all).
+    Returns None when PyMuPDF is unavailable or the text layer is too thin, as for scanned
+    contracts, so the caller can fall back to Gemini extraction.
+    """
+    if not PYMUPDF_AVAILABLE:
+        return None
+    try:
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count if max_pages <= 0 else min(doc.page_count, max_pages)
+            text = "\n".join(doc[index].get_text("text") for index in range(page_count))
+    except Exception as e:
+        logger.warning("PyMuPDF could not read %s, falling back to Gemini: %s", file_path, e)
+        return None
+    if len(text.strip()) < min_chars_per_page * max(page_count, 1):
+        logger.info("PDF %s has little or no text layer, falling back to Gemini", file_path)
+        return None
+    return text
+
+def extract_text_from_file(file_path: str, digest: str | None = None) -> str | None:
     """
     Extract text from PDF/TXT files using AI.
     Matches the interface of old remote_api.py extract_text_from_file function.
+    Pass digest when the caller already hashed the file to skip hashing it again.
     """
     path_obj = pathlib.Path(file_path)
     ext = path_obj.suffix.lower()
 
     if ext not in [".pdf", ".txt"]:
-        logger.warning(f"Unsupported file type for extraction: {ext}")
+        logger.warning("Unsupported file type for extraction: %s", ext)
         return None
         
     try:
-        logger.info(f"Extracting text from file: {file_path}")
+        file_size = check_extraction_file(path_obj, ext)
+        if file_size is None:
+            return None
+        if file_size == 0:
+            logger.warning("File is empty, nothing to extract: %s", file_path)
+            return ""
+        
+        logger.info("Extracting text from file: %s", file_path)
+
+        if ext == ".pdf" and current_app.config.get('PDF_EXTRACTOR', 'gemini') == 'pymupdf':
+            local_start_time = time.time()
+            local_text = extract_pdf_text_locally(
+                file_path,
+                max_pages=current_app.config.get('PDF_EXTRACT_MAX_PAGES', 0),
+                min_chars_per_page=current_app.config.get('PDF_TEXT_MIN_CHARS_PER_PAGE', 50)
+            )
+            if local_text is not None:
+                logger.info("Extracted %s chars from %s with PyMuPDF in %.2fs", len(local_text), file_path, time.time() - local_start_time)
+                return local_text
         
         from config.default import DefaultConfig
         extraction_prompt = DefaultConfig.EXTRACTION_PROMPT
@@ -240,77 +781,102 @@ def extract_text_from_file(file_path: str) -> str | None:
         client = get_client()
         model_name = current_app.config.get('MODEL_NAME', 'gemini-2.5-flash')
         
-        file_data = path_obj.read_bytes()
         mime_type = "application/pdf" if ext == ".pdf" else "text/plain"
         
+        digest = digest or file_digest(file_path)
+        response_cache = get_response_cache()
+        cache_key = ResponseCache.build_key(model_name, extraction_prompt, mime_type, digest) if response_cache else None
+        if response_cache:
+            cached_text = response_cache.get(cache_key)
+            if cached_text is not None:
+                logger.info("Extraction cache HIT for %s, key %s", file_path, cache_key[:12])
+                return cached_text
+        
+        if ext == ".pdf":
+            pdf_chunks = split_pdf_into_chunks(file_path, current_app.config.get('PDF_CHUNK_PAGES', 10))
+            if pdf_chunks:
+                chunk_start_time = time.time()
+                chunked_text = extract_pdf_chunks_parallel(client, model_name, extraction_prompt, pdf_chunks, file_path)
+                if chunked_text:
+                    logger.info("Extracted %s chunks from %s in %.2fs. Text length: %s", len(pdf_chunks), file_path, time.time() - chunk_start_time, len(chunked_text))
+                    if response_cache:
+                        response_cache.set(cache_key, chunked_text)
+                    return chunked_text
+        
+        file_part = build_file_part(client, file_path, mime_type, file_size, current_app.config.get('INLINE_FILE_MAX_BYTES', 8 * 1024 * 1024), digest)
+        extraction_cache_name = get_cached_content_name(client, model_name, prompt_text=extraction_prompt)
+        
         max_retries = 2
-        retry_delay = 3
+        retry_base_delay = 3
         tracer = get_request_tracer()
         
         for attempt in range(max_retries):
             try:
                 api_start_time = time.time()
-                response = client.models.generate_content(
-                    model=model_name,
-                    contents=[
-                        types.Part.from_bytes(data=file_data, mime_type=mime_type),
-                        extraction_prompt
-                    ]
-                )
+                if extraction_cache_name:
+                    response = client.models.generate_content(
+                        model=model_name,
+                        contents=[file_part],
+                        config=types.GenerateContentConfig(cached_content=extraction_cache_name)
+                    )
+                else:
+                    response = client.models.generate_content(
+                        model=model_name,
+                        contents=[file_part, extraction_prompt]
+                    )
                 api_duration = time.time() - api_start_time
                 
-                token_usage = {}
-                if hasattr(response, 'usage_metadata') and response.usage_metadata:
-                    token_usage = {
-                        "input_tokens": getattr(response.usage_metadata, 'prompt_token_count', 0),
-                        "output_tokens": getattr(response.usage_metadata, 'candidates_token_count', 0),
-                        "total_tokens": getattr(response.usage_metadata, 'total_token_count', 0)
-                    }
-                    logger.info(f"Token usage for file extraction {file_path}: input={token_usage['input_tokens']}, output={token_usage['output_tokens']}, total={token_usage['total_tokens']}")
+                token_usage = get_token_usage(response)
+                if token_usage:
+                    logger.info("Token usage for file extraction %s: input=%s, output=%s, total=%s", file_path, token_usage['input_tokens'], token_usage['output_tokens'], token_usage['total_tokens'])
                 
                 if tracer:
                     tracer.record_api_call(
                         service="gemini",
                         method="extract_text_from_file",
                         endpoint=f"models/{model_name}/generateContent",
-                        request_data={"file_path": file_path, "mime_type": mime_type, "file_size": len(file_data), "attempt": attempt + 1},
+                        request_data={"file_path": file_path, "mime_type": mime_type, "file_size": file_size, "attempt": attempt + 1},
                         response_data={"response_length": len(response.text) if response and response.text else 0, "has_text": bool(response and response.text), "token_usage": token_usage},
                         duration=api_duration
                     )
                 
                 if response and response.text:
-                    logger.info(f"Successfully extracted text from {file_path}. Text length: {len(response.text)}")
+                    logger.info("Successfully extracted text from %s. Text length: %s", file_path, len(response.text))
+                    if response_cache:
+                        response_cache.set(cache_key, response.text)
                     return response.text
                     
                 if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
                     block_reason = getattr(response.prompt_feedback, 'block_reason', None)
                     if block_reason:
-                        logger.warning(f"Extraction prompt blocked for {file_path}. Reason: {block_reason}")
+                        logger.warning("Extraction prompt blocked for %s. Reason: %s", file_path, block_reason)
                         return None
                 
-                logger.warning(f"Empty text from extraction for {file_path} on attempt {attempt + 1}")
+                logger.warning("Empty text from extraction for %s on attempt %s", file_path, attempt + 1)
                 if attempt == max_retries - 1:
-                    logger.error(f"All retries failed to extract text from {file_path}.")
+                    logger.error("All retries failed to extract text from %s.", file_path)
                     return None
                     
             except Exception as e_inner:
-                logger.error(f"Attempt {attempt + 1} failed for extraction of {file_path}: {e_inner}")
-                if attempt < max_retries - 1:
-                    logger.info(f"Retrying extraction for {file_path} in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                    retry_delay *= 2
+                logger.error("Attempt %s failed for extraction of %s: %s", attempt + 1, file_path, e_inner)
+                if attempt < max_retries - 1 and is_transient_error(e_inner):
+                    delay = get_retry_delay(attempt, retry_base_delay)
+                    logger.info("Retrying extraction for %s in %.1f seconds...", file_path, delay)
+                    time.sleep(delay)
                 else:
-                    traceback.print_exc()
-                    logger.error(f"Failed extraction for {file_path} after all retries.")
+                    logger.exception("Failed extraction for %s after attempt %s.", file_path, attempt + 1)
                     return None
                     
         return None
         
     except Exception as e:
-        logger.error(f"General error during text extraction from file {file_path}: {e}")
-        traceback.print_exc()
+        logger.exception("General error during text extraction from file %s: %s", file_path, e)
         return None
 
+def is_below_analysis_threshold(extracted_text: str) -> bool:
+    """Whether extracted text is too short to contain contract terms worth an analysis call."""
+    return len(extracted_text.strip()) < current_app.config.get('MIN_ANALYSIS_CHARS', 200)
+
 def send_file_to_remote_api(file_path: str, session_id=None, output_language='ar'):
     """
     Send file to AI API for analysis.
@@ -320,33 +886,35 @@ def send_file_to_remote_api(file_path: str, session_id=None, output_language='ar
     ext = path_obj.suffix.lower()
 
     if ext not in [".pdf", ".txt"]:
-        logger.error(f"Unsupported file type in send_file_to_remote_api: {ext}")
-        return json.dumps({"error": "نوع ملف غير مدعوم"}), None
+        logger.error("Unsupported file type in send_file_to_remote_api: %s", ext)
+        return json_utils.dumps({"error": "نوع ملف غير مدعوم"}), None
 
     extracted_markdown = extract_text_from_file(file_path)
 
     if extracted_markdown is None:
-         logger.error(f"Text extraction failed for file: {file_path}")
-         return json.dumps({"error": "فشل استخلاص النص من الملف"}), None
+         logger.error("Text extraction failed for file: %s", file_path)
+         return json_utils.dumps({"error": "فشل استخلاص النص من الملف"}), None
     elif not extracted_markdown.strip():
-         logger.warning(f"Extracted text from file is empty: {file_path}")
+         logger.warning("Extracted text from file is empty: %s", file_path)
          return "[]", ""
+    elif is_below_analysis_threshold(extracted_markdown):
+         logger.info("Extracted text from %s is too short to analyze (%s chars), skipping LLM analysis", file_path, len(extracted_markdown.strip()))
+         return "[]", extracted_markdown
 
     try:
         from config.default import DefaultConfig
         sys_prompt_template = DefaultConfig.SYS_PROMPT
         
-        logger.info(f"Analyzing extracted content from file {file_path} for session: {session_id or 'default'}")
-        formatted_sys_prompt = sys_prompt_template.format(output_language=output_language)
+        logger.info("Analyzing extracted content from file %s for session: %s", file_path, session_id or 'default')
+        static_sys_prompt, prompt_context = split_system_prompt(sys_prompt_template, output_language=output_language)
         
         analysis_response_text = send_text_to_remote_api(
-            text_payload=extracted_markdown, 
+            text_payload=f"{prompt_context}\n\n{extracted_markdown}", 
             session_id_key=f"{session_id}_analysis_file", 
-            formatted_system_prompt=formatted_sys_prompt
+            formatted_system_prompt=static_sys_prompt
         )
-        logger.info(f"Analysis complete for file {file_path}, session {session_id or 'default'}")
+        logger.info("Analysis complete for file %s, session %s", file_path, session_id or 'default')
         return analysis_response_text, extracted_markdown
     except Exception as e:
-        logger.error(f"Analysis step failed after extraction for session {session_id or 'default'} for file {file_path}: {e}")
-        traceback.print_exc()
-        return json.dumps({"error": f"فشل استدعاء API للتحليل: {str(e)}"}), extracted_markdown
+        logger.exception("Analysis step failed after extraction for session %s for file %s: %s", session_id or 'default', file_path, e)
+        return json_utils.dumps({"error": f"فشل استدعاء API للتحليل: {str(e)}"}), extracted_markdown
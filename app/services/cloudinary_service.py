@@ -9,6 +9,8 @@ import os
 import uuid
 import time
 import logging
+import threading
+from flask import current_app, has_app_context
 from app.utils.logging_utils import get_request_tracer
 
 logger = logging.getLogger(__name__)
@@ -17,16 +19,22 @@ try:
     import cloudinary
     import cloudinary.uploader
     import cloudinary.api
+    import cloudinary.utils
     CLOUDINARY_AVAILABLE = True
 except ImportError:
     logger.warning("Cloudinary package not available. File upload features will be limited.")
     CLOUDINARY_AVAILABLE = False
 
+_cloudinary_initialized = False
+_cloudinary_init_lock = threading.Lock()
+
 
 def init_cloudinary(app):
     """Initialize Cloudinary configuration."""
+    global _cloudinary_initialized
     if not CLOUDINARY_AVAILABLE:
         logger.warning("Cloudinary package not installed - file storage services will be unavailable")
+        _cloudinary_initialized = True
         return
     
     try:
@@ -48,33 +56,54 @@ def init_cloudinary(app):
     except Exception as e:
         logger.error(f"Cloudinary configuration failed: {e}")
         logger.warning("Cloudinary services will be unavailable")
+    finally:
+        # Only once cloudinary.config has run: ensure_cloudinary reads this flag without the lock
+        _cloudinary_initialized = True
+
+
+def ensure_cloudinary():
+    """Configure Cloudinary from the current app on first use (see LAZY_SERVICE_INIT)."""
+    if _cloudinary_initialized or not has_app_context():
+        return
+    with _cloudinary_init_lock:
+        if not _cloudinary_initialized:
+            init_cloudinary(current_app)
 
 
 def upload_to_cloudinary_helper(
-    local_file_path: str,
+    local_file_path: str | bytes,
     cloudinary_folder: str,
     resource_type: str = "auto",
     public_id_prefix: str = "",
-    custom_public_id: str = None
+    custom_public_id: str = None,
+    filename: str = None
 ):
     """
     Uploads a local file to Cloudinary.
     Matches OldStrcturePerfectProject/utils.py upload_to_cloudinary_helper exactly.
+    local_file_path may also be the file content as bytes, named by filename, for
+    small generated files that do not need to touch the disk.
     """
     if not CLOUDINARY_AVAILABLE:
         logger.error("Cloudinary not available for upload")
         return None
         
+    ensure_cloudinary()
     try:
-        if not isinstance(local_file_path, str):
-            raise TypeError(f"upload_to_cloudinary_helper expects a string file path, got {type(local_file_path)}")
+        upload_source = local_file_path
+        if isinstance(upload_source, (bytes, bytearray)):
+            filename = filename or "upload"
+            local_file_path = f"<{len(upload_source)} bytes as {filename}>"
+        elif isinstance(local_file_path, str):
+            filename = filename or os.path.basename(local_file_path)
+        else:
+            raise TypeError(f"upload_to_cloudinary_helper expects a string file path or bytes, got {type(local_file_path)}")
 
         from app.utils.file_helpers import clean_filename
         
         if custom_public_id:
             public_id = custom_public_id
         else:
-            filename = os.path.basename(local_file_path)
             base_name = filename.rsplit('.', 1)[0]
             public_id_suffix = clean_filename(base_name)
             public_id = f"{public_id_prefix}_{uuid.uuid4().hex}"
@@ -85,8 +114,10 @@ def upload_to_cloudinary_helper(
             "resource_type": resource_type,
             "overwrite": True
         }
+        if upload_source is not local_file_path:
+            upload_options["filename"] = filename
         
-        if "pdf_previews" in cloudinary_folder or local_file_path.lower().endswith(".pdf"):
+        if "pdf_previews" in cloudinary_folder or filename.lower().endswith(".pdf"):
             upload_options["access_mode"] = "public" 
             logger.info(f"Attempting to upload PDF with access_mode: public, resource_type: {resource_type}")
 
@@ -95,7 +126,7 @@ def upload_to_cloudinary_helper(
         tracer = get_request_tracer()
         api_start_time = time.time()
         
-        upload_result = cloudinary.uploader.upload(local_file_path, **upload_options)
+        upload_result = cloudinary.uploader.upload(upload_source, **upload_options)
         
         api_duration = time.time() - api_start_time
         
@@ -124,3 +155,30 @@ def upload_to_cloudinary_helper(
     except Exception as e:
         logger.error(f"Cloudinary upload exception for {local_file_path}: {e}", exc_info=True)
         return None
+
+
+def build_download_url(public_id: str, download_filename: str, resource_type: str = "raw"):
+    """
+    Signed CDN delivery URL that makes the browser save the asset under download_filename.
+    Lets download endpoints redirect instead of proxying the file through the worker.
+    Returns None when Cloudinary is unavailable or the URL cannot be built.
+    """
+    if not CLOUDINARY_AVAILABLE or not public_id:
+        return None
+
+    # The attachment flag takes the name without extension; Cloudinary appends the asset's own
+    attachment_name = os.path.splitext(download_filename)[0]
+    ensure_cloudinary()
+    try:
+        url, _ = cloudinary.utils.cloudinary_url(
+            public_id,
+            resource_type=resource_type,
+            type="upload",
+            secure=True,
+            sign_url=True,
+            flags=f"attachment:{attachment_name}"
+        )
+        return url
+    except Exception as e:
+        logger.error(f"Failed to build Cloudinary download URL for {public_id}: {e}")
+        return None
@@ -5,8 +5,12 @@ MongoDB connection and management for the Shariaa Contract Analyzer.
 """
 
 import logging
-from pymongo import MongoClient
-from flask import current_app
+import threading
+import importlib.util
+from pymongo import MongoClient, ASCENDING, DESCENDING
+from pymongo.write_concern import WriteConcern
+from flask import current_app, has_app_context
+from app.utils.lru_cache import LRUTTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -15,14 +19,93 @@ client = None
 db = None
 contracts_collection = None
 terms_collection = None
+terms_metadata_collection = None
 expert_feedback_collection = None
+interactions_collection = None
+_db_initialized = False
+_db_init_lock = threading.Lock()
+
+# Recently read session documents; every write to a session in this process drops its entry
+_session_docs = LRUTTLCache(maxsize=2048, ttl=30)
+
+# Fields the cached session reads need; the contract texts can run to megabytes and stay on the server
+SESSION_DOC_CACHE_FIELDS = {"pdf_preview_info": 1, "modified_contract_info": 1, "marked_contract_info": 1}
 
 DB_NAME = "shariaa_analyzer_db"
 
+# Acknowledged by the primary without waiting for a journal sync; for flags on terms that can be rederived or resubmitted
+METADATA_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# Python modules each wire compressor needs; zlib ships with Python
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def get_available_compressors(requested: str) -> list[str]:
+    """Filter a comma-separated compressor list down to the ones usable in this environment."""
+    available = []
+    for name in (c.strip() for c in requested.split(",")):
+        module = COMPRESSOR_MODULES.get(name)
+        if module and importlib.util.find_spec(module) is not None:
+            available.append(name)
+    return available
+
+
+def ensure_collections(database, block_compressor: str):
+    """
+    Create the text-heavy collections with the given WiredTiger block compressor.
+    Contract texts compress well; existing collections keep the compressor they were created with.
+    """
+    if not block_compressor:
+        return
+    try:
+        existing = set(database.list_collection_names())
+        for name in ("contracts", "terms", "interactions"):
+            if name not in existing:
+                database.create_collection(
+                    name,
+                    storageEngine={"wiredTiger": {"configString": f"block_compressor={block_compressor}"}}
+                )
+                logger.info(f"Created collection {name} with {block_compressor} block compression")
+    except Exception as e:
+        logger.warning(f"MongoDB collection creation with {block_compressor} compression failed: {e}")
+
+
+def ensure_indexes():
+    """
+    Create the indexes the route queries rely on; failures only cost query speed.
+    Each index is attempted on its own so one conflict does not leave the rest missing.
+    """
+    index_specs = [
+        # Serves find({"session_id": ...}) as well as the (session_id, term_id) lookups
+        (terms_collection, [("session_id", ASCENDING), ("term_id", ASCENDING)], {}),
+        (terms_collection, [("session_id", ASCENDING), ("sort_rank", ASCENDING)], {}),
+        (terms_collection, [("is_valid_sharia", ASCENDING)], {"partialFilterExpression": {"is_valid_sharia": True}}),
+        (contracts_collection, [("status", ASCENDING)], {}),
+        # Sort orders of /api/history, /sessions and /history
+        (contracts_collection, [("analysis_timestamp", DESCENDING)], {}),
+        (contracts_collection, [("created_at", DESCENDING)], {}),
+        (contracts_collection, [("status", ASCENDING), ("completed_at", DESCENDING)], {}),
+        # Looks up modified contracts already rendered from identical inputs
+        (contracts_collection, [("regeneration_cache_key", ASCENDING)],
+         {"partialFilterExpression": {"regeneration_cache_key": {"$type": "string"}}}),
+        (expert_feedback_collection, [("session_id", ASCENDING), ("term_id", ASCENDING)], {}),
+        (interactions_collection, [("session_id", ASCENDING), ("timestamp", ASCENDING)], {}),
+    ]
+    for collection, keys, options in index_specs:
+        try:
+            collection.create_index(keys, **options)
+        except Exception as e:
+            logger.warning(f"MongoDB index creation failed for {collection.name} {keys}: {e}")
+
 
 def init_db(app):
-    """Initialize database connection."""
-    global client, db, contracts_collection, terms_collection, expert_feedback_collection
+    """
+    Initialize the process-wide MongoDB client.
+    Routes share its connection pool through the module-level collections and never open their own client.
+    A failed connection is not retried; the collections stay None for the life of the process.
+    """
+    global client, db, contracts_collection, terms_collection, terms_metadata_collection
+    global expert_feedback_collection, interactions_collection, _db_initialized
     
     try:
         mongo_uri = app.config.get('MONGO_URI')
@@ -30,13 +113,31 @@ def init_db(app):
             logger.warning("MONGO_URI not configured - database services will be unavailable")
             return
             
+        _session_docs.ttl = app.config.get('SESSION_DOC_CACHE_TTL_SECONDS', 30)
+
         logger.info("Attempting to connect to MongoDB...")
-        client = MongoClient(mongo_uri, serverSelectionTimeoutMS=45000)
+        client = MongoClient(
+            mongo_uri,
+            maxPoolSize=app.config.get('MONGO_MAX_POOL_SIZE', 50),
+            minPoolSize=app.config.get('MONGO_MIN_POOL_SIZE', 5),
+            maxIdleTimeMS=app.config.get('MONGO_MAX_IDLE_TIME_MS', 60000),
+            waitQueueTimeoutMS=app.config.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2500),
+            compressors=get_available_compressors(app.config.get('MONGO_COMPRESSORS', 'zlib')),
+            retryWrites=True,
+            w=1,
+            serverSelectionTimeoutMS=45000,
+            socketTimeoutMS=app.config.get('MONGO_SOCKET_TIMEOUT_MS', 20000),
+            appname="shariaa-analyzer"
+        )
         client.admin.command('ping')
         db = client[DB_NAME]
+        ensure_collections(db, app.config.get('MONGO_BLOCK_COMPRESSOR', 'zstd'))
         contracts_collection = db.contracts
         terms_collection = db.terms
+        terms_metadata_collection = terms_collection.with_options(write_concern=METADATA_WRITE_CONCERN)
         expert_feedback_collection = db.expert_feedback
+        interactions_collection = db.interactions
+        ensure_indexes()
         logger.info(f"Successfully connected to MongoDB: {DB_NAME}")
     except Exception as e:
         logger.error(f"MongoDB connection failed: {e}")
@@ -46,19 +147,72 @@ def init_db(app):
         db = None
         contracts_collection = None
         terms_collection = None
+        terms_metadata_collection = None
         expert_feedback_collection = None
+        interactions_collection = None
+    finally:
+        # Only once the collections are assigned: _ensure_db reads this flag without the lock
+        _db_initialized = True
+
+
+def _ensure_db():
+    """Connect on first use with the current app's config (see LAZY_SERVICE_INIT)."""
+    if _db_initialized or not has_app_context():
+        return
+    with _db_init_lock:
+        if not _db_initialized:
+            init_db(current_app)
 
 
 def get_contracts_collection():
     """Get contracts collection."""
+    _ensure_db()
     return contracts_collection
 
 
 def get_terms_collection():
     """Get terms collection."""
+    _ensure_db()
     return terms_collection
 
 
+def get_terms_metadata_collection():
+    """
+    Get the terms collection with METADATA_WRITE_CONCERN, for user-facing flags
+    (confirmation, expert feedback, sort ranks) where a journal sync is not worth the latency.
+    """
+    _ensure_db()
+    return terms_metadata_collection
+
+
+def get_session_doc(session_id: str) -> dict | None:
+    """
+    Generated-file metadata of a contract session (SESSION_DOC_CACHE_FIELDS),
+    served from a short-lived in-process cache.
+    Other workers' writes become visible once the entry expires, so only use this where a
+    few seconds of staleness is harmless. The returned document is shared: do not mutate it.
+    """
+    session_doc = _session_docs.get(session_id)
+    _ensure_db()
+    if session_doc is None and contracts_collection is not None:
+        session_doc = contracts_collection.find_one({"_id": session_id}, SESSION_DOC_CACHE_FIELDS)
+        if session_doc is not None:
+            _session_docs[session_id] = session_doc
+    return session_doc
+
+
+def invalidate_session_doc(session_id: str):
+    """Drop a session document from the cache after writing to it."""
+    _session_docs.pop(session_id)
+
+
 def get_expert_feedback_collection():
     """Get expert feedback collection."""
-    return expert_feedback_collection
\ No newline at end of file
+    _ensure_db()
+    return expert_feedback_collection
+
+
+def get_interactions_collection():
+    """Get interactions collection (full question/answer log of every session)."""
+    _ensure_db()
+    return interactions_collection
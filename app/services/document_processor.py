@@ -3,6 +3,7 @@ Document processing service for DOCX manipulation and conversion.
 Matches OldStrcturePerfectProject/doc_processing.py exactly.
 """
 
+import io
 import os
 import uuid
 import re
@@ -30,12 +31,25 @@ import time
 logger = logging.getLogger(__name__)
 
 
+def _runs_to_markdown(runs) -> str:
+    """Markdown for a paragraph's runs, wrapping bold, italic and underlined text in their markers."""
+    parts = []
+    for run in runs:
+        text = run.text
+        if run.bold: text = f"**{text}**"
+        if run.italic: text = f"*{text}*"
+        if run.underline: text = f"__{text}__"
+        parts.append(text)
+    return "".join(parts)
+
+
 def build_structured_text_for_analysis(doc: DocxDocument) -> tuple[str, str]:
     """
     Extracts text from a DOCX document, converting it to a markdown-like format
     that preserves bold, italic, and underline formatting, while also assigning
     unique IDs to paragraphs and table cell content for precise term identification.
     Returns a structured markdown string with IDs and a plain text version.
+    Both are assembled from part lists joined once, and each paragraph's text is read once.
     """
     structured_markdown = []
     plain_text_parts = []
@@ -45,20 +59,15 @@ def build_structured_text_for_analysis(doc: DocxDocument) -> tuple[str, str]:
     for element in doc.element.body:
         if isinstance(element, CT_P):
             para = Paragraph(element, doc)
-            if para.text.strip():
+            para_text = para.text
+            if para_text.strip():
                 para_id = f"para_{para_idx_counter_body}"
                 
                 # Convert paragraph to markdown while preserving formatting
-                markdown_line = ""
-                for run in para.runs:
-                    text = run.text
-                    if run.bold: text = f"**{text}**"
-                    if run.italic: text = f"*{text}*"
-                    if run.underline: text = f"__{text}__"
-                    markdown_line += text
+                markdown_line = _runs_to_markdown(para.runs)
                 
                 structured_markdown.append(f"[[ID:{para_id}]]\n{markdown_line}")
-                plain_text_parts.append(para.text)
+                plain_text_parts.append(para_text)
                 para_idx_counter_body += 1
 
         elif isinstance(element, CT_Tbl):
@@ -70,43 +79,30 @@ def build_structured_text_for_analysis(doc: DocxDocument) -> tuple[str, str]:
             # Convert table to markdown table format
             md_table = []
             for r_idx, row in enumerate(table.rows):
+                # row.cells rebuilds the cell grid on every access
+                cells = row.cells
                 row_text_parts = []
                 row_plain_parts = []
-                for c_idx, cell in enumerate(row.cells):
+                for c_idx, cell in enumerate(cells):
                     cell_id_prefix = f"{table_id_prefix}_r{r_idx}_c{c_idx}"
-                    cell_para_idx_counter = 0
-                    cell_markdown_content = ""
-                    cell_plain_content = ""
+                    cell_markdown_lines = []
+                    cell_plain_lines = []
 
                     for para_in_cell in cell.paragraphs:
-                        if para_in_cell.text.strip():
-                            cell_para_id = f"{cell_id_prefix}_p{cell_para_idx_counter}"
-                            
-                            md_line_cell = ""
-                            for run in para_in_cell.runs:
-                                text = run.text
-                                if run.bold: text = f"**{text}**"
-                                if run.italic: text = f"*{text}*"
-                                if run.underline: text = f"__{text}__"
-                                md_line_cell += text
-
-                            # Add ID only to the first part of the cell content for clarity
-                            if cell_para_idx_counter == 0:
-                                cell_markdown_content += f"[[ID:{cell_para_id}]] {md_line_cell}"
-                            else:
-                                cell_markdown_content += f"\n[[ID:{cell_para_id}]] {md_line_cell}"
-                            
-                            cell_plain_content += para_in_cell.text + "\n"
-                            cell_para_idx_counter += 1
+                        para_in_cell_text = para_in_cell.text
+                        if para_in_cell_text.strip():
+                            cell_para_id = f"{cell_id_prefix}_p{len(cell_markdown_lines)}"
+                            cell_markdown_lines.append(f"[[ID:{cell_para_id}]] {_runs_to_markdown(para_in_cell.runs)}")
+                            cell_plain_lines.append(para_in_cell_text)
                     
-                    row_text_parts.append(cell_markdown_content.replace("\n", "<br>"))
-                    row_plain_parts.append(cell_plain_content.strip())
+                    row_text_parts.append("<br>".join(line.replace("\n", "<br>") for line in cell_markdown_lines))
+                    row_plain_parts.append("\n".join(cell_plain_lines).strip())
 
                 md_table.append("| " + " | ".join(row_text_parts) + " |")
                 plain_text_parts.append(" | ".join(row_plain_parts))
 
                 if r_idx == 0:
-                    md_table.append("|" + " --- |" * len(row.cells))
+                    md_table.append("|" + " --- |" * len(cells))
             
             structured_markdown.extend(md_table)
             structured_markdown.append(f"[[TABLE_END:{table_id_prefix}]]")
@@ -273,7 +269,7 @@ def _determine_style_and_text(line: str, contract_language: str) -> tuple[str, s
 
 def create_docx_from_llm_markdown(
     original_markdown_text: str, 
-    output_path: str, 
+    output_path: str | io.BytesIO, 
     contract_language: str = 'ar', 
     terms_for_marking: list[dict] | dict | None = None,
     confirmed_modifications: dict | None = None
@@ -281,6 +277,7 @@ def create_docx_from_llm_markdown(
     """
     Creates a professional DOCX document from markdown text with term highlighting.
     Matches OldStrcturePerfectProject/doc_processing.py exactly.
+    output_path may be a writable binary stream to keep the document in memory.
     """
     try:
         doc = DocxDocument()
@@ -713,10 +710,13 @@ def create_docx_from_llm_markdown(
                 table_sig.cell(1, 0).text = "\nName:\nID:\nSignature:\n____________________"
                 table_sig.cell(1, 1).text = "\nName:\nID:\nSignature:\n____________________"
 
-        ensure_dir(os.path.dirname(output_path))
-        doc.save(output_path)
-        
-        logger.info(f"DOCX document created successfully: {output_path}")
+        if isinstance(output_path, str):
+            ensure_dir(os.path.dirname(output_path))
+            doc.save(output_path)
+            logger.info(f"DOCX document created successfully: {output_path}")
+        else:
+            doc.save(output_path)
+            logger.info("DOCX document created successfully in memory")
         return output_path
         
     except Exception as e:
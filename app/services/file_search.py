@@ -1,5 +1,4 @@
 import time
-import json
 import re
 import hashlib
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -9,6 +8,7 @@ from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 from flask import current_app
 from app.utils.logging_utils import get_logger, mask_key, get_trace_id, RequestTimer, get_request_tracer
+from app.utils import json_utils
 
 logger = get_logger(__name__)
 
@@ -54,7 +54,7 @@ def validate_json_response(response_text: str, expected_type: str = "array") ->
             cleaned = json_match.group(0)
     
     try:
-        parsed = json.loads(cleaned)
+        parsed = json_utils.loads(cleaned)
         
         if expected_type == "array" and not isinstance(parsed, list):
             return False, None, f"Expected array, got {type(parsed).__name__}"
@@ -63,7 +63,7 @@ def validate_json_response(response_text: str, expected_type: str = "array") ->
         
         return True, parsed, "Valid JSON"
         
-    except json.JSONDecodeError as e:
+    except json_utils.JSONDecodeError as e:
         error_context = cleaned[max(0, e.pos - 20):e.pos + 20] if hasattr(e, 'pos') else cleaned[:50]
         return False, None, f"JSON parse error at position {e.pos}: {e.msg}. Context: ...{error_context}..."
 
@@ -584,7 +584,7 @@ class FileSearchService:
                 logger.info("No terms extracted, using contract excerpt")
                 extracted_clauses_text = contract_text[:2000]
             else:
-                extracted_clauses_text = json.dumps(extracted_terms, ensure_ascii=False, indent=2)
+                extracted_clauses_text = json_utils.dumps(extracted_terms, indent=True)
             
             search_timer.start_step("general_search")
             logger.info("STEP 2: General Search")
@@ -0,0 +1,312 @@
+"""
+Response Cache Service
+
+Persistent, content-addressed cache for LLM responses.
+Backed by SQLite so cached answers survive restarts and are shared between workers.
+An optional semantic layer matches near-duplicate payloads by embedding similarity.
+"""
+
+import os
+import math
+import time
+import array
+import sqlite3
+import hashlib
+import logging
+import operator
+import threading
+import contextlib
+from flask import current_app
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_response_cache = None
+_semantic_cache = None
+_response_cache_lock = threading.Lock()
+
+
+class ResponseCache:
+    """SQLite-backed key/value store with per-entry expiry and LRU eviction."""
+
+    def __init__(self, db_path: str, default_ttl: int = 7 * 86400, max_entries: int = 10000):
+        self.db_path = db_path
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+
+        cache_dir = os.path.dirname(db_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Connection committed on success, rolled back on error, and always closed."""
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=5)) as conn, conn:
+            yield conn
+
+    @staticmethod
+    def build_key(*parts) -> str:
+        """Build a stable cache key from the inputs that determine a response."""
+        digest = hashlib.blake2b(digest_size=32)
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode('utf-8')
+            elif not isinstance(part, (bytes, bytearray, memoryview)):
+                part = str(part).encode('utf-8')
+            digest.update(len(part).to_bytes(8, 'big'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached value for key, or None when missing or expired."""
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                if row[1] < now:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    return None
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                return row[0]
+        except sqlite3.Error as e:
+            logger.warning("Response cache read failed: %s", e)
+            return None
+
+    def set(self, key: str, value: str, ttl: int | None = None):
+        """Store value under key, evicting least recently used entries over the limit."""
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.default_ttl)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now)
+                )
+                conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            logger.warning("Response cache write failed: %s", e)
+
+    def delete(self, key: str):
+        """Drop the entry for key, e.g. a response that turned out to be unusable."""
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning("Response cache delete failed: %s", e)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+
+class RedisResponseCache(ResponseCache):
+    """
+    Redis-backed variant shared by every worker and instance pointing at the same server.
+    Expiry is delegated to Redis TTLs and eviction to the server's maxmemory policy.
+    """
+
+    def __init__(self, url: str, default_ttl: int = 7 * 86400, prefix: str = "llm_cache:"):
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+
+    def get(self, key: str) -> str | None:
+        try:
+            value = self._redis.get(self.prefix + key)
+        except redis.RedisError as e:
+            logger.warning("Response cache read failed: %s", e)
+            return None
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key: str, value: str, ttl: int | None = None):
+        try:
+            self._redis.set(self.prefix + key, value.encode('utf-8'), ex=ttl if ttl is not None else self.default_ttl)
+        except redis.RedisError as e:
+            logger.warning("Response cache write failed: %s", e)
+
+    def delete(self, key: str):
+        try:
+            self._redis.delete(self.prefix + key)
+        except redis.RedisError as e:
+            logger.warning("Response cache delete failed: %s", e)
+
+
+class SemanticCache:
+    """
+    Embedding index over cached responses.
+    Vectors are grouped by scope (model, temperature and system prompt) so a
+    near-duplicate payload only ever matches answers produced under the same prompt.
+    """
+
+    def __init__(self, response_cache: ResponseCache, threshold: float = 0.97, max_entries_per_scope: int = 1000,
+                 db_path: str | None = None):
+        self.response_cache = response_cache
+        self.db_path = db_path or response_cache.db_path
+        self.threshold = threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self._index: dict[str, list[tuple[str, array.array]]] = {}
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, scope TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_scope ON embeddings (scope, created_at)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=5)) as conn, conn:
+            yield conn
+
+    @staticmethod
+    def _normalize(vector) -> array.array:
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return array.array('f', (v / norm for v in vector))
+
+    def _load_scope(self, scope: str) -> list[tuple[str, array.array]]:
+        entries = self._index.get(scope)
+        if entries is not None:
+            return entries
+        entries = []
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT key, vector FROM embeddings WHERE scope = ? ORDER BY created_at DESC LIMIT ?",
+                    (scope, self.max_entries_per_scope)
+                ).fetchall()
+            for key, blob in rows:
+                vector = array.array('f')
+                vector.frombytes(blob)
+                entries.append((key, vector))
+        except sqlite3.Error as e:
+            logger.warning("Semantic cache load failed: %s", e)
+        self._index[scope] = entries
+        return entries
+
+    def lookup(self, scope: str, embedding) -> tuple[str, float] | None:
+        """Return (cached_response, similarity) for the closest match above the threshold."""
+        query = self._normalize(embedding)
+        with self._lock:
+            entries = list(self._load_scope(scope))
+
+        best_key, best_score = None, -1.0
+        for key, vector in entries:
+            if len(vector) != len(query):
+                continue
+            score = sum(map(operator.mul, query, vector))
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if best_key is None or best_score < self.threshold:
+            return None
+        cached_text = self.response_cache.get(best_key)
+        if cached_text is None:
+            return None
+        return cached_text, best_score
+
+    def add(self, scope: str, key: str, embedding):
+        """Index the embedding of a payload whose response is stored under key."""
+        vector = self._normalize(embedding)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, scope, vector, created_at) VALUES (?, ?, ?, ?)",
+                    (key, scope, vector.tobytes(), time.time())
+                )
+        except sqlite3.Error as e:
+            logger.warning("Semantic cache write failed: %s", e)
+            return
+        with self._lock:
+            entries = self._load_scope(scope)
+            entries.insert(0, (key, vector))
+            del entries[self.max_entries_per_scope:]
+
+    def remove(self, key: str):
+        """Stop matching against the payload stored under key."""
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning("Semantic cache delete failed: %s", e)
+        with self._lock:
+            for scope, entries in self._index.items():
+                self._index[scope] = [entry for entry in entries if entry[0] != key]
+
+
+def get_response_cache() -> ResponseCache | None:
+    """
+    Get the process-wide response cache, or None when caching is disabled.
+    Uses Redis when REDIS_URL is set and the client is installed, SQLite otherwise.
+    """
+    global _response_cache
+    if not current_app.config.get('ENABLE_LLM_CACHE', True):
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                redis_url = current_app.config.get('REDIS_URL')
+                ttl = current_app.config.get('LLM_CACHE_TTL_SECONDS', 7 * 86400)
+                if redis_url and REDIS_AVAILABLE:
+                    _response_cache = RedisResponseCache(redis_url, default_ttl=ttl)
+                    logger.info("LLM response cache initialized on Redis")
+                else:
+                    if redis_url:
+                        logger.warning("REDIS_URL is set but the redis package is not installed, using SQLite cache")
+                    _response_cache = ResponseCache(
+                        _get_cache_path(),
+                        default_ttl=ttl,
+                        max_entries=current_app.config.get('LLM_CACHE_MAX_ENTRIES', 10000)
+                    )
+                    logger.info("LLM response cache initialized at %s", _response_cache.db_path)
+    return _response_cache
+
+
+def _get_cache_path() -> str:
+    return current_app.config.get('LLM_CACHE_PATH', os.path.join('.llm_cache', 'responses.sqlite3'))
+
+
+def get_semantic_cache() -> SemanticCache | None:
+    """Get the process-wide semantic cache, or None when it is disabled."""
+    global _semantic_cache
+    if not current_app.config.get('ENABLE_SEMANTIC_CACHE', False):
+        return None
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return None
+    if _semantic_cache is None:
+        with _response_cache_lock:
+            if _semantic_cache is None:
+                cache_path = _get_cache_path()
+                cache_dir = os.path.dirname(cache_path)
+                if cache_dir:
+                    os.makedirs(cache_dir, exist_ok=True)
+                _semantic_cache = SemanticCache(
+                    response_cache,
+                    threshold=current_app.config.get('SEMANTIC_CACHE_THRESHOLD', 0.97),
+                    max_entries_per_scope=current_app.config.get('SEMANTIC_CACHE_MAX_ENTRIES', 1000),
+                    db_path=cache_path
+                )
+    return _semantic_cache
@@ -5,6 +5,8 @@ Common utilities shared across analysis route modules.
 """
 
 import os
+import time
+import datetime
 import tempfile
 
 # Temporary folder setup
@@ -12,4 +14,21 @@ APP_TEMP_BASE_DIR = os.path.join(tempfile.gettempdir(), "shariaa_analyzer_temp")
 TEMP_PROCESSING_FOLDER = os.path.join(APP_TEMP_BASE_DIR, "processing_files")
 
 # Ensure directories exist
-os.makedirs(TEMP_PROCESSING_FOLDER, exist_ok=True)
\ No newline at end of file
+os.makedirs(TEMP_PROCESSING_FOLDER, exist_ok=True)
+
+# (epoch second, its ISO string), replaced as a whole so concurrent readers never see a torn pair
+_last_timestamp = (0, "")
+
+
+def now_iso() -> str:
+    """
+    Local time as an ISO 8601 string at one-second resolution.
+    Formatted once per second, for high-frequency responses such as health probes.
+    """
+    global _last_timestamp
+    second = int(time.time())
+    cached_second, cached_iso = _last_timestamp
+    if second != cached_second:
+        cached_iso = datetime.datetime.fromtimestamp(second).isoformat()
+        _last_timestamp = (second, cached_iso)
+    return cached_iso
@@ -0,0 +1,75 @@
+"""
+JSON helpers for the Shariaa Contract Analyzer.
+Uses orjson when it is installed and falls back to the standard library otherwise.
+"""
+
+import json
+import datetime
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers only need to catch the latter
+JSONDecodeError = json.JSONDecodeError
+
+
+def _default(obj):
+    # orjson serializes datetimes natively; this keeps the fallback in the same ISO format
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def loads(data: str | bytes):
+    """Parse a JSON document."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumpb(obj, indent: bool = False, sort_keys: bool = False) -> bytes:
+    """
+    Serialize obj to UTF-8 encoded JSON bytes, ready to write to a binary file.
+    Datetimes become ISO 8601 strings and other values JSON cannot represent
+    (such as ObjectId) are converted with str(), at any nesting depth.
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option)
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None, sort_keys=sort_keys, default=_default).encode('utf-8')
+
+
+def dumps(obj, indent: bool = False, sort_keys: bool = False) -> str:
+    """Serialize obj to a JSON string (UTF-8 text, non-ASCII characters left unescaped)."""
+    return dumpb(obj, indent=indent, sort_keys=sort_keys).decode('utf-8')
+
+
+def json_response(obj, status: int = 200):
+    """
+    Flask JSON response for MongoDB documents, serialized in one pass without
+    converting ObjectId and datetime values beforehand.
+    """
+    return Response(dumpb(obj), status=status, mimetype='application/json')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson, used by request.get_json() and jsonify().
+    Non-ASCII text is emitted as UTF-8 rather than \\u escapes, and datetimes as ISO 8601.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps(obj, sort_keys=kwargs.get("sort_keys", self.sort_keys))
+
+    def loads(self, s: str | bytes, **kwargs):
+        return loads(s)
@@ -1,12 +1,12 @@
 import logging
-import uuid
+import secrets
 import threading
-import json
 import os
 from datetime import datetime
 from typing import Optional, Any, Dict, List
 from functools import wraps
 import time
+from app.utils import json_utils
 
 _trace_id_storage = threading.local()
 _request_tracer_storage = threading.local()
@@ -33,14 +33,14 @@ SERVICE_TAGS = {
 def get_trace_id() -> str:
     trace_id = getattr(_trace_id_storage, 'trace_id', None)
     if trace_id is None:
-        trace_id = str(uuid.uuid4())[:8]
+        trace_id = secrets.token_hex(4)
         _trace_id_storage.trace_id = trace_id
     return trace_id
 
 
 def set_trace_id(trace_id: Optional[str] = None) -> str:
     if trace_id is None:
-        trace_id = str(uuid.uuid4())[:8]
+        trace_id = secrets.token_hex(4)
     _trace_id_storage.trace_id = trace_id
     return trace_id
 
@@ -188,6 +188,8 @@ def create_success_response(data: dict, message: str = "Operation completed succ
 class RequestTracer:
     
     TRACES_DIR = "traces"
+    # One summary line per saved trace, so listing traces does not open every file
+    INDEX_FILENAME = "_index.jsonl"
     
     def __init__(self, trace_id: Optional[str] = None, endpoint: str = "unknown"):
         self.trace_id = trace_id or get_trace_id()
@@ -383,10 +385,40 @@ class RequestTracer:
         filename = f"trace_{self.trace_id}_{timestamp}.json"
         filepath = os.path.join(self.TRACES_DIR, filename)
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(trace_data, f, ensure_ascii=False, indent=2)
+        with open(filepath, 'wb') as f:
+            f.write(json_utils.dumpb(trace_data, indent=True))
+        
+        # The index is seeded by the first listing; until then a listing scans every file anyway
+        index_path = os.path.join(self.TRACES_DIR, self.INDEX_FILENAME)
+        if os.path.exists(index_path):
+            try:
+                entry = self.build_index_entry(filename, trace_data, os.stat(filepath))
+                # A single small append is atomic, so concurrent workers do not interleave lines
+                with open(index_path, 'a', encoding='utf-8') as f:
+                    f.write(json_utils.dumps(entry) + "\n")
+            except OSError as e:
+                logging.getLogger(__name__).warning("Could not update trace index: %s", e)
         
         return filepath
+    
+    @staticmethod
+    def build_index_entry(filename: str, trace_data: Dict[str, Any], stat: os.stat_result) -> Dict[str, Any]:
+        """Summary of a saved trace as listed by /admin/traces."""
+        metadata = trace_data.get("metadata", {})
+        summary = trace_data.get("summary", {})
+        return {
+            "filename": filename,
+            "size_bytes": stat.st_size,
+            "created_at": datetime.fromtimestamp(stat.st_ctime).isoformat(),
+            "modified_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            "trace_id": trace_data.get("trace_id"),
+            "endpoint": metadata.get("endpoint"),
+            "session_id": metadata.get("session_id"),
+            "duration_seconds": summary.get("total_duration_seconds"),
+            "status": summary.get("status"),
+            "steps_count": summary.get("total_steps"),
+            "api_calls_count": summary.get("total_api_calls"),
+        }
 
 
 def get_request_tracer() -> Optional[RequestTracer]:
@@ -0,0 +1,80 @@
+"""
+Bounded in-memory cache for the Shariaa Contract Analyzer.
+Least recently used entries are evicted first and entries expire after a TTL.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUTTLCache:
+    """Thread-safe mapping with a maximum size and per-entry time to live."""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.lock = threading.RLock()
+
+    def _expired(self, expires_at: float) -> bool:
+        return expires_at < time.monotonic()
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it as recently used."""
+        with self.lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if self._expired(expires_at):
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store value under key, evicting the least recently used entries over maxsize."""
+        with self.lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            self.expire()
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def expire(self):
+        """Drop every expired entry."""
+        with self.lock:
+            now = time.monotonic()
+            for key in [k for k, (_, expires_at) in self._data.items() if expires_at < now]:
+                del self._data[key]
+
+    def clear(self):
+        with self.lock:
+            self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self._data[key]
+
+    def __len__(self) -> int:
+        with self.lock:
+            self.expire()
+            return len(self._data)
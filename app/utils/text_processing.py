@@ -5,9 +5,10 @@ Matches OldStrcturePerfectProject/utils.py and api_server.py exactly.
 
 import re
 import uuid
-import json
 import logging
+import functools
 from unidecode import unidecode
+from app.utils import json_utils
 
 logger = logging.getLogger(__name__)
 
@@ -61,9 +62,9 @@ def clean_model_response(response_text: str | None) -> str:
         if last_index > start_index:
             potential_json = response_text[start_index : last_index + 1].strip()
             try:
-                json.loads(potential_json)
+                json_utils.loads(potential_json)
                 return potential_json
-            except json.JSONDecodeError:
+            except json_utils.JSONDecodeError:
                 pass 
 
     cleaned_text = response_text.strip()
@@ -148,6 +149,29 @@ def translate_arabic_to_english(arabic_text):
         return f"contract_{uuid.uuid4().hex[:8]}"
 
 
+# Markdown markup dropped to get the plain contract text. The leading lookahead lets the
+# engine skip ordinary characters without trying every alternative at each position
+_MD_STRIP_RE = re.compile(r'(?=[#*_`\[])(?:^#+\s*|\*\*|\*|__|`|\[\[.*?\]\])', re.MULTILINE)
+
+
+def strip_markdown(markdown_text: str | None) -> str:
+    """Plain contract text from extracted markdown: headings, emphasis, code ticks and [[...]] markers removed."""
+    if not markdown_text:
+        return ""
+    return _MD_STRIP_RE.sub('', markdown_text).strip()
+
+
+def get_contract_plain_text(session_doc: dict) -> str:
+    """
+    Plain contract text of a session.
+    PDF/TXT sessions only store the extracted markdown, so the plain text is derived on demand.
+    """
+    plain_text = session_doc.get("original_contract_plain")
+    if plain_text is not None:
+        return plain_text
+    return strip_markdown(session_doc.get("original_contract_markdown"))
+
+
 def normalize_text_for_matching(text: str) -> str:
     """
     Normalizes text for flexible matching by:
@@ -339,6 +363,24 @@ def _try_match_at_position(source_text: str, start_pos: int, normalized_target:
     return None
 
 
+# Arabic, Arabic Supplement and the Arabic presentation forms
+_ARABIC_LETTER_RE = re.compile(r'[\u0600-\u06FF\u0750-\u077F\uFB50-\uFDFF\uFE70-\uFEFF]')
+_LETTER_RE = re.compile(r'[^\W\d_]')
+
+
+def detect_contract_language(text: str, sample_size: int = 1000) -> str:
+    """
+    'ar' when most letters in the leading sample are Arabic, 'en' otherwise.
+    Contracts are either Arabic or English, so counting letters by script is enough
+    and, unlike a statistical detector, gives the same answer on every call.
+    """
+    sample = text[:sample_size]
+    letters = len(_LETTER_RE.findall(sample))
+    if not letters:
+        return 'ar'
+    return 'ar' if len(_ARABIC_LETTER_RE.findall(sample)) * 2 > letters else 'en'
+
+
 def _is_arabic_language(contract_language: str) -> bool:
     """Check if the language string indicates Arabic."""
     if not contract_language:
@@ -596,6 +638,30 @@ def _find_term_in_source_excluding(source_text: str, search_text: str, excluded_
     return None
 
 
+_TERM_ID_NUMBERS_RE = re.compile(r'\d+')
+# Clauses sort before DOCX paragraphs, which sort before any other id
+_TERM_RANK_BANDS = {"clause_": 0, "para_": 1}
+_TERM_RANK_BAND_SIZE = 1 << 48
+
+
+@functools.lru_cache(maxsize=4096)
+def term_sort_rank(term_id: str | None) -> int:
+    """
+    Integer sort key for a term id, stored with each term so MongoDB can return terms in contract order.
+    clause_7 ranks by its number; para_3_2 packs up to three numeric levels into 16 bits each.
+    Memoized, since the same ids (clause_1, para_2_1, ...) recur across contracts.
+    """
+    term_id = term_id or ""
+    band = next((rank for prefix, rank in _TERM_RANK_BANDS.items() if term_id.startswith(prefix)), len(_TERM_RANK_BANDS))
+    numbers = [min(int(n), 0xFFFF) for n in _TERM_ID_NUMBERS_RE.findall(term_id)[:3]]
+    if band == len(_TERM_RANK_BANDS) or not numbers:
+        return (band + 1) * _TERM_RANK_BAND_SIZE - 1
+    packed = 0
+    for level, number in enumerate(numbers):
+        packed |= number << (32 - 16 * level)
+    return band * _TERM_RANK_BAND_SIZE + packed
+
+
 def generate_safe_public_id(base_name, prefix="", max_length=50):
     """
     Generates a safe, short public_id for Cloudinary uploads.
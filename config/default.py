@@ -28,14 +28,82 @@ class DefaultConfig:
     
     SECRET_KEY: str = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
     DEBUG: bool = os.environ.get('DEBUG', 'True').lower() == 'true'
+    # Grants /admin/traces access outside debug mode (X-Trace-Access-Key header or access_key param)
+    TRACE_ACCESS_KEY: str | None = os.environ.get('TRACE_ACCESS_KEY')
+    # Reverse proxies (TLS terminators) in front of the app whose X-Forwarded-* headers are trusted; set per deployment, 0 trusts none
+    TRUSTED_PROXY_COUNT: int = int(os.environ.get('TRUSTED_PROXY_COUNT', '0'))
+    # Connect MongoDB, Cloudinary and GenAI on first use instead of in create_app
+    LAZY_SERVICE_INIT: bool = os.environ.get('LAZY_SERVICE_INIT', 'True').lower() == 'true'
+    # How long browsers may cache a CORS preflight response
+    CORS_MAX_AGE_SECONDS: int = int(os.environ.get('CORS_MAX_AGE_SECONDS', '3600'))
     
     # Note: Do NOT use GOOGLE_API_KEY - it conflicts with google-genai library auto-detection
     # Use only GEMINI_API_KEY for analysis and GEMINI_FILE_SEARCH_API_KEY for file search
     GEMINI_API_KEY: str | None = os.environ.get("GEMINI_API_KEY")
     MODEL_NAME: str = os.environ.get("MODEL_NAME", "gemini-2.5-flash")
     TEMPERATURE: int = int(os.environ.get("TEMPERATURE", "0"))
+    # Maximum concurrent Gemini calls when extracting a large PDF chunk by chunk
+    GEMINI_MAX_CONCURRENCY: int = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8"))
+    # Shared GenAI HTTP connection pool, and whether to open it at startup
+    GEMINI_HTTP_MAX_CONNECTIONS: int = int(os.environ.get("GEMINI_HTTP_MAX_CONNECTIONS", "64"))
+    GEMINI_HTTP_MAX_KEEPALIVE: int = int(os.environ.get("GEMINI_HTTP_MAX_KEEPALIVE", "32"))
+    GEMINI_WARMUP: bool = os.environ.get("GEMINI_WARMUP", "True").lower() == "true"
+    # Chat sessions kept in memory per worker (least recently used evicted first)
+    CHAT_SESSION_CACHE_SIZE: int = int(os.environ.get("CHAT_SESSION_CACHE_SIZE", "512"))
+    CHAT_SESSION_TTL_SECONDS: int = int(os.environ.get("CHAT_SESSION_TTL_SECONDS", "3600"))
+    # Files larger than this are streamed through the Gemini Files API instead of sent inline
+    INLINE_FILE_MAX_BYTES: int = int(os.environ.get("INLINE_FILE_MAX_BYTES", str(8 * 1024 * 1024)))
+    # PDFs longer than this many pages are split and extracted in parallel (requires pypdf)
+    PDF_CHUNK_PAGES: int = int(os.environ.get("PDF_CHUNK_PAGES", "10"))
+    # "pymupdf" reads the PDF text layer locally (requires PyMuPDF) and only sends scanned PDFs to Gemini
+    PDF_EXTRACTOR: str = os.environ.get("PDF_EXTRACTOR", "gemini").lower()
+    # Pages read by the local extractor (0 for all) and the text per page below which a PDF counts as scanned
+    PDF_EXTRACT_MAX_PAGES: int = int(os.environ.get("PDF_EXTRACT_MAX_PAGES", "0"))
+    PDF_TEXT_MIN_CHARS_PER_PAGE: int = int(os.environ.get("PDF_TEXT_MIN_CHARS_PER_PAGE", "50"))
+    # Explicit Gemini context caching for long prompts reused across requests
+    ENABLE_CONTEXT_CACHE: bool = os.environ.get("ENABLE_CONTEXT_CACHE", "True").lower() == "true"
+    CONTEXT_CACHE_TTL_SECONDS: int = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+    CONTEXT_CACHE_MIN_CHARS: int = int(os.environ.get("CONTEXT_CACHE_MIN_CHARS", "4000"))
+    # Extracted files shorter than this are returned with no terms instead of being sent for analysis
+    MIN_ANALYSIS_CHARS: int = int(os.environ.get("MIN_ANALYSIS_CHARS", "200"))
+    # Files larger than this are rejected before extraction reads any of their content
+    MAX_EXTRACTION_FILE_BYTES: int = int(os.environ.get("MAX_EXTRACTION_FILE_BYTES", str(50 * 1024 * 1024)))
+    
+    # LLM Response Cache Configuration
+    # Identical (model, temperature, system prompt, payload) requests are served from this cache
+    ENABLE_LLM_CACHE: bool = os.environ.get("ENABLE_LLM_CACHE", "True").lower() == "true"
+    LLM_CACHE_PATH: str = os.environ.get("LLM_CACHE_PATH", os.path.join(".llm_cache", "responses.sqlite3"))
+    LLM_CACHE_TTL_SECONDS: int = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 86400)))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "10000"))
+    # Optional shared cache backend; requires the redis package
+    REDIS_URL: str = os.environ.get("REDIS_URL", "")
+    # Semantic cache: reuse a cached answer when a payload's embedding is close enough to a previous one
+    # Disabled by default - every lookup costs an embedding call and near-matches may differ in substance
+    ENABLE_SEMANTIC_CACHE: bool = os.environ.get("ENABLE_SEMANTIC_CACHE", "False").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+    EMBEDDING_MODEL_NAME: str = os.environ.get("EMBEDDING_MODEL_NAME", "text-embedding-004")
     
     MONGO_URI: str | None = os.environ.get("MONGO_URI")
+    # Connection pool per process; keep MONGO_MAX_POOL_SIZE x Gunicorn workers under the server's connection limit
+    MONGO_MAX_POOL_SIZE: int = int(os.environ.get("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE: int = int(os.environ.get("MONGO_MIN_POOL_SIZE", "5"))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+    # Idle pooled connections are closed after this long; requests give up waiting for a free one after MONGO_WAIT_QUEUE_TIMEOUT_MS
+    MONGO_MAX_IDLE_TIME_MS: int = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "60000"))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2500"))
+    # Wire compression in order of preference; zstd and snappy are skipped unless zstandard / python-snappy are installed
+    MONGO_COMPRESSORS: str = os.environ.get("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+    # Server-side storage compression for newly created collections; empty leaves the server default (snappy)
+    MONGO_BLOCK_COMPRESSOR: str = os.environ.get("MONGO_BLOCK_COMPRESSOR", "zstd")
+    # Preview and download endpoints reuse a session document read within this many seconds
+    SESSION_DOC_CACHE_TTL_SECONDS: int = int(os.environ.get("SESSION_DOC_CACHE_TTL_SECONDS", "30"))
+    # /api/stats/user serves counts computed within this many seconds
+    USER_STATS_CACHE_TTL_SECONDS: int = int(os.environ.get("USER_STATS_CACHE_TTL_SECONDS", "30"))
+    # /statistics serves counts computed within this many seconds
+    STATISTICS_CACHE_TTL_SECONDS: int = int(os.environ.get("STATISTICS_CACHE_TTL_SECONDS", "30"))
+    # Session documents keep only the latest interactions inline; the full log lives in the interactions collection
+    INTERACTIONS_INLINE_LIMIT: int = int(os.environ.get("INTERACTIONS_INLINE_LIMIT", "50"))
     
     CLOUDINARY_CLOUD_NAME: str | None = os.environ.get("CLOUDINARY_CLOUD_NAME")
     CLOUDINARY_API_KEY: str | None = os.environ.get("CLOUDINARY_API_KEY")
@@ -50,6 +118,12 @@ class DefaultConfig:
     CLOUDINARY_PDF_PREVIEWS_SUBFOLDER: str = "pdf_previews"
     
     LIBREOFFICE_PATH: str = os.environ.get("LIBREOFFICE_PATH", "")
+    # Render PDF previews in the background; preview requests return 202 until the PDF is ready
+    ASYNC_PDF_PREVIEW: bool = os.environ.get("ASYNC_PDF_PREVIEW", "False").lower() == "true"
+    # Upload marked contracts in the background; clients poll /marked_status/<session_id> after a 202
+    ASYNC_MARKED_CONTRACT: bool = os.environ.get("ASYNC_MARKED_CONTRACT", "False").lower() == "true"
+    # Run /analyze in the background and return 202; clients poll /analysis_status/<session_id>
+    ASYNC_ANALYSIS: bool = os.environ.get("ASYNC_ANALYSIS", "False").lower() == "true"
     
     TEMP_PROCESSING_FOLDER: str = os.environ.get(
         "TEMP_PROCESSING_FOLDER",
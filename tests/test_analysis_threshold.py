@@ -0,0 +1,54 @@
+"""
+Analysis Threshold Tests
+
+Tests that files with too little extracted text skip the analysis call.
+"""
+
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from app.services import ai_service
+
+
+class TestAnalysisThreshold(unittest.TestCase):
+    """Test the MIN_ANALYSIS_CHARS short-circuit in send_file_to_remote_api."""
+
+    def setUp(self):
+        """Push an app context with a known threshold."""
+        app = Flask(__name__)
+        app.config['MIN_ANALYSIS_CHARS'] = 50
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def test_is_below_analysis_threshold(self):
+        """Surrounding whitespace does not count towards the threshold."""
+        self.assertTrue(ai_service.is_below_analysis_threshold("  short text  " + " " * 100))
+        self.assertFalse(ai_service.is_below_analysis_threshold("x" * 50))
+
+    def test_short_file_skips_analysis(self):
+        """Short extracted text is returned with no terms and no analysis call."""
+        with mock.patch.object(ai_service, 'extract_text_from_file', return_value="short text"), \
+                mock.patch.object(ai_service, 'send_text_to_remote_api') as send_text:
+            analysis, extracted = ai_service.send_file_to_remote_api("contract.txt", session_id="s1")
+        self.assertEqual(analysis, "[]")
+        self.assertEqual(extracted, "short text")
+        send_text.assert_not_called()
+
+    def test_long_file_is_analyzed(self):
+        """Text at or above the threshold is sent for analysis."""
+        text = "x" * 60
+        with mock.patch.object(ai_service, 'extract_text_from_file', return_value=text), \
+                mock.patch.object(ai_service, 'send_text_to_remote_api', return_value="[]") as send_text:
+            analysis, extracted = ai_service.send_file_to_remote_api("contract.txt", session_id="s1")
+        self.assertEqual(analysis, "[]")
+        self.assertEqual(extracted, text)
+        send_text.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -88,7 +88,7 @@ class TestBasicEndpoints(unittest.TestCase):
     
     @patch('app.routes.interaction.get_contracts_collection')
     @patch('app.routes.interaction.get_terms_collection')
-    @patch('app.services.ai_service.get_chat_session')
+    @patch('app.routes.interaction.get_chat_session')
     def test_interact_endpoint_with_session(self, mock_ai, mock_terms_coll, mock_contracts_coll):
         """Test interact endpoint with valid session."""
         mock_contracts_coll.return_value = self.mock_contracts_collection
@@ -0,0 +1,35 @@
+"""
+LRU Cache Tests
+
+Tests for the bounded in-memory cache used for chat sessions.
+"""
+
+import unittest
+
+from app.utils.lru_cache import LRUTTLCache
+
+
+class TestLRUTTLCache(unittest.TestCase):
+    """Test size-bounded eviction and expiry."""
+
+    def test_evicts_least_recently_used(self):
+        """Reading an entry protects it from the next eviction."""
+        cache = LRUTTLCache(maxsize=2, ttl=60)
+        cache["a"] = 1
+        cache["b"] = 2
+        self.assertEqual(cache.get("a"), 1)
+        cache["c"] = 3
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_entries_expire(self):
+        """Entries older than the TTL are misses."""
+        cache = LRUTTLCache(maxsize=2, ttl=-1)
+        cache["a"] = 1
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
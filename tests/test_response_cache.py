@@ -0,0 +1,100 @@
+"""
+Response Cache Tests
+
+Tests for the SQLite-backed LLM response cache.
+"""
+
+import os
+import tempfile
+import unittest
+
+from app.services.response_cache import ResponseCache, SemanticCache
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test response cache storage, expiry and eviction."""
+
+    def setUp(self):
+        """Create a cache in a throwaway directory."""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.temp_dir.name, "cache.sqlite3"), max_entries=2)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_set_and_get(self):
+        """Stored values are returned for the same key."""
+        key = ResponseCache.build_key("model", 0, "prompt", "payload")
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, '[{"term_id": "clause_1"}]')
+        self.assertEqual(self.cache.get(key), '[{"term_id": "clause_1"}]')
+        self.assertIn(key, self.cache)
+
+    def test_build_key_is_unambiguous(self):
+        """Keys differ when the boundary between parts moves."""
+        self.assertNotEqual(ResponseCache.build_key("ab", "c"), ResponseCache.build_key("a", "bc"))
+        self.assertEqual(ResponseCache.build_key("a", b"b"), ResponseCache.build_key("a", "b"))
+
+    def test_delete(self):
+        """Deleted entries are misses and deleting a missing key is harmless."""
+        self.cache.set("key", "not json")
+        self.cache.delete("key")
+        self.assertIsNone(self.cache.get("key"))
+        self.cache.delete("missing")
+
+    def test_expired_entries_are_ignored(self):
+        """Entries past their TTL are treated as misses."""
+        self.cache.set("key", "value", ttl=-1)
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_evicts_least_recently_used(self):
+        """The cache keeps at most max_entries, dropping the least recently used."""
+        self.cache.set("a", "1")
+        self.cache.set("b", "2")
+        self.cache.get("a")
+        self.cache.set("c", "3")
+        self.assertEqual(self.cache.get("a"), "1")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("c"), "3")
+
+
+class TestSemanticCache(unittest.TestCase):
+    """Test near-duplicate lookups by embedding similarity."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.responses = ResponseCache(os.path.join(self.temp_dir.name, "cache.sqlite3"))
+        self.cache = SemanticCache(self.responses, threshold=0.92)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_lookup_matches_within_scope_only(self):
+        """Close vectors hit in the same scope; other scopes and distant vectors miss."""
+        self.responses.set("key", "cached answer")
+        self.cache.add("scope", "key", [1.0, 0.0, 0.1])
+
+        match = self.cache.lookup("scope", [1.0, 0.0, 0.12])
+        self.assertIsNotNone(match)
+        self.assertEqual(match[0], "cached answer")
+        self.assertIsNone(self.cache.lookup("other-scope", [1.0, 0.0, 0.12]))
+        self.assertIsNone(self.cache.lookup("scope", [0.0, 1.0, 0.0]))
+
+    def test_removed_key_no_longer_matches(self):
+        """A removed embedding is dropped from memory and from disk."""
+        self.responses.set("key", "cached answer")
+        self.cache.add("scope", "key", [1.0, 0.0])
+        self.cache.remove("key")
+        self.assertIsNone(self.cache.lookup("scope", [1.0, 0.0]))
+        self.assertIsNone(SemanticCache(self.responses, threshold=0.92).lookup("scope", [1.0, 0.0]))
+
+    def test_index_is_reloaded_from_disk(self):
+        """A fresh instance sees embeddings stored by another worker."""
+        self.responses.set("key", "cached answer")
+        self.cache.add("scope", "key", [0.5, 0.5])
+        reloaded = SemanticCache(self.responses, threshold=0.92)
+        self.assertEqual(reloaded.lookup("scope", [0.5, 0.5])[0], "cached answer")
+
+
+if __name__ == '__main__':
+    unittest.main()